@@ -0,0 +1,229 @@
+"""
+Stand-in for the OS tools uniproxy runs, used by the benchmarks: `fake_tool.py <tool> <args...>`. Every call is
+appended to the log file $UNIPROXY_BENCH_LOG, the emulated settings are kept in the JSON file $UNIPROXY_BENCH_STATE so
+that reads see earlier writes.
+"""
+import fcntl
+import json
+import os
+import shlex
+import sys
+import time
+from contextlib import contextmanager
+
+GNOME_DEFAULTS = {
+    "org.gnome.system.proxy mode": "'none'",
+    "org.gnome.system.proxy ignore-hosts": "['localhost', '127.0.0.0/8', '::1']",
+    "org.gnome.system.proxy autoconfig-url": "''",
+    "org.gnome.system.proxy.http host": "''",
+    "org.gnome.system.proxy.http port": "8080",
+    "org.gnome.system.proxy.https host": "''",
+    "org.gnome.system.proxy.https port": "0",
+    "org.gnome.system.proxy.ftp host": "''",
+    "org.gnome.system.proxy.ftp port": "0",
+}
+
+# name: (service ID, device, enabled)
+MAC_SERVICES = {
+    "Wi-Fi": ("AAA", "en0", True),
+    "Thunderbolt Bridge": ("BBB", "bridge0", True),
+    "USB LAN": ("CCC", "en5", False),
+}
+MAC_DEFAULT_SERVICE = "Wi-Fi"
+
+
+@contextmanager
+def state():
+    with open(os.environ["UNIPROXY_BENCH_STATE"], "a+") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        file.seek(0)
+        data = json.loads(file.read() or "{}")
+        yield data
+        file.seek(0)
+        file.truncate()
+        file.write(json.dumps(data))
+
+
+def gsettings(args, data):
+    values = data.setdefault("gsettings", dict(GNOME_DEFAULTS))
+    if args[0] == "get":
+        print(values.get(f"{args[1]} {args[2]}", "''"))
+    elif args[0] == "set":
+        values[f"{args[1]} {args[2]}"] = args[3]
+    elif args[0] == "reset":
+        values[f"{args[1]} {args[2]}"] = GNOME_DEFAULTS[f"{args[1]} {args[2]}"]
+    elif args[0] == "list-recursively":
+        for key, value in values.items():
+            if key.startswith(args[1]):
+                print(f"{key} {value}")
+
+
+def dconf(args, data):
+    values = data.setdefault("gsettings", dict(GNOME_DEFAULTS))
+    if args[0] == "reset":
+        group, key = args[1][len("/system/proxy/"):].rpartition("/")[::2]
+        schema = "org.gnome.system.proxy" + (f".{group.replace('/', '.')}" if group else "")
+        values[f"{schema} {key}"] = GNOME_DEFAULTS[f"{schema} {key}"]
+        return
+    if args[0] != "load":
+        return
+    schema = None
+    for line in sys.stdin.read().splitlines():
+        if line.startswith("["):
+            group = line.strip("[]/").replace("/", ".")
+            schema = "org.gnome.system.proxy" + (f".{group}" if group else "")
+        elif "=" in line:
+            key, value = line.split("=", 1)
+            values[f"{schema} {key}"] = value
+
+
+def kconfig(tool, args, data):
+    values = data.setdefault("kioslaverc", {})
+    key = args[args.index("--key") + 1]
+    if tool.startswith("kwriteconfig"):
+        values[key] = args[args.index("--key") + 2]
+    else:
+        print(values.get(key, ""))
+
+
+def route(args, data):
+    print("   route to: default")
+    print(f"interface: {MAC_SERVICES[MAC_DEFAULT_SERVICE][1]}")
+
+
+def mac_services(data):
+    return data.setdefault("networksetup", {
+        name: {"web": ["", 0, False], "secure": ["", 0, False], "bypass": ["*.local", "169.254/16"]}
+        for name in MAC_SERVICES
+    })
+
+
+def networksetup(args, data):
+    services = mac_services(data)
+    command = args[0]
+    if command == "-listallnetworkservices":
+        print("An asterisk (*) denotes that a network service is disabled.")
+        for name, (_, _, enabled) in MAC_SERVICES.items():
+            print(name if enabled else f"*{name}")
+        return
+    if command == "-listallhardwareports":
+        for name, (_, device, _) in MAC_SERVICES.items():
+            print(f"\nHardware Port: {name}\nDevice: {device}\nEthernet Address: 00:00:00:00:00:00")
+        print("\nVLAN Configurations\n===================")
+        return
+
+    service = services.get(args[1])
+    if service is None:
+        print(f"{args[1]} is not a recognized network service.")
+        sys.exit(4)
+    proxy = "secure" if "secure" in command else "web"
+    if command in ("-getwebproxy", "-getsecurewebproxy"):
+        server, port, enabled = service[proxy]
+        print(f"Enabled: {'Yes' if enabled else 'No'}\nServer: {server}\nPort: {port}\nAuthenticated Proxy Enabled: 0")
+    elif command in ("-setwebproxy", "-setsecurewebproxy"):
+        service[proxy] = [args[2], int(args[3] or 0), True]
+    elif command in ("-setwebproxystate", "-setsecurewebproxystate"):
+        service[proxy][2] = args[2] == "on"
+    elif command == "-getproxybypassdomains":
+        if service["bypass"]:
+            print("\n".join(service["bypass"]))
+        else:
+            print(f"There aren't any bypass domains set on {args[1]}.")
+    elif command == "-setproxybypassdomains":
+        service["bypass"] = [] if args[2:] == ["Empty"] else args[2:]
+
+
+def scutil_proxies(service):
+    proxies = {"ExceptionsList": list(service["bypass"]), "FTPPassive": 1}
+    for prefix, proxy in (("HTTP", "web"), ("HTTPS", "secure")):
+        server, port, enabled = service[proxy]
+        proxies[f"{prefix}Enable"] = int(enabled)
+        if server:
+            proxies[f"{prefix}Proxy"] = server
+            proxies[f"{prefix}Port"] = port
+    return proxies
+
+
+def print_scutil_dict(values):
+    print("<dictionary> {")
+    for key, value in sorted(values.items()):
+        if isinstance(value, list):
+            print(f"  {key} : <array> {{")
+            for index, item in enumerate(value):
+                print(f"    {index} : {item}")
+            print("  }")
+        else:
+            print(f"  {key} : {value}")
+    print("}")
+
+
+def scutil(args, data):
+    services = mac_services(data)
+    if args[:1] == ["--proxy"]:
+        print_scutil_dict(scutil_proxies(services[MAC_DEFAULT_SERVICE]))
+        return
+
+    names_by_id = {service_id: name for name, (service_id, _, _) in MAC_SERVICES.items()}
+    current = None
+    for line in sys.stdin.read().splitlines():
+        words = shlex.split(line)
+        if not words:
+            continue
+        if words[0] == "list":
+            for index, service_id in enumerate(names_by_id):
+                print(f"  subKey [{index}] = Setup:/Network/Service/{service_id}")
+        elif words[0] == "show":
+            service_id = words[1].rsplit("/", 1)[1]
+            if service_id in names_by_id:
+                print_scutil_dict({"UserDefinedName": names_by_id[service_id]})
+            else:
+                print("  No such key")
+        elif words[0] == "d.init":
+            current = {}
+        elif words[0] == "d.show":
+            print_scutil_dict(current)
+        elif words[0] == "get":
+            current = scutil_proxies(services[names_by_id[words[1].split("/")[2]]])
+        elif words[0] == "d.add":
+            if words[2:3] == ["#"]:
+                current[words[1]] = int(words[3])
+            elif words[2:3] == ["*"]:
+                current[words[1]] = words[3:]
+            else:
+                current[words[1]] = words[2]
+        elif words[0] == "d.remove":
+            current.pop(words[1], None)
+        elif words[0] == "set":
+            service = services[names_by_id[words[1].split("/")[2]]]
+            service["bypass"] = current.get("ExceptionsList", [])
+            for prefix, proxy in (("HTTP", "web"), ("HTTPS", "secure")):
+                service[proxy] = [current.get(f"{prefix}Proxy", ""), int(current.get(f"{prefix}Port", 0)),
+                                  bool(current.get(f"{prefix}Enable", 0))]
+
+
+TOOLS = {
+    "gsettings": gsettings,
+    "dconf": dconf,
+    "route": route,
+    "networksetup": networksetup,
+    "scutil": scutil,
+}
+
+
+def main():
+    tool, args = sys.argv[1], sys.argv[2:]
+    with open(os.environ["UNIPROXY_BENCH_LOG"], "a") as log:
+        log.write(json.dumps([tool] + args) + "\n")
+    if tool == "dconf" and args[:1] == ["watch"]:
+        time.sleep(3600)
+        return
+    with state() as data:
+        if tool in TOOLS:
+            TOOLS[tool](args, data)
+        elif tool.startswith(("kreadconfig", "kwriteconfig")):
+            kconfig(tool, args, data)
+        # systemctl, dbus-send, setx and the shells only need to be recorded
+
+
+if __name__ == "__main__":
+    main()
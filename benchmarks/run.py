@@ -0,0 +1,290 @@
+"""
+Runs every public Uniproxy operation on each backend against recording stand-ins of the OS tools (see fake_tool.py)
+and, for Windows, an in-memory winreg (see winstub/), so all backends can be measured on a plain Linux box. Reports
+the wall time, process spawns, file writes, bytes written and registry writes of each operation and compares them to
+budgets.json, exiting with status 1 if any budget is exceeded.
+
+    python benchmarks/run.py                     # all backends
+    python benchmarks/run.py --backend macos     # one backend
+    python benchmarks/run.py --update-budgets    # accept the current numbers
+"""
+import argparse
+import json
+import math
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+BUDGETS_PATH = os.path.join(BENCHMARK_DIR, "budgets.json")
+
+BACKENDS = {
+    "linux-gnome": {"system": "Linux", "env": {"XDG_CURRENT_DESKTOP": "GNOME"}},
+    "linux-kde": {"system": "Linux", "env": {"XDG_CURRENT_DESKTOP": "KDE", "KDE_SESSION_VERSION": "5"}},
+    "macos": {"system": "Darwin", "env": {}},
+    "windows": {"system": "Windows", "env": {}},
+}
+
+TOOLS = ["gsettings", "dconf", "kreadconfig5", "kwriteconfig5", "kreadconfig6", "kwriteconfig6", "systemctl",
+         "dbus-send", "networksetup", "route", "scutil", "setx", "bash", "zsh", "fish"]
+
+COUNTERS = ["spawns", "file_writes", "bytes_written", "registry_writes"]
+
+# wall time depends on the machine, so its budgets leave room for slower CI runners
+WALL_HEADROOM = 5
+WALL_SLACK_MS = 100
+
+
+def operations(uniproxy, prox):
+    """
+    The measured operations in the order they run, as (name, function) pairs. Each starts from the state the previous
+    ones left behind.
+    """
+    domains = ["example.com", "internal.example"]
+    config = uniproxy.ProxyConfig(prox.ip_address, prox.port, True, domains)
+    moved = uniproxy.ProxyConfig("127.0.0.2", prox.port, True, domains)
+    snapshots = []
+    return [
+        ("set_proxy", prox.set_proxy),
+        ("set_proxy_enabled(True)", lambda: prox.set_proxy_enabled(True)),
+        ("join (unchanged)", prox.join),
+        ("get_proxy", prox.get_proxy),
+        ("get_proxy (cached)", prox.get_proxy),
+        ("get_proxy_enabled", prox.get_proxy_enabled),
+        ("set_bypass_domains", lambda: prox.set_bypass_domains(domains)),
+        ("get_bypass_domains", prox.get_bypass_domains),
+        ("apply (unchanged)", lambda: prox.apply(config)),
+        ("apply (new endpoint)", lambda: prox.apply(moved)),
+        ("snapshot", lambda: snapshots.append(prox.snapshot())),
+        ("set_proxy_enabled(False)", lambda: prox.set_proxy_enabled(False)),
+        ("restore", lambda: prox.restore(snapshots[-1])),
+        ("delete_proxy", prox.delete_proxy),
+    ]
+
+
+def scan(root):
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            stat = os.lstat(path)
+            files[path] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def count_lines(path):
+    try:
+        with open(path) as file:
+            return sum(1 for _ in file)
+    except FileNotFoundError:
+        return 0
+
+
+def run_child(backend, output):
+    """
+    Runs the operations in this process, which the parent started inside a sandbox, pretending to be the platform
+    of `backend`.
+    """
+    import platform
+    system = BACKENDS[backend]["system"]
+    platform.system = lambda: system
+    # the command line tools are measured, not an in-process PyGObject
+    sys.modules["gi"] = None
+    winreg = None
+    if system == "Windows":
+        import ctypes
+        sys.path.insert(0, os.path.join(BENCHMARK_DIR, "winstub"))
+        import winreg
+        ctypes.windll = _WinDLL()
+
+    sys.path.insert(0, REPO_DIR)
+    import uniproxy
+
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen()
+    # reads are only cached when the caller opts in, the budgets include the "get_proxy (cached)" operation
+    prox = uniproxy.Uniproxy("127.0.0.1", listener.getsockname()[1], backend_options={"state_ttl": 1.0})
+
+    log = os.environ["UNIPROXY_BENCH_LOG"]
+    home = os.environ["HOME"]
+    results = {}
+    for name, function in operations(uniproxy, prox):
+        files = scan(home)
+        spawns = count_lines(log)
+        registry_writes = winreg.writes if winreg else 0
+        registry_bytes = winreg.bytes_written if winreg else 0
+
+        started = time.perf_counter()
+        function()
+        wall_ms = (time.perf_counter() - started) * 1000
+
+        after = scan(home)
+        changed = [path for path, stat in after.items() if files.get(path) != stat]
+        deleted = [path for path in files if path not in after]
+        results[name] = {
+            "wall_ms": round(wall_ms, 2),
+            "spawns": count_lines(log) - spawns,
+            "file_writes": len(changed) + len(deleted),
+            "bytes_written": sum(after[path][2] for path in changed) +
+                             ((winreg.bytes_written - registry_bytes) if winreg else 0),
+            "registry_writes": (winreg.writes - registry_writes) if winreg else 0,
+        }
+    listener.close()
+
+    with open(output, "w") as file:
+        json.dump(results, file)
+
+
+class _WinDLL:
+    """
+    Stand-in for ctypes.windll whose functions do nothing and report success.
+    """
+
+    def __getattr__(self, name):
+        return _Library()
+
+
+class _Library:
+    def __getattr__(self, name):
+        return lambda *args: 1
+
+
+def sandbox_env(sandbox, backend):
+    """
+    Creates the home directory and the fake tools inside `sandbox` and returns the environment of the child process.
+    Only the fake tools are on PATH, so a command without a stand-in fails instead of touching the machine.
+    """
+    home = os.path.join(sandbox, "home")
+    bin_dir = os.path.join(sandbox, "bin")
+    os.makedirs(home)
+    os.makedirs(bin_dir)
+    fake_tool = os.path.join(BENCHMARK_DIR, "fake_tool.py")
+    for tool in TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, "w") as file:
+            file.write(f'#!/bin/sh\nexec {shlex.quote(sys.executable)} {shlex.quote(fake_tool)} {tool} "$@"\n')
+        os.chmod(path, 0o755)
+
+    env = {
+        "HOME": home,
+        "PATH": bin_dir,
+        "XDG_CONFIG_HOME": os.path.join(home, ".config"),
+        "XDG_STATE_HOME": os.path.join(home, ".local", "state"),
+        "XDG_DATA_HOME": os.path.join(home, ".local", "share"),
+        "XDG_CACHE_HOME": os.path.join(home, ".cache"),
+        "UNIPROXY_BENCH_LOG": os.path.join(sandbox, "spawns.log"),
+        "UNIPROXY_BENCH_STATE": os.path.join(sandbox, "state.json"),
+        "PYTHONDONTWRITEBYTECODE": "1",
+    }
+    env.update(BACKENDS[backend]["env"])
+    return env
+
+
+def run_backend(backend, rounds):
+    """
+    Runs the operations of `backend` `rounds` times, each in a fresh sandbox, and returns their numbers with the
+    fastest wall time of each operation.
+    """
+    results = None
+    for _ in range(rounds):
+        with tempfile.TemporaryDirectory(prefix="uniproxy-bench-") as sandbox:
+            output = os.path.join(sandbox, "results.json")
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", backend, output],
+                                     env=sandbox_env(sandbox, backend), capture_output=True, text=True)
+            if process.returncode != 0:
+                raise RuntimeError(f"The {backend} benchmark failed:\n{process.stderr}")
+            with open(output) as file:
+                round_results = json.load(file)
+        if results is None:
+            results = round_results
+        else:
+            for name, numbers in round_results.items():
+                results[name]["wall_ms"] = min(results[name]["wall_ms"], numbers["wall_ms"])
+    return results
+
+
+def check(results, budgets):
+    """
+    Returns a message for every number of `results` which exceeds its budget or has none.
+    """
+    failures = []
+    for backend, operations in results.items():
+        for name, numbers in operations.items():
+            budget = budgets.get(backend, {}).get(name)
+            if budget is None:
+                failures.append(f"{backend} {name}: no budget")
+                continue
+            for counter in ["wall_ms"] + COUNTERS:
+                if numbers[counter] > budget[counter]:
+                    failures.append(f"{backend} {name}: {counter} {numbers[counter]} > {budget[counter]}")
+    return failures
+
+
+def budgets_from(results):
+    budgets = {}
+    for backend, operations in results.items():
+        budgets[backend] = {}
+        for name, numbers in operations.items():
+            budget = {counter: numbers[counter] for counter in COUNTERS}
+            budget["wall_ms"] = math.ceil(numbers["wall_ms"] * WALL_HEADROOM + WALL_SLACK_MS)
+            budgets[backend][name] = budget
+    return budgets
+
+
+def print_table(results, budgets):
+    header = f"{'operation':<26}{'wall ms':>9}{'spawns':>8}{'files':>7}{'bytes':>8}{'registry':>10}"
+    for backend, operations in results.items():
+        print(f"\n{backend}\n{header}")
+        for name, numbers in operations.items():
+            budget = budgets.get(backend, {}).get(name)
+            over = budget is None or any(numbers[counter] > budget[counter] for counter in ["wall_ms"] + COUNTERS)
+            print(f"{name:<26}{numbers['wall_ms']:>9.1f}{numbers['spawns']:>8}{numbers['file_writes']:>7}"
+                  f"{numbers['bytes_written']:>8}{numbers['registry_writes']:>10}{'  OVER BUDGET' if over else ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the Uniproxy operations of every backend.")
+    parser.add_argument("--backend", action="append", choices=sorted(BACKENDS),
+                        help="backend to run, can be repeated (default: all)")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per backend, the fastest wall time is kept")
+    parser.add_argument("--update-budgets", action="store_true", help="write the measured numbers to budgets.json")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--child", nargs=2, metavar=("BACKEND", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(*args.child)
+        return 0
+
+    results = {backend: run_backend(backend, args.rounds) for backend in args.backend or BACKENDS}
+
+    budgets = {}
+    if os.path.exists(BUDGETS_PATH):
+        with open(BUDGETS_PATH) as file:
+            budgets = json.load(file)
+    if args.update_budgets:
+        budgets.update(budgets_from(results))
+        with open(BUDGETS_PATH, "w") as file:
+            json.dump(budgets, file, indent=2)
+            file.write("\n")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_table(results, budgets)
+
+    failures = check(results, budgets)
+    if failures:
+        print("\nBudgets exceeded:\n" + "\n".join(failures), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
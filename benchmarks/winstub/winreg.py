@@ -0,0 +1,78 @@
+"""
+In-memory stand-in for the winreg module, so the Windows backend can be benchmarked on other platforms. Counts the
+values written and the bytes they take in the registry.
+"""
+
+HKEY_CURRENT_USER = "HKEY_CURRENT_USER"
+KEY_QUERY_VALUE = 0x0001
+KEY_SET_VALUE = 0x0002
+KEY_READ = 0x20019
+KEY_WRITE = 0x20006
+KEY_ALL_ACCESS = 0xF003F
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+REG_DWORD = 4
+
+values = {
+    "Software\\Microsoft\\Windows\\CurrentVersion\\Internet Settings": {"ProxyEnable": (0, REG_DWORD)},
+    "Environment": {"Path": ("C:\\Windows\\system32", REG_EXPAND_SZ)},
+}
+writes = 0
+bytes_written = 0
+
+
+class HKEYType:
+    def __init__(self, path):
+        self.path = path
+        values.setdefault(path, {})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.Close()
+
+    def Close(self):
+        pass
+
+
+def OpenKey(key, sub_key, reserved=0, access=KEY_READ):
+    if sub_key not in values:
+        raise FileNotFoundError(2, "The system cannot find the file specified")
+    return HKEYType(sub_key)
+
+
+def CreateKeyEx(key, sub_key, reserved=0, access=KEY_WRITE):
+    return HKEYType(sub_key)
+
+
+def CloseKey(key):
+    key.Close()
+
+
+def _find(key, name):
+    for existing in values[key.path]:
+        if existing.lower() == name.lower():
+            return existing
+    raise FileNotFoundError(2, "The system cannot find the file specified")
+
+
+def QueryValueEx(key, name):
+    return values[key.path][_find(key, name)]
+
+
+def SetValueEx(key, name, reserved, type, value):
+    global writes, bytes_written
+    try:
+        del values[key.path][_find(key, name)]
+    except FileNotFoundError:
+        pass
+    values[key.path][name] = (value, type)
+    writes += 1
+    bytes_written += 4 if type == REG_DWORD else 2 * (len(str(value)) + 1)
+
+
+def DeleteValue(key, name):
+    global writes
+    del values[key.path][_find(key, name)]
+    writes += 1
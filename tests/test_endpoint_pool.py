@@ -0,0 +1,187 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import uniproxy
+from uniproxy import endpoint_pool
+from uniproxy.endpoint_pool import EndpointMonitor, EndpointPool, ProbeResult, probe_endpoints
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen()
+    yield ("127.0.0.1", sock.getsockname()[1])
+    sock.close()
+
+
+@pytest.fixture
+def closed_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return ("127.0.0.1", port)
+
+
+def scripted_probes(monkeypatch, *rounds):
+    """
+    Replaces probe_endpoints() by one returning the latencies of the next round, a dict mapping each endpoint to its
+    latency in seconds or None for a failed probe.
+    """
+    rounds = list(rounds)
+
+    def probe(endpoints, timeout=1.0):
+        latencies = rounds.pop(0)
+        return [ProbeResult(ip_address, port, latency=latencies[(ip_address, port)],
+                            error=None if latencies[(ip_address, port)] is not None else "refused")
+                for ip_address, port in endpoints]
+
+    monkeypatch.setattr(endpoint_pool, "probe_endpoints", probe)
+
+
+A = ("10.0.0.1", 3128)
+B = ("10.0.0.2", 3128)
+
+
+def test_probe_keeps_the_order_and_reports_errors(listener, closed_port):
+    results = probe_endpoints([closed_port, listener], timeout=1.0)
+
+    assert [result.endpoint for result in results] == [closed_port, listener]
+    assert not results[0].healthy and results[0].error
+    assert results[1].healthy and results[1].error is None
+
+
+def test_select_ranks_by_latency(monkeypatch):
+    scripted_probes(monkeypatch, {A: 0.2, B: 0.05})
+    pool = EndpointPool([A, B])
+
+    assert pool.select() == B
+    assert pool.switches == 0
+
+
+def test_select_prefers_healthy_endpoints(monkeypatch):
+    scripted_probes(monkeypatch, {A: None, B: 0.3})
+
+    assert EndpointPool([A, B]).select() == B
+
+
+def test_hysteresis_keeps_a_slightly_slower_active_endpoint(monkeypatch):
+    scripted_probes(monkeypatch, {A: 0.1, B: 0.2}, {A: 0.1, B: 0.08}, {A: 0.1, B: 0.05})
+    pool = EndpointPool([A, B], hysteresis=0.3, smoothing=1.0)
+
+    assert pool.select() == A
+    assert pool.select() == A
+    assert pool.select() == B
+    assert pool.switches == 1
+
+
+def test_switches_after_max_failures(monkeypatch):
+    scripted_probes(monkeypatch, {A: 0.1, B: 0.2}, {A: None, B: 0.2}, {A: None, B: 0.2})
+    pool = EndpointPool([A, B], max_failures=2)
+
+    assert pool.select() == A
+    assert pool.select() == A
+    assert not pool.reachable()
+    assert pool.select() == B
+    assert pool.reachable()
+
+
+def test_reachable(listener, closed_port):
+    reachable = EndpointPool([listener], timeout=1.0)
+    reachable.select()
+    unreachable = EndpointPool([closed_port], timeout=1.0)
+    unreachable.select()
+
+    assert reachable.reachable()
+    assert not unreachable.reachable()
+    assert unreachable.metrics()["endpoints"][f"{closed_port[0]}:{closed_port[1]}"]["failures"] == 1
+
+
+def test_unresolvable_host_name(listener):
+    results = probe_endpoints([("host.invalid", 3128), listener], timeout=1.0)
+
+    assert not results[0].healthy and results[0].error
+    assert results[1].healthy
+
+
+def test_name_resolution_is_bounded_by_the_timeout(monkeypatch, listener):
+    getaddrinfo = socket.getaddrinfo
+
+    def slow_getaddrinfo(host, port, *args, flags=0, **kwargs):
+        if host == "slow.example" and not flags & socket.AI_NUMERICHOST:
+            time.sleep(2)
+        return getaddrinfo(host, port, *args, flags=flags, **kwargs)
+
+    monkeypatch.setattr(socket, "getaddrinfo", slow_getaddrinfo)
+    started = time.monotonic()
+
+    results = probe_endpoints([("slow.example", 3128), listener], timeout=0.2)
+
+    assert time.monotonic() - started < 1.5
+    assert results[0].error == "name resolution timed out after 0.2s"
+    assert results[1].healthy
+
+
+def test_single_endpoint_is_not_probed(monkeypatch):
+    def probe(endpoints, timeout=1.0):
+        raise AssertionError("a single endpoint must not be probed")
+
+    monkeypatch.setattr(endpoint_pool, "probe_endpoints", probe)
+    monkeypatch.setattr(uniproxy.Uniproxy, "_Uniproxy__get_proxy_instance", lambda self: None)
+
+    prox = uniproxy.Uniproxy("10.0.0.1", 3128)
+
+    assert (prox.ip_address, prox.port) == ("10.0.0.1", 3128)
+    assert prox.endpoint_pool.active == ("10.0.0.1", 3128)
+
+
+@pytest.mark.parametrize("endpoints", [[("10.0.0.1", None)], [("10.0.0.1", "http")], [("10.0.0.1", 0)], [(None, 80)],
+                                       []])
+def test_invalid_endpoints(endpoints):
+    with pytest.raises(ValueError):
+        EndpointPool(endpoints)
+
+
+@pytest.mark.parametrize("ip, port", [("10.0.0.1", None), (None, 8080), (None, None)])
+def test_uniproxy_requires_ip_and_port(ip, port):
+    with pytest.raises(ValueError):
+        uniproxy.Uniproxy(ip, port)
+
+
+class FlakyPool:
+    """
+    Pool whose first probe raises and which switches to B on the second.
+    """
+
+    def __init__(self):
+        self.active = A
+        self.probes = 0
+
+    def select(self):
+        self.probes += 1
+        if self.probes == 1:
+            raise OSError("network is unreachable")
+        self.active = B
+        return self.active
+
+
+def test_monitor_survives_errors_and_retries_failed_switches():
+    switched = threading.Event()
+    errors = []
+    calls = []
+
+    def on_switch(endpoint):
+        calls.append(endpoint)
+        if len(calls) == 1:
+            raise RuntimeError("set_proxy failed")
+        switched.set()
+
+    with EndpointMonitor(FlakyPool(), on_switch, interval=0.01, on_error=errors.append):
+        assert switched.wait(5)
+
+    assert [str(error) for error in errors] == ["network is unreachable", "set_proxy failed"]
+    assert calls == [B, B]
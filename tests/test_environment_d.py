@@ -0,0 +1,17 @@
+import os
+
+from uniproxy.environment_d import EnvironmentDWriter
+
+
+def test_sync_writes_only_changed_files(tmp_path):
+    writer = EnvironmentDWriter(str(tmp_path / "environment.d"))
+    content = writer.render([("http_proxy", "http://10.0.0.1:8080/")])
+
+    assert writer.sync({"01-proxy.conf": content})
+    inode = os.stat(writer.path("01-proxy.conf")).st_ino
+    assert not writer.sync({"01-proxy.conf": content})
+    assert os.stat(writer.path("01-proxy.conf")).st_ino == inode
+
+    assert writer.sync({"01-proxy.conf": None})
+    assert writer.read("01-proxy.conf") is None
+    assert not writer.sync({"01-proxy.conf": None})
@@ -0,0 +1,43 @@
+import subprocess
+
+from uniproxy.gnome_settings import PROXY_SCHEMA, DconfBackend, GnomeChangeset
+
+
+class Recorder:
+    def __init__(self):
+        self.commands = []
+
+    def __call__(self, cmd, **kwargs):
+        self.commands.append((list(cmd), kwargs.get("input")))
+        return subprocess.CompletedProcess(cmd, 0, stdout="", stderr="")
+
+
+def test_dconf_loads_values_and_resets_keys():
+    recorder = Recorder()
+    changeset = GnomeChangeset().set(PROXY_SCHEMA, "mode", "none")
+    changeset.reset(f"{PROXY_SCHEMA}.http", "host").reset(PROXY_SCHEMA, "ignore-hosts")
+
+    DconfBackend("dconf", "gsettings", recorder).apply(changeset)
+
+    assert sorted(recorder.commands) == [
+        (["dconf", "load", "/system/proxy/"], "[/]\nmode='none'\n"),
+        (["dconf", "reset", "/system/proxy/http/host"], None),
+        (["dconf", "reset", "/system/proxy/ignore-hosts"], None),
+    ]
+
+
+def test_dconf_reset_only_changeset_loads_nothing():
+    recorder = Recorder()
+    changeset = GnomeChangeset().reset(f"{PROXY_SCHEMA}.https", "port")
+
+    DconfBackend("dconf", "gsettings", recorder).apply(changeset)
+
+    assert recorder.commands == [(["dconf", "reset", "/system/proxy/https/port"], None)]
+
+
+def test_keyfile_groups_values_by_schema():
+    changeset = GnomeChangeset().set(f"{PROXY_SCHEMA}.http", "host", "10.0.0.1")
+    changeset.set(f"{PROXY_SCHEMA}.http", "port", 8080).set(PROXY_SCHEMA, "ignore-hosts", [])
+
+    assert DconfBackend("dconf", "gsettings").keyfile(changeset) == \
+        "[http]\nhost='10.0.0.1'\nport=8080\n\n[/]\nignore-hosts=@as []\n"
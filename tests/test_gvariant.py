@@ -0,0 +1,78 @@
+import subprocess
+
+import pytest
+
+from uniproxy.gnome_settings import PROXY_SCHEMA, GsettingsBackend
+from uniproxy.gvariant import format_gvariant, parse_gvariant
+
+
+@pytest.mark.parametrize("text, value", [
+    ("@as []", []),
+    ("['a', \"b'c\"]", ["a", "b'c"]),
+    ("uint32 8080", 8080),
+    ("8080", 8080),
+    ("true", True),
+    ("false", False),
+    ("nothing", None),
+    ("('a', 1)", ("a", 1)),
+    ("(1,)", (1,)),
+    ("[('a', @as []), ('b', ['c'])]", [("a", []), ("b", ["c"])]),
+])
+def test_parse(text, value):
+    assert parse_gvariant(text) == value
+
+
+@pytest.mark.parametrize("text, value", [
+    (r"'tab\there'", "tab\there"),
+    (r"'line\nbreak'", "line\nbreak"),
+    (r"'back\\slash'", "back\\slash"),
+    (r"'it\'s'", "it's"),
+    (r"'ét\U0001F600'", "ét\U0001F600"),
+])
+def test_parse_escapes(text, value):
+    assert parse_gvariant(text) == value
+
+
+@pytest.mark.parametrize("text", ["", "'unterminated", "[1 2]", "'a' trailing", "{'a': 1}"])
+def test_parse_rejects_invalid_text(text):
+    with pytest.raises(ValueError):
+        parse_gvariant(text)
+
+
+@pytest.mark.parametrize("value", [[], ["localhost", "127.0.0.0/8", "::1"], ["it's", "back\\slash", "line\nbreak"],
+                                   "manual", "", 0, 3128, True, False])
+def test_round_trip(value):
+    assert parse_gvariant(format_gvariant(value)) == value
+
+
+def test_list_recursively_feeds_get_many():
+    output = "\n".join([
+        f"{PROXY_SCHEMA} mode 'manual'",
+        f"{PROXY_SCHEMA} ignore-hosts ['localhost', '127.0.0.0/8', '::1']",
+        f"{PROXY_SCHEMA} autoconfig-url ''",
+        f"{PROXY_SCHEMA}.http host '10.0.0.1'",
+        f"{PROXY_SCHEMA}.http port 8080",
+        f"{PROXY_SCHEMA}.https host ''",
+        f"{PROXY_SCHEMA}.https port 0",
+        f"{PROXY_SCHEMA}.socks port uint32 1080",
+    ]) + "\n"
+    commands = []
+
+    def run_command(cmd, **kwargs):
+        commands.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0, stdout=output, stderr="")
+
+    backend = GsettingsBackend("gsettings", run_command)
+    values = backend.get_many([(PROXY_SCHEMA, "mode"), (PROXY_SCHEMA, "ignore-hosts"),
+                               (f"{PROXY_SCHEMA}.http", "host"), (f"{PROXY_SCHEMA}.http", "port"),
+                               (f"{PROXY_SCHEMA}.https", "host"), (f"{PROXY_SCHEMA}.socks", "port")])
+
+    assert values == {
+        (PROXY_SCHEMA, "mode"): "manual",
+        (PROXY_SCHEMA, "ignore-hosts"): ["localhost", "127.0.0.0/8", "::1"],
+        (f"{PROXY_SCHEMA}.http", "host"): "10.0.0.1",
+        (f"{PROXY_SCHEMA}.http", "port"): 8080,
+        (f"{PROXY_SCHEMA}.https", "host"): "",
+        (f"{PROXY_SCHEMA}.socks", "port"): 1080,
+    }
+    assert commands == [["gsettings", "list-recursively", PROXY_SCHEMA]]
@@ -0,0 +1,130 @@
+import os
+import socket
+import time
+
+import pytest
+
+from uniproxy.kde_config import KdeConfig, escape_value, kconfig_lock, unescape_value
+
+KIOSLAVERC = """[$Version]
+update_info=kioslave.upd:remove-cache-settings
+
+[Cache Settings]
+CacheSize=5120
+
+[Proxy Settings]
+AuthMode=0
+NoProxyFor[$e]=$NO_PROXY
+ProxyType=0
+httpProxy=
+httpsProxy=
+
+[UserAgent]
+UserAgentKeys=o,l,m
+"""
+
+
+@pytest.fixture
+def config(tmp_path):
+    path = tmp_path / "kioslaverc"
+    path.write_text(KIOSLAVERC, encoding="utf-8")
+    return KdeConfig(path=str(path))
+
+
+@pytest.mark.parametrize("stored, value", [
+    (r"\sleading and trailing\s", " leading and trailing "),
+    (r"first\nsecond", "first\nsecond"),
+    (r"tab\there", "tab\there"),
+    (r"bell\x07", "bell\x07"),
+    (r"back\\slash", "back\\slash"),
+    ("inner space", "inner space"),
+])
+def test_escaping(stored, value):
+    assert unescape_value(stored) == value
+    assert escape_value(value) == stored
+
+
+def test_unescape_keeps_unknown_escapes():
+    assert unescape_value(r"\q\xZZ") == r"\q\xZZ"
+
+
+def test_write_keeps_other_lines(config):
+    assert config.write("Proxy Settings", {"ProxyType": "1", "httpProxy": "http://10.0.0.1 8080"})
+
+    with open(config.path, encoding="utf-8") as f:
+        content = f.read()
+    assert content == KIOSLAVERC.replace("ProxyType=0", "ProxyType=1").replace(
+        "httpProxy=\n", "httpProxy=http://10.0.0.1 8080\n")
+
+
+def test_write_appends_new_keys_to_the_group(config):
+    config.write("Proxy Settings", {"ftpProxy": "ftp://10.0.0.1 8080"})
+
+    with open(config.path, encoding="utf-8") as f:
+        content = f.read()
+    assert "httpsProxy=\nftpProxy=ftp://10.0.0.1 8080\n\n[UserAgent]" in content
+    assert config.read("Proxy Settings", ["ftpProxy", "NoProxyFor"]) == {"ftpProxy": "ftp://10.0.0.1 8080",
+                                                                          "NoProxyFor": ""}
+
+
+def test_write_creates_the_group(tmp_path):
+    config = KdeConfig(path=str(tmp_path / "kioslaverc"))
+
+    assert config.write("Proxy Settings", {"ProxyType": "1"})
+    assert not config.write("Proxy Settings", {"ProxyType": "1"})
+    assert config.read("Proxy Settings", ["ProxyType"]) == {"ProxyType": "1"}
+
+
+def test_write_drops_duplicate_keys(config):
+    with open(config.path, "a", encoding="utf-8") as f:
+        f.write("[Proxy Settings]\nProxyType=1\n")
+    with open(config.path, encoding="utf-8") as f:
+        content = f.read().replace("httpsProxy=\n", "httpsProxy=\nProxyType=1\n", 1)
+    with open(config.path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+    config.write("Proxy Settings", {"ProxyType": "0"})
+
+    with open(config.path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines.count("ProxyType=0") == 1
+    assert "ProxyType=1" not in lines
+    assert config.read("Proxy Settings", ["ProxyType"]) == {"ProxyType": "0"}
+
+
+def test_write_keeps_non_ascii_values(config):
+    config.write("Proxy Settings", {"NoProxyFor": "bücher.example,straße.example"})
+
+    assert config.read("Proxy Settings", ["NoProxyFor"]) == {"NoProxyFor": "bücher.example,straße.example"}
+
+
+def test_write_removes_the_lock_file(config):
+    config.write("Proxy Settings", {"ProxyType": "1"})
+
+    assert not os.path.exists(f"{config.path}.lock")
+
+
+def test_lock_waits_for_its_owner(config):
+    with kconfig_lock(config.path):
+        with pytest.raises(TimeoutError):
+            with kconfig_lock(config.path, timeout=0.1):
+                pass
+    with kconfig_lock(config.path, timeout=0.1):
+        pass
+
+
+def test_lock_of_a_dead_process_is_taken_over(config):
+    with open(f"{config.path}.lock", "w", encoding="utf-8") as f:
+        f.write(f"{2 ** 22 + 1}\nkwriteconfig5\n{socket.gethostname()}\n")
+
+    assert config.write("Proxy Settings", {"ProxyType": "1"})
+
+
+def test_old_lock_is_taken_over(config):
+    lock_path = f"{config.path}.lock"
+    with open(lock_path, "w", encoding="utf-8") as f:
+        f.write(f"{os.getpid()}\nkwriteconfig5\nanother-host\n")
+    old = time.time() - 60
+    os.utime(lock_path, (old, old))
+
+    assert config.write("Proxy Settings", {"ProxyType": "1"})
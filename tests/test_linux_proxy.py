@@ -0,0 +1,132 @@
+import subprocess
+import time
+
+import pytest
+
+from uniproxy import gnome_settings
+from uniproxy.linux_proxy import LinuxProxy
+from uniproxy.process import command_runner
+
+DAEMON_RELOAD = ["systemctl", "--user", "daemon-reload"]
+
+
+class FakeProbe:
+    """
+    GNOME session outside of flatpak with gsettings and dconf installed.
+    """
+
+    is_gnome = True
+    is_kde = False
+    kde_version = "5"
+    in_flatpak = False
+
+    def which(self, command):
+        return f"/usr/bin/{command}" if command in ("gsettings", "dconf") else None
+
+    def is_installed(self, command):
+        return self.which(command) is not None
+
+
+class FakeKdeProbe(FakeProbe):
+    is_gnome = False
+    is_kde = True
+
+
+class Recorder:
+    """
+    Records every command and answers `gsettings get` with a manual mode and a single bypass domain.
+    """
+
+    def __init__(self):
+        self.commands = []
+
+    def __call__(self, cmd, **kwargs):
+        self.commands.append(list(cmd))
+        stdout = {"mode": "'manual'", "ignore-hosts": "['localhost']"}.get(cmd[-1], "") if "get" in cmd else ""
+        return subprocess.CompletedProcess(cmd, 0, stdout=stdout, stderr="")
+
+    @property
+    def reloads(self):
+        return self.commands.count(DAEMON_RELOAD)
+
+    @property
+    def kio_notifications(self):
+        return len([cmd for cmd in self.commands if "org.kde.KIO.Scheduler.reparseSlaveConfiguration" in cmd])
+
+
+@pytest.fixture
+def recorder(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "config"))
+    monkeypatch.setattr(gnome_settings, "import_gio", lambda: None)
+    with command_runner(Recorder()) as recorder:
+        yield recorder
+
+
+def linux_proxy(probe=None, **kwargs):
+    return LinuxProxy("10.0.0.1", 8080, probe=probe or FakeProbe(), **kwargs)
+
+
+def test_set_enable_reloads_once(recorder):
+    proxy = linux_proxy()
+
+    proxy.set_enable(True)
+
+    assert recorder.reloads == 1
+    assert proxy.refresh_scheduler.count == 1
+
+
+def test_join_reloads_once(recorder):
+    proxy = linux_proxy()
+
+    proxy.join()
+
+    assert recorder.reloads == 1
+    assert proxy.refresh_scheduler.count == 1
+
+
+def test_del_proxy_reloads_once(recorder):
+    proxy = linux_proxy()
+    proxy.join()
+
+    proxy.del_proxy()
+
+    assert recorder.reloads == 2
+    assert proxy.refresh_scheduler.count == 2
+
+
+def test_unchanged_environment_does_not_reload(recorder):
+    proxy = linux_proxy()
+    proxy.join()
+
+    proxy.set_enable(True)
+
+    assert recorder.reloads == 1
+    assert proxy.refresh_scheduler.count == 1
+
+
+def test_debounce_merges_back_to_back_operations(recorder):
+    proxy = linux_proxy(refresh_debounce=0.2)
+
+    proxy.set_enable(True)
+    proxy.set_enable(False)
+    assert recorder.reloads == 0
+
+    deadline = time.monotonic() + 5
+    while not recorder.reloads and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.3)  # a second reload would run one window after the first
+
+    assert recorder.reloads == 1
+    assert proxy.refresh_scheduler.count == 1
+
+
+def test_kde_write_notifies_kio_once(recorder, tmp_path):
+    proxy = linux_proxy(FakeKdeProbe())
+
+    proxy.set_proxy()
+    assert recorder.kio_notifications == 1
+    assert "httpProxy=http://10.0.0.1 8080" in (tmp_path / "config" / "kioslaverc").read_text(encoding="utf-8")
+
+    proxy.set_proxy()
+    assert recorder.kio_notifications == 1
@@ -0,0 +1,131 @@
+import subprocess
+
+from uniproxy.mac_planner import PlannedOperation, plan_service_transition
+from uniproxy.mac_proxy import MacProxy
+from uniproxy.process import command_runner
+
+
+def proxy_state(enabled, ip_address="10.0.0.1", port="8080"):
+    return {"enabled": enabled, "ip_address": ip_address, "port": port}
+
+
+def test_matching_state_plans_nothing():
+    current = {"http": proxy_state(True), "https": proxy_state(True)}
+    desired = {protocol: {"enabled": True, "ip_address": "10.0.0.1", "port": 8080} for protocol in current}
+
+    assert plan_service_transition("Wi-Fi", current, desired) == []
+
+
+def test_enable_plans_one_state_change():
+    plan = plan_service_transition("Wi-Fi", {"http": proxy_state(False)}, {"http": {"enabled": True}})
+
+    assert plan == [PlannedOperation("networksetup", "Wi-Fi", ["-setwebproxystate", "Wi-Fi", "on"])]
+
+
+def test_new_server_on_disabled_proxy_is_written_through_scutil():
+    plan = plan_service_transition("Wi-Fi", {"http": proxy_state(False)},
+                                   {"http": {"ip_address": "10.0.0.2", "port": 3128}}, scutil=True)
+
+    assert plan == [PlannedOperation("scutil", "Wi-Fi", {"HTTPProxy": "10.0.0.2", "HTTPPort": 3128})]
+    assert not any(operation.tool == "networksetup" and operation.args[0] == "-setwebproxy" for operation in plan)
+
+
+def test_new_server_on_disabled_proxy_without_scutil_is_turned_off_again():
+    plan = plan_service_transition("Wi-Fi", {"http": proxy_state(False)},
+                                   {"http": {"ip_address": "10.0.0.2", "port": 3128}})
+
+    assert [operation.args for operation in plan] == [["-setwebproxy", "Wi-Fi", "10.0.0.2", "3128"],
+                                                      ["-setwebproxystate", "Wi-Fi", "off"]]
+
+
+def test_missing_port_is_removed_through_scutil():
+    plan = plan_service_transition("Wi-Fi", {"http": proxy_state(False, port="")},
+                                   {"http": {"ip_address": "10.0.0.2"}}, scutil=True)
+
+    assert plan == [PlannedOperation("scutil", "Wi-Fi", {"HTTPProxy": "10.0.0.2", "HTTPPort": None})]
+
+
+def test_server_and_enable_are_planned_together():
+    current = {"http": proxy_state(False), "https": proxy_state(False)}
+    desired = {protocol: {"enabled": True, "ip_address": "10.0.0.2", "port": 3128} for protocol in current}
+
+    plan = plan_service_transition("Wi-Fi", current, desired)
+
+    assert [operation.args[0] for operation in plan] == ["-setwebproxy", "-setsecurewebproxy"]
+
+
+def test_unknown_state_writes_the_wanted_state():
+    plan = plan_service_transition("Wi-Fi", {"http": None, "https": None}, {"http": {"enabled": True},
+                                                                           "https": {"enabled": True}})
+
+    assert [operation.args for operation in plan] == [["-setwebproxystate", "Wi-Fi", "on"],
+                                                      ["-setsecurewebproxystate", "Wi-Fi", "on"]]
+
+
+def test_http_and_https_are_planned_in_order():
+    current = {"http": proxy_state(True), "https": proxy_state(True)}
+    desired = {protocol: {"ip_address": "10.0.0.2", "port": 3128} for protocol in current}
+
+    plan = plan_service_transition("Wi-Fi", current, desired)
+
+    assert [operation.args[0] for operation in plan] == ["-setwebproxy", "-setsecurewebproxy"]
+    assert all(operation.args[1:] == ["Wi-Fi", "10.0.0.2", "3128"] for operation in plan)
+
+
+class FakeNetworksetup:
+    """
+    Answers the networksetup and route calls of MacProxy for two services using 10.0.0.1:8080, enabled or not.
+    """
+
+    def __init__(self, enabled="Yes"):
+        self.calls = []
+        self.enabled = enabled
+
+    def __call__(self, cmd, **kwargs):
+        self.calls.append(cmd)
+        outputs = {
+            "-listallnetworkservices": "An asterisk (*) denotes that a network service is disabled.\nWi-Fi\nEthernet\n",
+            "-listallhardwareports": "Hardware Port: Wi-Fi\nDevice: en0\nEthernet Address: 00\n",
+            "-getwebproxy": f"Enabled: {self.enabled}\nServer: 10.0.0.1\nPort: 8080\n",
+            "-getsecurewebproxy": f"Enabled: {self.enabled}\nServer: 10.0.0.1\nPort: 8080\n",
+            "-getproxybypassdomains": "*.local\n",
+            "-n": "interface: en0\n",
+        }
+        return subprocess.CompletedProcess(cmd, 0, outputs.get(cmd[1], ""), "")
+
+
+def test_join_without_changes_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    fake = FakeNetworksetup()
+    proxy = MacProxy("10.0.0.1", 8080, reader="networksetup")
+
+    with command_runner(fake):
+        proxy.join()
+
+    assert [cmd for cmd in fake.calls if cmd[1].startswith("-set")] == []
+    assert proxy.last_plan == []
+
+
+def test_join_of_disabled_proxy_with_new_server_only_sets_the_servers(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    fake = FakeNetworksetup(enabled="No")
+    proxy = MacProxy("10.0.0.2", 3128, reader="networksetup")
+
+    with command_runner(fake):
+        proxy.join()
+
+    assert [cmd[1] for cmd in fake.calls if cmd[0] == "scutil" or cmd[1].startswith("-set")] == \
+        ["-setwebproxy", "-setsecurewebproxy"] * 2
+
+
+def test_set_enable_writes_without_reading_uncached_state(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    fake = FakeNetworksetup()
+    proxy = MacProxy("10.0.0.1", 8080, reader="networksetup")
+
+    with command_runner(fake):
+        proxy.set_enable(False)
+
+    assert not any(cmd[1] in ("-getwebproxy", "-getsecurewebproxy") for cmd in fake.calls)
+    assert [cmd[1] for cmd in fake.calls if cmd[1].startswith("-set")] == \
+        ["-setwebproxystate", "-setsecurewebproxystate"] * 2
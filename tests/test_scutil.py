@@ -0,0 +1,62 @@
+import shlex
+import subprocess
+
+from uniproxy.scutil import ScutilProxyWriter, parse_scutil_dict
+
+
+class FakeScutil:
+    """
+    Answers the interactive scutil commands used by list_service_ids(). Services without a name print an empty
+    dictionary, unknown keys print "No such key" like scutil does.
+    """
+
+    def __init__(self, listed, names):
+        self.listed = listed
+        self.names = names
+
+    def __call__(self, cmd, input, **kwargs):
+        output = []
+        current = None
+        for words in map(shlex.split, input.splitlines()):
+            if words[0] == "list":
+                output += [f"  subKey [{index}] = Setup:/Network/Service/{service_id}"
+                           for index, service_id in enumerate(self.listed)]
+            elif words[0] == "d.init":
+                current = {}
+            elif words[0] == "d.add":
+                current[words[1]] = words[2]
+            elif words[0] == "d.show":
+                output += ["<dictionary> {"] + [f"  {key} : {value}" for key, value in current.items()] + ["}"]
+            elif words[0] == "show":
+                service_id = words[1].rsplit("/", 1)[1]
+                if service_id not in self.names:
+                    output.append("  No such key")
+                    continue
+                output.append("<dictionary> {")
+                if self.names[service_id] is not None:
+                    output.append(f"  UserDefinedName : {self.names[service_id]}")
+                output.append("}")
+        return subprocess.CompletedProcess(cmd, 0, "\n".join(output) + "\n", "")
+
+
+def test_list_service_ids():
+    scutil = FakeScutil(["AAA", "BBB"], {"AAA": "Wi-Fi", "BBB": "USB 10/100 LAN"})
+
+    assert ScutilProxyWriter(run_command=scutil).list_service_ids() == {"Wi-Fi": "AAA", "USB 10/100 LAN": "BBB"}
+
+
+def test_replies_stay_aligned_when_a_key_has_no_dictionary():
+    # BBB vanished between list and show, so the reply of CCC is the second dictionary of the output
+    scutil = FakeScutil(["AAA", "BBB", "CCC", "DDD"], {"AAA": "Wi-Fi", "CCC": "Ethernet", "DDD": None})
+
+    assert ScutilProxyWriter(run_command=scutil).list_service_ids() == {"Wi-Fi": "AAA", "Ethernet": "CCC"}
+
+
+def test_no_services():
+    assert ScutilProxyWriter(run_command=FakeScutil([], {})).list_service_ids() == {}
+
+
+def test_parse_nested_dictionary():
+    output = "<dictionary> {\n  ExceptionsList : <array> {\n    0 : *.local\n  }\n  HTTPEnable : 1\n}\n"
+
+    assert parse_scutil_dict(output) == {"ExceptionsList": ["*.local"], "HTTPEnable": 1}
@@ -0,0 +1,52 @@
+import pytest
+
+from uniproxy import shell_env_var
+from uniproxy.shell_env_var import ShellEnvVar
+from uniproxy.shells import MANAGED_MARKER
+
+
+class BashOnly:
+    def is_installed(self, command):
+        return command == "bash"
+
+
+@pytest.fixture
+def rc_reads(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / ".config"))
+    (tmp_path / ".bashrc").write_text("alias ll='ls -l'\n" * 1000)
+    reads = []
+    read_file = shell_env_var.read_file
+
+    def counting_read_file(path):
+        if path.endswith(".bashrc"):
+            reads.append(path)
+        return read_file(path)
+
+    monkeypatch.setattr(shell_env_var, "read_file", counting_read_file)
+    return reads
+
+
+def managed():
+    return ShellEnvVar("10.0.0.1", 8080, ["localhost"], probe=BashOnly(), managed=True)
+
+
+def test_source_line_is_added_once_and_not_read_again(tmp_path, rc_reads):
+    for _ in range(3):
+        managed().set_proxy_env_var()
+        managed().unset_proxy_env_var()
+
+    content = (tmp_path / ".bashrc").read_text()
+    assert content.count(MANAGED_MARKER) == 1
+    assert len(rc_reads) == 1
+
+
+def test_rc_file_changed_by_someone_else_is_checked_again(tmp_path, rc_reads):
+    managed().set_proxy_env_var()
+    bashrc = tmp_path / ".bashrc"
+    bashrc.write_text("alias ll='ls -l'\n")
+
+    managed().set_proxy_env_var()
+
+    assert len(rc_reads) == 2
+    assert MANAGED_MARKER in bashrc.read_text()
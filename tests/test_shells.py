@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from uniproxy import shell_env_var
+from uniproxy.shell_env_var import ShellEnvVar
+from uniproxy.shells import BashShell, NushellShell, Shell, TcshShell, XonshShell, register_shell, registered_shells, \
+    unregister_shell
+
+
+def test_shell_is_abstract():
+    with pytest.raises(TypeError):
+        Shell()
+
+
+def test_plugin_must_implement_every_method():
+    class IncompleteShell(Shell):
+        name = "INCOMPLETE"
+        bin = "incomplete"
+
+        def config_path(self):
+            return "/dev/null"
+
+    with pytest.raises(TypeError):
+        IncompleteShell()
+
+
+def test_builtin_shells_are_registered():
+    shells = registered_shells()
+
+    assert all(isinstance(shell, Shell) for shell in shells)
+    assert BashShell().export_line("http_proxy", "http://10.0.0.1:8080/") in \
+        [shell.export_line("http_proxy", "http://10.0.0.1:8080/") for shell in shells]
+
+
+def test_only_bash_zsh_and_fish_are_registered_by_default():
+    assert sorted(shell.name for shell in registered_shells()) == ["BASH", "FISH", "ZSH"]
+
+
+def test_optional_shells_can_be_registered():
+    for shell in [NushellShell(), TcshShell(), XonshShell()]:
+        register_shell(shell)
+        try:
+            assert shell in registered_shells()
+        finally:
+            unregister_shell(shell.name)
+
+
+def test_removed_names_are_deprecated_aliases(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    with pytest.warns(DeprecationWarning):
+        assert shell_env_var.BASH_RC == os.path.join(str(tmp_path), ".bashrc")
+    with pytest.warns(DeprecationWarning):
+        assert shell_env_var.ZSH_RC.endswith(".zshrc")
+    with pytest.warns(DeprecationWarning):
+        assert shell_env_var.FISH_CONFIG.endswith("fish/config.fish")
+    with pytest.warns(DeprecationWarning):
+        assert shell_env_var.ShellsTypes.BASH.value["bin"] == "bash"
+    with pytest.raises(AttributeError):
+        shell_env_var.NOT_A_NAME
+
+
+def test_shells_support_deprecated_dict_access(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    class BashOnly:
+        def is_installed(self, command):
+            return command == "bash"
+
+    shell = ShellEnvVar("10.0.0.1", 8080, [], probe=BashOnly()).shells[0]
+
+    with pytest.warns(DeprecationWarning):
+        assert (shell["name"], shell["bin"]) == ("BASH", "bash")
+    with pytest.warns(DeprecationWarning):
+        assert shell["config"] == os.path.join(str(tmp_path), ".bashrc")
+    with pytest.warns(DeprecationWarning):
+        assert shell["include"] == shell.include_path()
+    with pytest.warns(DeprecationWarning), pytest.raises(KeyError):
+        shell["unknown"]
@@ -0,0 +1,109 @@
+import os
+import platform
+
+import pytest
+
+from uniproxy import snapshot as snapshots
+from uniproxy.snapshot import Snapshot
+
+
+class FakeProxy:
+    """
+    Backend which keeps its state in memory and records the apply_config() calls.
+    """
+
+    def __init__(self, ip_address, port, enabled, bypass_domains):
+        self.ip_address = "10.0.0.9"
+        self.port = 9999
+        self.state = {"is_enable": enabled, "http": {"ip_address": ip_address, "port": port},
+                      "https": {"ip_address": ip_address, "port": port}}
+        self.bypass_domains = list(bypass_domains)
+        self.applied = []
+
+    def get_proxy(self, bypass_cache=False):
+        return self.state
+
+    def get_bypass_domains(self, bypass_cache=False):
+        return self.bypass_domains
+
+    def apply_config(self, config, report):
+        self.applied.append((config, report, (self.ip_address, self.port)))
+
+    def del_proxy(self):
+        raise AssertionError("restore must not write in two phases")
+
+
+def snapshot(endpoint, enabled=False, bypass_domains=("localhost",)):
+    state = {"enabled": enabled, "endpoints": {"http": endpoint, "https": endpoint},
+             "bypass_domains": list(bypass_domains)}
+    return Snapshot(state=state, platform=platform.system().lower())
+
+
+def test_restoring_no_server_is_one_apply():
+    proxy = FakeProxy("10.0.0.1", "8080", True, ["example.com"])
+
+    report = snapshots.restore(proxy, snapshot(("", "")))
+
+    assert len(proxy.applied) == 1
+    config, applied_report, server = proxy.applied[0]
+    assert server == ("", 0)
+    assert (config.enabled, config.bypass_domains) == (False, ("localhost",))
+    assert applied_report.endpoint and applied_report.enabled and applied_report.bypass_domains
+    assert report.after["endpoints"] == {"http": ("", ""), "https": ("", "")}
+    # the instance keeps its own server for later operations
+    assert (proxy.ip_address, proxy.port) == ("10.0.0.9", 9999)
+
+
+def test_empty_port_is_restored_like_no_server():
+    proxy = FakeProxy("10.0.0.1", "8080", False, ["localhost"])
+
+    report = snapshots.restore(proxy, snapshot(("10.0.0.1", "")))
+
+    assert report.endpoint and not report.enabled
+    assert proxy.applied[0][2] == ("", 0)
+
+
+def test_cleared_state_which_matches_writes_nothing():
+    proxy = FakeProxy("", "", False, ["localhost"])
+
+    report = snapshots.restore(proxy, snapshot(("", "")))
+
+    assert not report.changed
+    assert proxy.applied == []
+
+
+def test_restoring_a_server():
+    proxy = FakeProxy("10.0.0.1", "8080", True, ["localhost"])
+
+    report = snapshots.restore(proxy, snapshot(("10.0.0.2", "3128"), enabled=True))
+
+    assert report.endpoint and not report.enabled and not report.bypass_domains
+    assert proxy.applied[0][2] == ("10.0.0.2", 3128)
+    assert (proxy.ip_address, proxy.port) == ("10.0.0.2", 3128)
+
+
+def test_snapshot_of_a_running_process_is_not_overwritten(tmp_path, monkeypatch):
+    path = str(tmp_path / "snapshot.json")
+    other = snapshot(("10.0.0.1", "8080"))
+    other.pid = os.getppid()
+    snapshots.save(other, path)
+
+    with pytest.raises(RuntimeError):
+        snapshots.save(snapshot(("10.0.0.2", "8080")), path)
+
+    monkeypatch.setattr(snapshots, "process_alive", lambda pid: False)
+    snapshots.save(snapshot(("10.0.0.2", "8080")), path)
+    assert snapshots.load(path).pid == os.getpid()
+
+
+def test_discard_keeps_a_snapshot_of_another_process(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    other = snapshot(("10.0.0.1", "8080"))
+    other.pid = os.getppid()
+    snapshots.save(other, path)
+
+    snapshots.discard(path)
+    assert snapshots.load(path) is not None
+
+    snapshots.discard(path, other.pid)
+    assert snapshots.load(path) is None
@@ -0,0 +1,114 @@
+import threading
+
+from uniproxy.service_executor import ServiceExecutor
+from uniproxy.state_cache import StateCache, cached_state
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Reader:
+    def __init__(self, cache):
+        self.state_cache = cache
+        self.reads = 0
+
+    @cached_state
+    def get_value(self):
+        self.reads += 1
+        return {"reads": self.reads}
+
+
+def test_hit_and_miss():
+    clock = FakeClock()
+    cache = StateCache(ttl=1.0, clock=clock)
+    loads = []
+
+    assert cache.get("key", lambda: loads.append(1) or "first") == "first"
+    assert cache.get("key", lambda: loads.append(1) or "second") == "first"
+    clock.now = 1.0
+    assert cache.get("key", lambda: loads.append(1) or "third") == "third"
+
+    assert len(loads) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_zero_ttl_disables_caching():
+    cache = StateCache(ttl=0)
+    cache.get("key", lambda: "first")
+
+    assert cache.get("key", lambda: "second") == "second"
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_keeps_named_entries():
+    cache = StateCache()
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+
+    cache.invalidate(keep=("a",))
+
+    assert cache.get("a", lambda: 10) == 1
+    assert cache.get("b", lambda: 20) == 20
+
+
+def test_value_loaded_across_invalidate_is_not_cached():
+    cache = StateCache()
+
+    def stale_loader():
+        # a write of the same instance lands while the old state is being read
+        cache.invalidate()
+        return "stale"
+
+    assert cache.get("key", stale_loader) == "stale"
+    assert cache.get("key", lambda: "fresh") == "fresh"
+
+
+def test_bypass_reads_through_and_caches_the_result():
+    reader = Reader(StateCache())
+    reader.get_value()
+
+    assert reader.get_value(bypass_cache=True) == {"reads": 2}
+    assert reader.get_value() == {"reads": 2}
+
+
+def test_nested_bypass():
+    cache = StateCache()
+    with cache.bypass():
+        with cache.bypass():
+            assert cache.bypassed
+        assert cache.bypassed
+    assert not cache.bypassed
+
+
+def test_bypass_reaches_service_executor_threads():
+    cache = StateCache()
+    seen = {}
+
+    def read(service):
+        seen[service] = (cache.bypassed, threading.current_thread() is threading.main_thread())
+
+    with cache.bypass():
+        ServiceExecutor(max_workers=2).run("read", ["Wi-Fi", "Ethernet"], read)
+
+    assert seen == {"Wi-Fi": (True, False), "Ethernet": (True, False)}
+
+
+def test_callers_get_a_copy():
+    reader = Reader(StateCache())
+    reader.get_value()["reads"] = 42
+
+    assert reader.get_value() == {"reads": 1}
+
+
+def test_cache_only_never_reads():
+    reader = Reader(StateCache())
+
+    assert reader.get_value(cache_only=True) is None
+    reader.get_value()
+    assert reader.get_value(cache_only=True) == {"reads": 1}
+    assert reader.reads == 1
@@ -0,0 +1,37 @@
+import platform
+
+import pytest
+
+import uniproxy
+
+
+class RecordingBackend:
+    def __init__(self, ip_address, port, **options):
+        self.ip_address = ip_address
+        self.port = port
+        self.options = options
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    name = {"windows": "WinProxy", "darwin": "MacProxy"}.get(platform.system().lower(), "LinuxProxy")
+    monkeypatch.setattr(uniproxy, name, RecordingBackend, raising=False)
+
+
+def test_backend_options_are_forwarded(backend):
+    prox = uniproxy.Uniproxy("10.0.0.1", 3128, backend_options={"writer": "scutil", "state_ttl": 1.0})
+
+    assert (prox.proxy.ip_address, prox.proxy.port) == ("10.0.0.1", 3128)
+    assert prox.proxy.options == {"writer": "scutil", "state_ttl": 1.0}
+
+
+def test_reads_are_not_cached_by_default(backend):
+    prox = uniproxy.Uniproxy("10.0.0.1", 3128)
+
+    assert prox.proxy.options == {"state_ttl": 0}
+
+
+def test_async_uniproxy_forwards_backend_options(backend):
+    prox = uniproxy.AsyncUniproxy("10.0.0.1", 3128, backend_options={"skip_disabled": True})
+
+    assert prox.uniproxy.proxy.options == {"state_ttl": 0, "skip_disabled": True}
@@ -0,0 +1,52 @@
+import os
+import threading
+
+import pytest
+
+from uniproxy.watch import InotifySource
+
+pytestmark = pytest.mark.skipif(not InotifySource.is_supported(), reason="inotify is not available")
+
+
+def watch(paths):
+    changed = threading.Event()
+    source = InotifySource(paths)
+    source.start(changed.set)
+    return source, changed
+
+
+def test_reports_writes_in_an_existing_directory(tmp_path):
+    source, changed = watch([tmp_path / "proxy.conf"])
+    try:
+        (tmp_path / "other.conf").write_text("ignored")
+        assert not changed.wait(0.2)
+        (tmp_path / "proxy.conf").write_text("http_proxy=http://10.0.0.1:8080/")
+        assert changed.wait(5)
+    finally:
+        source.stop()
+
+
+def test_follows_a_directory_created_later(tmp_path):
+    directory = tmp_path / ".config" / "environment.d"
+    source, changed = watch([directory / "proxy.conf"])
+    try:
+        os.makedirs(directory)
+        assert not changed.wait(0.2)
+        (directory / "proxy.conf").write_text("http_proxy=http://10.0.0.1:8080/")
+        assert changed.wait(5)
+    finally:
+        source.stop()
+
+
+def test_follows_a_directory_removed_and_created_again(tmp_path):
+    directory = tmp_path / "environment.d"
+    directory.mkdir()
+    source, changed = watch([directory / "proxy.conf"])
+    try:
+        directory.rmdir()
+        directory.mkdir()
+        changed.clear()
+        (directory / "proxy.conf").write_text("http_proxy=http://10.0.0.1:8080/")
+        assert changed.wait(5)
+    finally:
+        source.stop()
@@ -0,0 +1,93 @@
+import ctypes
+import importlib
+import importlib.util
+import os
+import sys
+import types
+
+import pytest
+
+WINSTUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "winstub",
+                       "winreg.py")
+WINDOWS_MODULES = ["uniproxy.win_proxy", "uniproxy.win_env", "uniproxy.win_registry"]
+
+
+class FakeUser32:
+    def __init__(self):
+        self.broadcasts = []
+
+    def SendMessageTimeoutW(self, window, message, wparam, lparam, flags, timeout, result):
+        self.broadcasts.append(lparam)
+        return 1
+
+
+@pytest.fixture
+def windows(monkeypatch):
+    """
+    Installs the in-memory winreg of the benchmarks and a ctypes.windll whose SendMessageTimeoutW is recorded.
+    """
+    spec = importlib.util.spec_from_file_location("winreg", WINSTUB)
+    winreg = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(winreg)
+    monkeypatch.setitem(sys.modules, "winreg", winreg)
+
+    user32 = FakeUser32()
+    wininet = types.SimpleNamespace(InternetSetOptionW=lambda *args: 1)
+    monkeypatch.setattr(ctypes, "windll", types.SimpleNamespace(user32=user32, Wininet=wininet), raising=False)
+    for name in WINDOWS_MODULES:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    yield types.SimpleNamespace(winreg=winreg, user32=user32)
+    for name in WINDOWS_MODULES:
+        sys.modules.pop(name, None)
+
+
+def user_environment():
+    return importlib.import_module("uniproxy.win_env").UserEnvironment()
+
+
+def test_unchanged_values_are_not_written(windows):
+    environment = user_environment()
+
+    assert environment.update({"http_proxy": "http://10.0.0.1:8080/"})
+    writes = windows.winreg.writes
+    assert not environment.update({"http_proxy": "http://10.0.0.1:8080/"})
+    assert windows.winreg.writes == writes
+
+
+def test_none_and_empty_delete_variables(windows):
+    environment = user_environment()
+    environment.update({"http_proxy": "http://10.0.0.1:8080/", "no_proxy": "localhost"})
+
+    assert environment.update({"http_proxy": None, "no_proxy": ""})
+    assert environment.read(["http_proxy", "no_proxy"]) == {"http_proxy": None, "no_proxy": None}
+    assert not environment.update({"http_proxy": None, "ftp_proxy": ""})
+
+
+def test_values_longer_than_setx_allows_are_kept(windows):
+    environment = user_environment()
+    no_proxy = ",".join(f"host{index}.internal.example" for index in range(100))
+    assert len(no_proxy) > 1024
+
+    environment.update({"no_proxy": no_proxy})
+
+    assert environment.read(["no_proxy"]) == {"no_proxy": no_proxy}
+
+
+def test_existing_expandable_values_keep_their_type(windows):
+    environment = user_environment()
+    environment.update({"Path": "C:\\Tools"})
+
+    assert windows.winreg.values["Environment"]["Path"] == ("C:\\Tools", windows.winreg.REG_EXPAND_SZ)
+
+
+def test_one_broadcast_per_operation(windows):
+    proxy = importlib.import_module("uniproxy.win_proxy").WinProxy("10.0.0.1", 8080)
+
+    proxy.join()
+    assert windows.user32.broadcasts == ["Environment"]
+
+    proxy.set_enable(False)
+    assert windows.user32.broadcasts == ["Environment"] * 2
+
+    proxy.set_enable(False)
+    assert windows.user32.broadcasts == ["Environment"] * 2
@@ -0,0 +1,93 @@
+import ctypes
+import importlib
+import sys
+import types
+
+import pytest
+
+from uniproxy.win_inet import INTERNET_PER_CONN_FLAGS, INTERNET_PER_CONN_PROXY_BYPASS, INTERNET_PER_CONN_PROXY_SERVER, \
+    PROXY_TYPE_DIRECT, PROXY_TYPE_PROXY
+
+WINDOWS_MODULES = ["uniproxy.win_proxy", "uniproxy.win_env", "uniproxy.win_registry"]
+
+
+class FakeWininet:
+    """
+    Stand-in for the InternetQueryOptionW and InternetSetOptionW functions of wininet.dll, counting the queries.
+    """
+
+    def __init__(self, flags, proxy_server, proxy_bypass):
+        self.options = {INTERNET_PER_CONN_FLAGS: flags, INTERNET_PER_CONN_PROXY_SERVER: proxy_server,
+                        INTERNET_PER_CONN_PROXY_BYPASS: proxy_bypass}
+        self.queries = 0
+        self.buffers = []
+
+    def InternetQueryOptionW(self, handle, option, option_list, size):
+        self.queries += 1
+        option_list = option_list._obj
+        for index in range(option_list.dwOptionCount):
+            entry = option_list.pOptions[index]
+            value = self.options[entry.dwOption]
+            if entry.dwOption == INTERNET_PER_CONN_FLAGS:
+                entry.Value.dwValue = value
+            else:
+                buffer = ctypes.create_unicode_buffer(value)
+                self.buffers.append(buffer)
+                entry.Value.pszValue = ctypes.addressof(buffer)
+        return 1
+
+    def InternetSetOptionW(self, *args):
+        return 1
+
+
+@pytest.fixture
+def wininet(monkeypatch):
+    winreg = types.ModuleType("winreg")
+    winreg.HKEY_CURRENT_USER = "HKEY_CURRENT_USER"
+    winreg.KEY_ALL_ACCESS = 0xF003F
+    winreg.REG_SZ = 1
+    winreg.REG_DWORD = 4
+    winreg.OpenKey = lambda *args: "Internet Settings"
+    monkeypatch.setitem(sys.modules, "winreg", winreg)
+
+    fake = FakeWininet(PROXY_TYPE_DIRECT | PROXY_TYPE_PROXY, "10.0.0.1:8080", "<local>;*.example.com")
+    windll = types.SimpleNamespace(Wininet=fake, kernel32=types.SimpleNamespace(GlobalFree=lambda pointer: 0))
+    monkeypatch.setattr(ctypes, "windll", windll, raising=False)
+    for name in WINDOWS_MODULES:
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    yield fake
+    for name in WINDOWS_MODULES:
+        sys.modules.pop(name, None)
+
+
+def win_proxy(**kwargs):
+    return importlib.import_module("uniproxy.win_proxy").WinProxy("10.0.0.1", 8080, backend="wininet", **kwargs)
+
+
+def test_getters_share_one_query(wininet):
+    proxy = win_proxy()
+
+    assert proxy.get_proxy()["http"] == {"ip_address": "10.0.0.1", "port": "8080"}
+    assert proxy.get_proxy()["is_enable"]
+    assert proxy.get_bypass_domains() == ["<local>", "*.example.com"]
+    assert wininet.queries == 1
+
+
+def test_bypass_cache_queries_again(wininet):
+    proxy = win_proxy()
+    proxy.get_proxy()
+
+    wininet.options[INTERNET_PER_CONN_PROXY_SERVER] = "10.0.0.2:3128"
+
+    assert proxy.get_proxy(bypass_cache=True)["http"] == {"ip_address": "10.0.0.2", "port": "3128"}
+    assert wininet.queries == 2
+
+
+def test_each_getter_chain_queries_once_without_cache(wininet):
+    proxy = win_proxy(state_ttl=0)
+
+    proxy.get_proxy()
+    assert wininet.queries == 1
+
+    proxy.get_bypass_domains()
+    assert wininet.queries == 2
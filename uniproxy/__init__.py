@@ -1,12 +1,23 @@
+import functools
 import shutil
 import os
-import socket
 import pathlib
 import platform
+import threading
 import warnings
+from contextlib import contextmanager
 
 ## Package Imports
 
+from uniproxy.aio import AsyncUniproxy
+from uniproxy.config import ChangeReport, ProxyConfig, diff_state, read_state
+from uniproxy.endpoint_pool import EndpointMonitor, EndpointPool, ProbeResult, probe_endpoints
+from uniproxy.probe import SystemProbe, get_probe
+from uniproxy import snapshot as snapshots
+from uniproxy.snapshot import Snapshot
+from uniproxy.tracing import Profiler, Span, Tracer, set_tracer, traced_operation, use_tracer
+from uniproxy.watch import ProxyWatcher
+
 if platform.system().lower() == "linux":
     from uniproxy.linux_proxy import LinuxProxy
 if platform.system().lower() == "macos" or platform.system().lower() == "darwin":
@@ -14,13 +25,50 @@ if platform.system().lower() == "macos" or platform.system().lower() == "darwin"
 if platform.system().lower() == "windows":
     from uniproxy.win_proxy import WinProxy
 
+def locked(method):
+    """
+    Runs `method` holding the operation lock of the Uniproxy instance, so that operations and the endpoint switches of
+    monitor_endpoints() never interleave.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._operation_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class Uniproxy:
-    def __init__(self, ip: str, port: int):
-        self._ip_address = ip
-        self._port = port
+    def __init__(self, ip: str = None, port: int = None, endpoints=None, probe_timeout=1.0, backend_options=None):
+        """
+        Uses the proxy server at `ip`:`port`, or the fastest reachable one of `endpoints`, a list of (ip, port) pairs.
+        When there is more than one candidate, all of them are probed at the same time with a TCP connect, which takes
+        at most `probe_timeout` seconds including name resolution. A single candidate is used without probing it.
+
+        `backend_options` is a dict of keyword arguments for the backend of the platform, LinuxProxy, MacProxy or
+        WinProxy, e.g. `{"writer": "scutil"}` on macOS or `{"backend": "wininet"}` on Windows. Reads are not cached
+        unless it sets `state_ttl`.
+        """
+        if ip is None and port is not None:
+            raise ValueError(f"A proxy port ({port}) was given without an ip")
+        if ip is not None and port is None:
+            raise ValueError(f"A port is required for the proxy at {ip}")
+        if ip is None and not endpoints:
+            raise ValueError("An ip and port or a list of endpoints is required")
+        # reentrant, since operations call each other, e.g. recover() calls restore()
+        self._operation_lock = threading.RLock()
+        self.backend_options = {"state_ttl": 0, **(backend_options or {})}
+        candidates = ([(ip, port)] if ip is not None else []) + list(endpoints or [])
+        self.endpoint_pool = EndpointPool(candidates, timeout=probe_timeout)
+        probed = len(self.endpoint_pool.endpoints) > 1
+        if probed:
+            self.endpoint_pool.select()
+        else:
+            # nothing to choose from, so the constructor does not wait for a probe
+            self.endpoint_pool.active = self.endpoint_pool.endpoints[0]
+        self._ip_address, self._port = self.endpoint_pool.active
         self.proxy = self.__get_proxy_instance()
-        if not self.__check_connection():
-            warnings.warn("Unable to bind to the specified IP and Port.\nPlease check if the IP and Port are correct\n and port is not already in use.")
+        if probed and not self.endpoint_pool.reachable():
+            warnings.warn("Unable to connect to the specified IP and Port.\nPlease check if the IP and Port are correct\n and the proxy server is running.")
 
     @property
     def ip_address(self):
@@ -42,23 +90,15 @@ class Uniproxy:
         if hasattr(self, 'proxy'):
             self.proxy.port = value
 
-    def __check_connection(self):
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.bind(( self.ip_address, self.port ))
-            s.close()
-            return True
-        except Exception:
-            return False
 
     def __get_proxy_instance(self):
         plat = platform.system().lower()
         if plat == "windows":
-            return WinProxy(self.ip_address, self.port)
+            return WinProxy(self.ip_address, self.port, **self.backend_options)
         elif plat == "linux":
-            return LinuxProxy(self.ip_address, self.port)
+            return LinuxProxy(self.ip_address, self.port, **self.backend_options)
         elif plat == "macos" or plat == "darwin":
-            return MacProxy(self.ip_address, self.port)
+            return MacProxy(self.ip_address, self.port, **self.backend_options)
         else:
             raise OSError("Unable to determine the underlying operating system")
 
@@ -70,56 +110,170 @@ class Uniproxy:
         except FileNotFoundError:
             pass
 
+    @traced_operation
+    @locked
     def join(self):
         """
         Sets the proxy server in OS settings and enables the proxy.
         """
         self.proxy.join()
 
+    @traced_operation
+    @locked
     def set_proxy(self):
         """
         Sets the proxy server in OS settings without enabling the proxy.
         """
         self.proxy.set_proxy()
 
-        if hasattr(self.proxy, 'refresh'):
-            self.proxy.refresh()
+    @property
+    def state_cache(self):
+        """
+        The StateCache of the backend, e.g. to look at its hit and miss counters.
+        """
+        return self.proxy.state_cache
 
-    def get_proxy(self):
+    @traced_operation
+    @locked
+    def get_proxy(self, bypass_cache=False):
         """
-        Gets the proxy settings in a dict.
+        Gets the proxy settings in a dict. Reads are cached for a short time, `bypass_cache=True` reads them from the
+        OS.
         """
-        return self.proxy.get_proxy()
+        return self.proxy.get_proxy(bypass_cache=bypass_cache)
 
+    @traced_operation
+    @locked
     def delete_proxy(self):
         """
         Disconnects from proxy and reset proxy settings to OS defaults.
         """
         self.proxy.del_proxy()
 
-        if hasattr(self.proxy, 'refresh'):
-            self.proxy.refresh()
-
+    @traced_operation
+    @locked
     def set_proxy_enabled(self, enable: bool):
         """
         Sets the proxy to be enabled or disabled.
         """
         self.proxy.set_enable(enable)
 
+    @traced_operation
+    @locked
     def set_bypass_domains(self, domains: list[str]):
         """
         Sets the domains which bypass the proxy.
         """
         self.proxy.set_bypass_domains(domains)
 
-    def get_bypass_domains(self):
+    @traced_operation
+    @locked
+    def get_bypass_domains(self, bypass_cache=False):
         """
         Gets the domains in a list which bypass the proxy.
         """
-        return self.proxy.get_bypass_domains()
+        return self.proxy.get_bypass_domains(bypass_cache=bypass_cache)
+
+    @traced_operation
+    @locked
+    def apply(self, config: ProxyConfig) -> ChangeReport:
+        """
+        Brings the proxy to the state described by `config`. The current state is read once and only the endpoint,
+        enabled flag and bypass domains which differ are written, in one batch. Returns a ChangeReport, applying a
+        config which is already in place writes nothing.
+        """
+        report = diff_state(read_state(self.proxy, bypass_cache=True), config)
+        self.ip_address = config.ip_address
+        self.port = config.port
+        if report.changed:
+            self.proxy.apply_config(config, report)
+        return report
+
+    @traced_operation
+    @locked
+    def snapshot(self, path=None) -> Snapshot:
+        """
+        Captures the current proxy settings, including the environment and shell files written by uniproxy, and saves
+        them to `path` (by default `$XDG_STATE_HOME/uniproxy/snapshot.json`). Raises RuntimeError if another running
+        process has its snapshot saved at `path`.
+        """
+        snapshot = snapshots.capture(self.proxy)
+        snapshots.save(snapshot, path)
+        return snapshot
+
+    @traced_operation
+    @locked
+    def restore(self, snapshot: Snapshot = None, path=None) -> ChangeReport:
+        """
+        Puts back the settings of `snapshot`, or of the snapshot saved at `path`, writing only what differs. The saved
+        snapshot is removed afterwards if it is the one which was restored.
+        """
+        if snapshot is None:
+            snapshot = snapshots.load(path)
+            if snapshot is None:
+                raise FileNotFoundError("No proxy snapshot to restore")
+        report = snapshots.restore(self.proxy, snapshot)
+        self._ip_address = self.proxy.ip_address
+        self._port = self.proxy.port
+        snapshots.discard(path, snapshot.pid)
+        return report
+
+    @traced_operation
+    @locked
+    def recover(self, path=None):
+        """
+        Restores the snapshot left behind at `path` by a process which exited without restoring it. Returns True if
+        there was one.
+        """
+        snapshot = snapshots.load(path)
+        if snapshot is None or (snapshot.pid != os.getpid() and snapshots.process_alive(snapshot.pid)):
+            return False
+        self.restore(snapshot, path)
+        return True
+
+    @contextmanager
+    def preserved(self, path=None):
+        """
+        Context manager which snapshots the proxy settings on entry and restores them on exit, e.g. around a test run
+        which enables the proxy. If an earlier run crashed before restoring, its snapshot is restored first.
+        """
+        self.recover(path)
+        snapshot = self.snapshot(path)
+        try:
+            yield snapshot
+        finally:
+            self.restore(snapshot, path)
+
+    def monitor_endpoints(self, interval=10.0, on_switch=None, on_error=None) -> EndpointMonitor:
+        """
+        Starts re-probing the endpoints every `interval` seconds on a background thread and returns the
+        EndpointMonitor. When the active endpoint fails or another one is clearly faster the proxy server is switched
+        to it, without changing whether the proxy is enabled, and `on_switch` is called with the new (ip, port).
+        Switches wait for running operations of this instance. Errors are passed to `on_error`, or reported as
+        warnings, and the monitor keeps running. Probe statistics are available from `endpoint_pool.metrics()`.
+        """
+        def switch(endpoint):
+            with self._operation_lock:
+                self.ip_address, self.port = endpoint
+                self.proxy.set_proxy()
+            if on_switch is not None:
+                on_switch(endpoint)
+
+        return EndpointMonitor(self.endpoint_pool, switch, interval, on_error).start()
+
+    def watch(self, callback=None, debounce=0.2, poll_interval=2.0) -> ProxyWatcher:
+        """
+        Starts watching the proxy settings for changes made by anyone, e.g. the system settings or another process,
+        and returns the ProxyWatcher. Each change is delivered as a ChangeReport to `callback`, or without a callback
+        by iterating over the watcher. Stop it with stop() or use it as a context manager.
+        """
+        # the watcher reads from its own backend instance, so it never sees the state of an operation in progress
+        return ProxyWatcher(self.__get_proxy_instance(), callback, debounce, poll_interval=poll_interval).start()
 
-    def get_proxy_enabled(self):
+    @traced_operation
+    @locked
+    def get_proxy_enabled(self, bypass_cache=False):
         """
         Gets if the proxy is enabled or not.
         """
-        return self.proxy.get_enable()
+        return self.proxy.get_enable(bypass_cache=bypass_cache)
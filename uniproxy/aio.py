@@ -0,0 +1,115 @@
+import asyncio
+import contextvars
+import functools
+import weakref
+from contextlib import asynccontextmanager
+
+from uniproxy.process import AsyncCommandRunner, command_runner
+
+
+class AsyncUniproxy:
+    """
+    asyncio version of Uniproxy with the same methods as coroutines. Each operation runs on a worker thread, so file
+    writes never block the event loop, and every command it spawns is run on the loop with
+    asyncio.create_subprocess_exec(), at most `max_concurrency` at a time. Independent commands, e.g. the per service
+    networksetup calls on macOS or the KDE and GNOME writes on Linux, run concurrently.
+
+    Operations of one instance run one after another. A cancelled operation is still completed in the background
+    before the CancelledError is raised, so the settings are never left half written.
+    """
+
+    def __init__(self, ip: str = None, port: int = None, max_concurrency=8, uniproxy=None, endpoints=None,
+                 probe_timeout=1.0, backend_options=None):
+        if uniproxy is None:
+            from uniproxy import Uniproxy
+            uniproxy = Uniproxy(ip, port, endpoints=endpoints, probe_timeout=probe_timeout,
+                                backend_options=backend_options)
+        self.uniproxy = uniproxy
+        self.max_concurrency = max_concurrency
+        # command runner and operation lock of each event loop the instance is used from
+        self.__loops = weakref.WeakKeyDictionary()
+
+    @property
+    def ip_address(self):
+        return self.uniproxy.ip_address
+
+    @ip_address.setter
+    def ip_address(self, value):
+        self.uniproxy.ip_address = value
+
+    @property
+    def port(self):
+        return self.uniproxy.port
+
+    @port.setter
+    def port(self, value):
+        self.uniproxy.port = value
+
+    def __get_loop_state(self, loop):
+        if loop not in self.__loops:
+            self.__loops[loop] = (AsyncCommandRunner(loop, self.max_concurrency), asyncio.Lock())
+        return self.__loops[loop]
+
+    async def __call(self, function, *args):
+        runner, lock = self.__get_loop_state(asyncio.get_running_loop())
+
+        def run():
+            with command_runner(runner):
+                return function(*args)
+
+        async with lock:
+            loop = asyncio.get_running_loop()
+            task = loop.run_in_executor(None, contextvars.copy_context().run, run)
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                await asyncio.wait({task})
+                raise
+
+    async def join(self):
+        return await self.__call(self.uniproxy.join)
+
+    async def set_proxy(self):
+        return await self.__call(self.uniproxy.set_proxy)
+
+    async def get_proxy(self, bypass_cache=False):
+        return await self.__call(functools.partial(self.uniproxy.get_proxy, bypass_cache=bypass_cache))
+
+    async def delete_proxy(self):
+        return await self.__call(self.uniproxy.delete_proxy)
+
+    async def set_proxy_enabled(self, enable: bool):
+        return await self.__call(self.uniproxy.set_proxy_enabled, enable)
+
+    async def set_bypass_domains(self, domains: list[str]):
+        return await self.__call(self.uniproxy.set_bypass_domains, domains)
+
+    async def get_bypass_domains(self, bypass_cache=False):
+        return await self.__call(functools.partial(self.uniproxy.get_bypass_domains, bypass_cache=bypass_cache))
+
+    async def get_proxy_enabled(self, bypass_cache=False):
+        return await self.__call(functools.partial(self.uniproxy.get_proxy_enabled, bypass_cache=bypass_cache))
+
+    async def apply(self, config):
+        return await self.__call(self.uniproxy.apply, config)
+
+    async def snapshot(self, path=None):
+        return await self.__call(self.uniproxy.snapshot, path)
+
+    async def restore(self, snapshot=None, path=None):
+        return await self.__call(self.uniproxy.restore, snapshot, path)
+
+    async def recover(self, path=None):
+        return await self.__call(self.uniproxy.recover, path)
+
+    @asynccontextmanager
+    async def preserved(self, path=None):
+        """
+        Async version of Uniproxy.preserved().
+        """
+        await self.recover(path)
+        snapshot = await self.snapshot(path)
+        try:
+            yield snapshot
+        finally:
+            await self.restore(snapshot, path)
@@ -0,0 +1,66 @@
+import os
+import stat
+import tempfile
+
+from uniproxy import tracing
+
+
+def read_file(path):
+    """
+    Returns the contents of the file at `path` or None if the file does not exist.
+    """
+    with tracing.span("file", "read", path=path) as span:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        span.set("bytes", len(content))
+        return content
+
+
+def atomic_write(path, content):
+    """
+    Writes `content` to `path` through a temporary file in the same directory which is then renamed over `path`.
+    Readers see either the old or the new file, never a partially written or missing one. Symlinks are followed so
+    that dotfiles managed through links keep pointing to the same file.
+    """
+    with tracing.span("file", "write", path=path, bytes=len(content)):
+        _atomic_write(os.path.realpath(path), content)
+
+
+def _atomic_write(path, content):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def remove_file(path):
+    """
+    Removes the file at `path`. Returns False if it did not exist.
+    """
+    with tracing.span("file", "remove", path=path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
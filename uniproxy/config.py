@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class ProxyConfig:
+    """
+    Desired proxy state for Uniproxy.apply(). A `bypass_domains` of None leaves the bypass domains untouched.
+    """
+    ip_address: str
+    port: int
+    enabled: bool = True
+    bypass_domains: Optional[tuple] = None
+
+    def __post_init__(self):
+        if self.bypass_domains is not None:
+            object.__setattr__(self, "bypass_domains", tuple(self.bypass_domains))
+
+
+@dataclass
+class ChangeReport:
+    """
+    Result of Uniproxy.apply(). The flags tell which parts of the state were written, `before` and `after` hold the
+    state as returned by read_state() before and after applying.
+    """
+    endpoint: bool = False
+    enabled: bool = False
+    bypass_domains: bool = False
+    before: dict = field(default_factory=dict)
+    after: dict = field(default_factory=dict)
+
+    @property
+    def changed(self):
+        return self.endpoint or self.enabled or self.bypass_domains
+
+
+def read_state(proxy, bypass_cache=False):
+    """
+    Reads the state of a LinuxProxy, MacProxy or WinProxy as a dict with "enabled", "endpoints" (a dict mapping each
+    protocol to its (ip_address, port) pair, ports as str) and "bypass_domains".
+    """
+    proxy_state = proxy.get_proxy(bypass_cache=bypass_cache) or {}
+    endpoints = {}
+    for protocol, value in proxy_state.items():
+        if isinstance(value, dict):
+            endpoints[protocol] = (value.get("ip_address") or "", str(value.get("port") or ""))
+    return {
+        "enabled": bool(proxy_state.get("is_enable")),
+        "endpoints": endpoints,
+        "bypass_domains": [domain for domain in proxy.get_bypass_domains(bypass_cache=bypass_cache) if domain],
+    }
+
+
+def diff_state(state, config):
+    """
+    Compares a state returned by read_state() with `config` and returns the ChangeReport of what has to be written.
+    """
+    endpoint = (config.ip_address, str(config.port))
+    after = {
+        "enabled": config.enabled,
+        "endpoints": {protocol: endpoint for protocol in state["endpoints"] or ("http", "https")},
+        "bypass_domains": list(config.bypass_domains) if config.bypass_domains is not None
+        else list(state["bypass_domains"]),
+    }
+    return ChangeReport(
+        endpoint=not state["endpoints"] or any(value != endpoint for value in state["endpoints"].values()),
+        enabled=state["enabled"] != config.enabled,
+        bypass_domains=after["bypass_domains"] != list(state["bypass_domains"]),
+        before=state,
+        after=after,
+    )
+
+
+def diff_states(before, after):
+    """
+    Returns the ChangeReport between two states returned by read_state(), e.g. to tell what was changed by someone
+    else.
+    """
+    return ChangeReport(
+        endpoint=before["endpoints"] != after["endpoints"],
+        enabled=before["enabled"] != after["enabled"],
+        bypass_domains=list(before["bypass_domains"]) != list(after["bypass_domains"]),
+        before=before,
+        after=after,
+    )
@@ -0,0 +1,342 @@
+import concurrent.futures
+import errno
+import os
+import selectors
+import socket
+import threading
+import time
+import warnings
+from dataclasses import dataclass
+from typing import Optional
+
+# connect() of a non-blocking socket which is still in progress
+_IN_PROGRESS = {errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, 10035}  # 10035 is WSAEWOULDBLOCK
+# seconds between checks for finished name lookups while connects are in progress
+_LOOKUP_POLL_INTERVAL = 0.01
+
+
+@dataclass
+class ProbeResult:
+    """
+    Outcome of one TCP connect to `ip_address`:`port`. `latency` is the connect time in seconds, None if the connect
+    failed or timed out, in which case `error` says why.
+    """
+    ip_address: str
+    port: int
+    latency: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def endpoint(self):
+        return self.ip_address, self.port
+
+    @property
+    def healthy(self):
+        return self.latency is not None
+
+
+def probe_endpoints(endpoints, timeout=1.0, clock=time.perf_counter):
+    """
+    Connects to all `endpoints`, (ip_address, port) pairs, at the same time with non-blocking sockets and returns a
+    ProbeResult for each, in the order of `endpoints`. Host names are resolved concurrently on worker threads while
+    the endpoints given as IP addresses are already being connected to. Resolving and connecting together take at
+    most `timeout` seconds, a lookup which is still running then is reported as timed out.
+    """
+    deadline = clock() + timeout
+    results = {}
+    selector = selectors.DefaultSelector()
+    resolved, lookups, executor = _start_resolving(endpoints)
+    try:
+        for endpoint, address_info in resolved.items():
+            _connect(selector, results, endpoint, address_info, clock)
+
+        while lookups or selector.get_map():
+            for endpoint in [endpoint for endpoint, lookup in lookups.items() if lookup.done()]:
+                _connect(selector, results, endpoint, _lookup_result(lookups.pop(endpoint)), clock)
+            remaining = deadline - clock()
+            if remaining <= 0:
+                break
+            if not selector.get_map():
+                concurrent.futures.wait(lookups.values(), remaining, return_when=concurrent.futures.FIRST_COMPLETED)
+                continue
+            # finished lookups can't wake up select(), so it is polled while some are running
+            for key, _ in selector.select(min(remaining, _LOOKUP_POLL_INTERVAL) if lookups else remaining):
+                ip_address, port, started = key.data
+                latency = clock() - started
+                code = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                if code == 0:
+                    results[(ip_address, port)] = ProbeResult(ip_address, port, latency=latency)
+                else:
+                    results[(ip_address, port)] = ProbeResult(ip_address, port, error=os.strerror(code))
+
+        for ip_address, port in lookups:
+            results[(ip_address, port)] = ProbeResult(ip_address, port,
+                                                      error=f"name resolution timed out after {timeout}s")
+        for key in list(selector.get_map().values()):
+            ip_address, port, _ = key.data
+            selector.unregister(key.fileobj)
+            key.fileobj.close()
+            results[(ip_address, port)] = ProbeResult(ip_address, port, error=f"timed out after {timeout}s")
+    finally:
+        selector.close()
+        if executor is not None:
+            # lookups still running can't be cancelled, their threads end when getaddrinfo() returns
+            executor.shutdown(wait=False)
+
+    return [results[(ip_address, port)] for ip_address, port in endpoints]
+
+
+def _start_resolving(endpoints):
+    """
+    Converts the IP addresses of `endpoints` in-process and starts looking up the host names on worker threads.
+    Returns the converted endpoints, mapped to their first getaddrinfo() entry or the OSError they failed with, the
+    lookups as futures and the executor running them, None without host names.
+    """
+    resolved = {}
+    lookups = {}
+    executor = None
+    for ip_address, port in dict.fromkeys(endpoints):
+        try:
+            resolved[(ip_address, port)] = socket.getaddrinfo(ip_address, port, type=socket.SOCK_STREAM,
+                                                              flags=socket.AI_NUMERICHOST)[0]
+            continue
+        except socket.gaierror:
+            pass
+        except OSError as e:
+            resolved[(ip_address, port)] = e
+            continue
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=min(len(endpoints), 8),
+                                                             thread_name_prefix="uniproxy-resolve")
+        lookups[(ip_address, port)] = executor.submit(socket.getaddrinfo, ip_address, port, type=socket.SOCK_STREAM)
+    return resolved, lookups, executor
+
+
+def _lookup_result(lookup):
+    error = lookup.exception()
+    if error is None:
+        return lookup.result()[0]
+    return error if isinstance(error, OSError) else OSError(str(error))
+
+
+def _connect(selector, results, endpoint, address_info, clock):
+    """
+    Starts a non-blocking connect to `endpoint`, registering the socket with `selector`, or stores the ProbeResult in
+    `results` if the connect finished or failed right away.
+    """
+    ip_address, port = endpoint
+    try:
+        if isinstance(address_info, OSError):
+            raise address_info
+        family, type_, proto, _, address = address_info
+        sock = socket.socket(family, type_, proto)
+    except OSError as e:
+        results[endpoint] = ProbeResult(ip_address, port, error=str(e))
+        return
+    sock.setblocking(False)
+    started = clock()
+    code = sock.connect_ex(address)
+    if code in _IN_PROGRESS:
+        selector.register(sock, selectors.EVENT_WRITE, (ip_address, port, started))
+        return
+    sock.close()
+    if code == 0:
+        results[endpoint] = ProbeResult(ip_address, port, latency=clock() - started)
+    else:
+        results[endpoint] = ProbeResult(ip_address, port, error=os.strerror(code))
+
+
+class EndpointPool:
+    """
+    Candidate proxy endpoints, (ip_address, port) pairs, ranked by their measured connect latency. The latency of
+    every endpoint is smoothed over the probes (`smoothing` is the weight of the newest one), and the active endpoint is
+    only replaced when it failed `max_failures` probes in a row or another endpoint got faster by more than the
+    `hysteresis` fraction, so the pool does not flap between endpoints of similar speed.
+    """
+
+    def __init__(self, endpoints, timeout=1.0, hysteresis=0.3, max_failures=2, smoothing=0.5):
+        self.endpoints = list(dict.fromkeys(_validate(ip_address, port) for ip_address, port in endpoints))
+        if not self.endpoints:
+            raise ValueError("At least one proxy endpoint is required")
+        self.timeout = timeout
+        self.hysteresis = hysteresis
+        self.max_failures = max_failures
+        self.smoothing = smoothing
+        self.active = None
+        self.switches = 0
+        self.__stats = {endpoint: _EndpointStats() for endpoint in self.endpoints}
+        self.__lock = threading.Lock()
+
+    def probe(self):
+        """
+        Probes all endpoints, updates their statistics and returns the results ranked fastest first, failed endpoints
+        last.
+        """
+        results = probe_endpoints(self.endpoints, self.timeout)
+        with self.__lock:
+            for result in results:
+                self.__stats[result.endpoint].update(result, self.smoothing)
+        return self.rank(results)
+
+    def rank(self, results):
+        healthy = [result for result in results if result.healthy]
+        healthy.sort(key=lambda result: self.__stats[result.endpoint].smoothed_latency)
+        return healthy + [result for result in results if not result.healthy]
+
+    def select(self):
+        """
+        Probes the endpoints and returns the one which should be active, switching `active` when needed. Keeps the
+        active endpoint, or the first one initially, when none is reachable.
+        """
+        ranked = self.probe()
+        with self.__lock:
+            best = ranked[0] if ranked[0].healthy else None
+            if self.active is None:
+                self.active = best.endpoint if best else self.endpoints[0]
+            elif best is not None and best.endpoint != self.active and self.__should_switch(best.endpoint):
+                self.active = best.endpoint
+                self.switches += 1
+            return self.active
+
+    def reachable(self):
+        """
+        Returns True if the active endpoint answered its last probe.
+        """
+        with self.__lock:
+            stats = self.__stats.get(self.active)
+            return stats is not None and stats.probes > 0 and not stats.consecutive_failures
+
+    def __should_switch(self, candidate):
+        active = self.__stats[self.active]
+        if active.consecutive_failures >= self.max_failures:
+            return True
+        if active.smoothed_latency is None or active.consecutive_failures:
+            return False
+        return self.__stats[candidate].smoothed_latency < active.smoothed_latency * (1 - self.hysteresis)
+
+    def metrics(self):
+        """
+        Returns the probe statistics as a dict: the active endpoint, the number of switches and, per "ip:port",
+        the number of probes and failures, the last and the smoothed latency in seconds and the last error.
+        """
+        with self.__lock:
+            return {
+                "active": _format(self.active) if self.active else None,
+                "switches": self.switches,
+                "endpoints": {_format(endpoint): stats.as_dict() for endpoint, stats in self.__stats.items()},
+            }
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.probes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency = None
+        self.smoothed_latency = None
+        self.error = None
+
+    def update(self, result, smoothing):
+        self.probes += 1
+        self.latency = result.latency
+        self.error = result.error
+        if not result.healthy:
+            self.failures += 1
+            self.consecutive_failures += 1
+            return
+        self.consecutive_failures = 0
+        if self.smoothed_latency is None:
+            self.smoothed_latency = result.latency
+        else:
+            self.smoothed_latency += smoothing * (result.latency - self.smoothed_latency)
+
+    def as_dict(self):
+        return {
+            "probes": self.probes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "latency": self.latency,
+            "smoothed_latency": self.smoothed_latency,
+            "error": self.error,
+        }
+
+
+def _validate(ip_address, port):
+    """
+    Returns the endpoint as (ip_address, port) with an int port, raising ValueError if either is missing or invalid.
+    """
+    if not isinstance(ip_address, str) or not ip_address:
+        raise ValueError(f"Invalid proxy address {ip_address!r}, expected a host name or IP address")
+    try:
+        port = int(port)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid port {port!r} for proxy {ip_address}, expected a number") from None
+    if not 0 < port < 65536:
+        raise ValueError(f"Invalid port {port} for proxy {ip_address}, expected 1 to 65535")
+    return ip_address, port
+
+
+def _format(endpoint):
+    ip_address, port = endpoint
+    return f"[{ip_address}]:{port}" if ":" in ip_address else f"{ip_address}:{port}"
+
+
+class EndpointMonitor:
+    """
+    Re-probes `pool` every `interval` seconds on a background thread and calls `on_switch` with the new
+    (ip_address, port) whenever the pool switches its active endpoint. An exception raised by a probe or by `on_switch`
+    does not stop the monitor: it is passed to `on_error`, or reported as a RuntimeWarning without one, and kept in
+    `last_error`. A failed switch is retried after the next probe.
+    """
+
+    def __init__(self, pool, on_switch, interval=10.0, on_error=None):
+        self.pool = pool
+        self.on_switch = on_switch
+        self.interval = interval
+        self.on_error = on_error
+        self.last_error = None
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def start(self):
+        if self.__thread is None:
+            self.__stopped.clear()
+            self.__thread = threading.Thread(target=self.__run, name="uniproxy-endpoints", daemon=True)
+            self.__thread.start()
+        return self
+
+    def stop(self):
+        if self.__thread is not None:
+            self.__stopped.set()
+            self.__thread.join()
+            self.__thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __run(self):
+        # a switch whose on_switch failed is retried after the next probe
+        applied = self.pool.active
+        while not self.__stopped.wait(self.interval):
+            try:
+                endpoint = self.pool.select()
+                if endpoint != applied:
+                    self.on_switch(endpoint)
+                    applied = endpoint
+            except Exception as e:
+                self.__report(e)
+
+    def __report(self, error):
+        self.last_error = error
+        if self.on_error is not None:
+            try:
+                self.on_error(error)
+                return
+            except Exception as e:
+                error = e
+        warnings.warn(f"Proxy endpoint monitoring failed: {error}", RuntimeWarning)
@@ -0,0 +1,50 @@
+import os
+
+from xdg import xdg_config_home
+
+from uniproxy.atomic_file import atomic_write, read_file, remove_file
+
+PROXY_ENV_FILE = "01-proxy.conf"
+BYPASS_DOMAINS_ENV_FILE = "02-bypass-domains.conf"
+
+
+class EnvironmentDWriter:
+    """
+    Keeps files in systemd's user environment.d directory in sync with their desired content. A file is only rewritten
+    when its rendered content differs from the one on disk, and then through an atomic rename so readers never see a
+    half written or missing file.
+    https://www.freedesktop.org/software/systemd/man/latest/environment.d.html
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory if directory is not None else os.path.join(xdg_config_home(), "environment.d")
+
+    def path(self, file_name):
+        return os.path.join(self.directory, file_name)
+
+    def render(self, variables):
+        """
+        Renders a list of (name, value) pairs as the content of an environment.d file.
+        """
+        return "".join(f"{name}={value}\n" for name, value in variables)
+
+    def read(self, file_name):
+        return read_file(self.path(file_name))
+
+    def sync(self, files):
+        """
+        Brings every file in `files`, a dict mapping file names to their content, in line with it. A content of None
+        removes the file. Returns True if anything on disk changed.
+        """
+        changed = False
+        for file_name, content in files.items():
+            path = self.path(file_name)
+            current = read_file(path)
+            if content is None:
+                if current is not None:
+                    remove_file(path)
+                    changed = True
+            elif current != content:
+                atomic_write(path, content)
+                changed = True
+        return changed
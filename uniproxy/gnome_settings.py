@@ -0,0 +1,222 @@
+import shutil
+
+from uniproxy.gvariant import format_gvariant, parse_gvariant
+from uniproxy.process import run_command
+from uniproxy.service_executor import run_concurrently
+
+PROXY_SCHEMA = "org.gnome.system.proxy"
+DCONF_PROXY_DIR = "/system/proxy/"
+
+RESET = object()
+
+
+class GnomeChangeset:
+    """
+    Collects the `org.gnome.system.proxy*` changes of one operation so they can be applied together.
+    """
+
+    def __init__(self):
+        self.changes = {}
+
+    def set(self, schema, key, value):
+        self.changes[(schema, key)] = value
+        return self
+
+    def reset(self, schema, key):
+        self.changes[(schema, key)] = RESET
+        return self
+
+    def by_schema(self):
+        schemas = {}
+        for (schema, key), value in self.changes.items():
+            schemas.setdefault(schema, {})[key] = value
+        return schemas
+
+    def __bool__(self):
+        return bool(self.changes)
+
+
+class GsettingsBackend:
+    """
+    Reads keys with `gsettings get`, or all keys of the proxy schemas with a single `gsettings list-recursively`, and
+    applies a changeset with one `gsettings set`/`gsettings reset` call per key.
+    """
+
+    def __init__(self, gsettings, run_command=run_command):
+        self.gsettings = gsettings
+        self.run_command = run_command
+
+    def get(self, schema, key):
+        output = self.run_command([self.gsettings, "get", schema, key], capture_output=True, text=True).stdout
+        return self.parse_value(output.strip())
+
+    def get_many(self, keys):
+        """
+        Returns a dict mapping each (schema, key) pair of `keys` to its value. Keys of the proxy schemas are read with
+        one `gsettings list-recursively` call, other keys one by one.
+        """
+        keys = list(keys)
+        values = {}
+        if any(self.__is_proxy_schema(schema) for schema, _ in keys):
+            values = self.list_recursively(PROXY_SCHEMA)
+        return {(schema, key): values[(schema, key)] if (schema, key) in values else self.get(schema, key)
+                for schema, key in keys}
+
+    def list_recursively(self, schema):
+        """
+        Returns a dict mapping every (schema, key) pair of `schema` and its child schemas to its value.
+        """
+        output = self.run_command([self.gsettings, "list-recursively", schema], capture_output=True, text=True).stdout
+        values = {}
+        for line in output.splitlines():
+            parts = line.split(" ", 2)
+            if len(parts) == 3:
+                values[(parts[0], parts[1])] = self.parse_value(parts[2])
+        return values
+
+    def __is_proxy_schema(self, schema):
+        return schema == PROXY_SCHEMA or schema.startswith(f"{PROXY_SCHEMA}.")
+
+    def apply(self, changeset, check=False):
+        for (schema, key), value in changeset.changes.items():
+            if value is RESET:
+                self.run_command([self.gsettings, "reset", schema, key], check=check)
+            else:
+                self.run_command([self.gsettings, "set", schema, key, format_gvariant(value)], check=check)
+
+    def parse_value(self, text):
+        try:
+            return parse_gvariant(text)
+        except ValueError:
+            return text
+
+
+class DconfBackend(GsettingsBackend):
+    """
+    Applies the values of a changeset with a single `dconf load /system/proxy/`, which is one process, one dconf commit
+    and one change notification for every GSettings listener. Reads still go through gsettings.
+    """
+
+    def __init__(self, dconf, gsettings, run_command=run_command):
+        super().__init__(gsettings, run_command)
+        self.dconf = dconf
+
+    def apply(self, changeset, check=False):
+        """
+        Loads the new values and runs one `dconf reset` per reset key, all at the same time. A keyfile can only carry
+        values, and writing the schema default would pin it in the user database instead of resetting the key.
+        """
+        writes = []
+        if any(value is not RESET for value in changeset.changes.values()):
+            keyfile = self.keyfile(changeset)
+            writes.append(lambda: self.run_command([self.dconf, "load", DCONF_PROXY_DIR], input=keyfile, text=True,
+                                                   check=check))
+        for (schema, key), value in changeset.changes.items():
+            if value is RESET:
+                path = self.key_path(schema, key)
+                writes.append(lambda path=path: self.run_command([self.dconf, "reset", path], check=check))
+        run_concurrently(writes)
+
+    def keyfile(self, changeset):
+        """
+        Renders the values of the changeset as a dconf keyfile relative to /system/proxy/. Resets are left out.
+        """
+        groups = {}
+        for (schema, key), value in changeset.changes.items():
+            if value is not RESET:
+                groups.setdefault(self.__group(schema), []).append(f"{key}={format_gvariant(value)}")
+
+        return "\n".join(f"[{group}]\n" + "\n".join(lines) + "\n" for group, lines in groups.items())
+
+    def key_path(self, schema, key):
+        """
+        Returns the dconf path of `key` in `schema`, e.g. /system/proxy/http/host.
+        """
+        group = self.__group(schema)
+        return f"{DCONF_PROXY_DIR}{key}" if group == "/" else f"{DCONF_PROXY_DIR}{group}/{key}"
+
+    def __group(self, schema):
+        if schema == PROXY_SCHEMA:
+            return "/"
+        if not schema.startswith(f"{PROXY_SCHEMA}."):
+            raise ValueError(f"{schema} is not stored below {DCONF_PROXY_DIR}")
+        return schema[len(PROXY_SCHEMA) + 1:].replace(".", "/")
+
+
+class GioBackend:
+    """
+    In-process backend built on PyGObject. Holds one Gio.Settings object per schema, reads values as typed GVariants
+    and commits all keys of a schema at once with delay()/apply().
+    """
+
+    def __init__(self, gio, glib):
+        self.gio = gio
+        self.glib = glib
+        self.__settings = {}
+
+    def settings(self, schema):
+        if schema not in self.__settings:
+            self.__settings[schema] = self.gio.Settings.new(schema)
+        return self.__settings[schema]
+
+    def get(self, schema, key):
+        return self.settings(schema).get_value(key).unpack()
+
+    def get_many(self, keys):
+        return {(schema, key): self.get(schema, key) for schema, key in keys}
+
+    def apply(self, changeset, check=False):
+        for schema, values in changeset.by_schema().items():
+            settings = self.settings(schema)
+            settings.delay()
+            try:
+                for key, value in values.items():
+                    if value is RESET:
+                        settings.reset(key)
+                    else:
+                        type_string = settings.get_value(key).get_type_string()
+                        settings.set_value(key, self.glib.Variant(type_string, value))
+                settings.apply()
+            except BaseException:
+                settings.revert()
+                raise
+        if changeset:
+            self.gio.Settings.sync()
+
+
+def import_gio():
+    """
+    Returns the (Gio, GLib) modules of PyGObject, or None if PyGObject is not installed.
+    """
+    try:
+        import gi
+        gi.require_version("Gio", "2.0")
+        from gi.repository import Gio, GLib
+    except (ImportError, ValueError):
+        return None
+
+    # Gio.Settings aborts the process for unknown schemas, so only use it when the proxy schema is installed
+    source = Gio.SettingsSchemaSource.get_default()
+    if source is None or source.lookup(PROXY_SCHEMA, True) is None:
+        return None
+    return Gio, GLib
+
+
+def get_gnome_backend(run_command=run_command, in_flatpak=False, which=shutil.which):
+    """
+    Picks the fastest available backend: in-process Gio if PyGObject is importable, otherwise dconf for writes with
+    gsettings for reads, otherwise gsettings alone. Inside flatpak only the command line tools reach the host's
+    settings, so Gio is not used there.
+    """
+    gio = None if in_flatpak else import_gio()
+    if gio is not None:
+        return GioBackend(*gio)
+
+    gsettings = which("gsettings")
+    if not gsettings:
+        raise FileNotFoundError("gsettings not found in PATH")
+
+    dconf = which("dconf")
+    if dconf:
+        return DconfBackend(dconf, gsettings, run_command)
+    return GsettingsBackend(gsettings, run_command)
@@ -0,0 +1,130 @@
+def format_gvariant(value):
+    """
+    Formats a python value as GVariant text, the format understood by `gsettings set` and `dconf load`.
+    Supports booleans, integers, strings and lists of strings.
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        escaped = value.replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n")
+        return f"'{escaped}'"
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return "@as []"
+        return f"[{', '.join(format_gvariant(item) for item in value)}]"
+    raise TypeError(f"Unsupported GVariant value: {value!r}")
+
+
+_TYPE_KEYWORDS = {"boolean", "byte", "int16", "uint16", "int32", "uint32", "int64", "uint64", "handle", "double",
+                  "string", "objectpath", "signature"}
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "a": "\a", "\\": "\\", "'": "'",
+            '"': '"'}
+
+
+def parse_gvariant(text):
+    """
+    Parses GVariant text as printed by `gsettings get` and `gsettings list-recursively` into python values. Supports
+    booleans, numbers (also with a type keyword like `uint32 8080`), strings, arrays, tuples, `nothing` and type
+    annotations like `@as []`. Raises ValueError for anything else.
+    """
+    parser = _GVariantParser(text)
+    value = parser.value()
+    parser.skip_spaces()
+    if parser.position != len(text):
+        raise ValueError(f"Unexpected text after GVariant value: {text[parser.position:]!r}")
+    return value
+
+
+class _GVariantParser:
+    def __init__(self, text):
+        self.text = text
+        self.position = 0
+
+    def skip_spaces(self):
+        while self.position < len(self.text) and self.text[self.position].isspace():
+            self.position += 1
+
+    def peek(self):
+        self.skip_spaces()
+        return self.text[self.position] if self.position < len(self.text) else ""
+
+    def word(self):
+        start = self.position
+        while self.position < len(self.text) and (self.text[self.position].isalnum()
+                                                  or self.text[self.position] in "_.+-"):
+            self.position += 1
+        return self.text[start:self.position]
+
+    def value(self):
+        char = self.peek()
+        if char == "@":  # type annotation, the value itself carries enough information
+            while self.position < len(self.text) and not self.text[self.position].isspace():
+                self.position += 1
+            return self.value()
+        if char in "'\"":
+            return self.string(char)
+        if char == "[":
+            return self.sequence("[", "]")
+        if char == "(":
+            return tuple(self.sequence("(", ")"))
+        if not char:
+            raise ValueError("Unexpected end of GVariant text")
+
+        word = self.word()
+        if word in _TYPE_KEYWORDS:
+            return self.value()
+        if word == "true":
+            return True
+        if word == "false":
+            return False
+        if word == "nothing":  # empty maybe value
+            return None
+        try:
+            return int(word, 0)
+        except ValueError:
+            pass
+        try:
+            return float(word)
+        except ValueError:
+            raise ValueError(f"Unsupported GVariant value at {self.text[self.position - len(word):]!r}") from None
+
+    def sequence(self, opening, closing):
+        self.position += 1
+        items = []
+        while True:
+            char = self.peek()
+            if char == closing:
+                self.position += 1
+                return items
+            if items:
+                if char != ",":
+                    raise ValueError(f"Expected ',' or '{closing}' in GVariant text {self.text!r}")
+                self.position += 1
+                if self.peek() == closing:  # one element tuples like `(1,)`
+                    continue
+            items.append(self.value())
+
+    def string(self, quote):
+        self.position += 1
+        chars = []
+        while self.position < len(self.text):
+            char = self.text[self.position]
+            self.position += 1
+            if char == quote:
+                return "".join(chars)
+            if char == "\\" and self.position < len(self.text):
+                escape = self.text[self.position]
+                self.position += 1
+                if escape == "u":
+                    chars.append(chr(int(self.text[self.position:self.position + 4], 16)))
+                    self.position += 4
+                elif escape == "U":
+                    chars.append(chr(int(self.text[self.position:self.position + 8], 16)))
+                    self.position += 8
+                else:
+                    chars.append(_ESCAPES.get(escape, escape))
+            else:
+                chars.append(char)
+        raise ValueError(f"Unterminated string in GVariant text {self.text!r}")
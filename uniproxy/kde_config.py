@@ -0,0 +1,226 @@
+import os
+import re
+import socket
+import subprocess
+import time
+from contextlib import contextmanager
+
+from xdg import xdg_config_home
+
+from uniproxy.atomic_file import atomic_write, read_file, remove_file
+from uniproxy.process import run_command
+from uniproxy.snapshot import process_alive
+
+KIOSLAVERC = "kioslaverc"
+PROXY_SETTINGS_GROUP = "Proxy Settings"
+
+_ESCAPES = {"s": " ", "t": "\t", "n": "\n", "r": "\r", "\\": "\\", ";": ";", ",": ","}
+_ENTRY_RE = re.compile(r'^\s*([^=\[]+?)\s*=(.*)$')
+
+
+def unescape_value(value):
+    """
+    Converts a value as stored in a KConfig file to the string it represents.
+    """
+    result = []
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char == "\\" and i + 1 < len(value):
+            escape = value[i + 1]
+            if escape in _ESCAPES:
+                result.append(_ESCAPES[escape])
+                i += 2
+                continue
+            if escape == "x" and re.match(r'[0-9a-fA-F]{2}', value[i + 2:i + 4]):
+                result.append(chr(int(value[i + 2:i + 4], 16)))
+                i += 4
+                continue
+        result.append(char)
+        i += 1
+    return "".join(result)
+
+
+def escape_value(value):
+    """
+    Converts a string to the form KConfig writes it in, which is what kwriteconfig would have stored.
+    """
+    result = []
+    for i, char in enumerate(value):
+        if char == "\\":
+            result.append("\\\\")
+        elif char == "\n":
+            result.append("\\n")
+        elif char == "\t":
+            result.append("\\t")
+        elif char == "\r":
+            result.append("\\r")
+        elif char == " " and (i == 0 or i == len(value) - 1):
+            result.append("\\s")
+        elif ord(char) < 32:
+            result.append(f"\\x{ord(char):02x}")
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+@contextmanager
+def kconfig_lock(path, timeout=10.0, stale_after=30.0):
+    """
+    Holds `<path>.lock` the way KConfig does (a QLockFile): the lock file is created exclusively and holds the pid, the
+    application name and the host name of its owner. A lock whose owner is gone, or which is older than `stale_after`
+    seconds, is taken over. Raises TimeoutError if the lock could not be taken within `timeout` seconds.
+    """
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            break
+        except FileExistsError:
+            if _lock_is_stale(lock_path, stale_after):
+                remove_file(lock_path)
+                continue
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"{lock_path} is held by another process") from None
+            time.sleep(0.05)
+
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(f"{os.getpid()}\nuniproxy\n{socket.gethostname()}\n")
+        yield
+    finally:
+        remove_file(lock_path)
+
+
+def _lock_is_stale(lock_path, stale_after):
+    try:
+        with open(lock_path, "r", encoding="utf-8") as f:
+            owner = f.read().splitlines()
+        age = time.time() - os.stat(lock_path).st_mtime
+    except FileNotFoundError:
+        return False
+    except (OSError, UnicodeDecodeError):
+        return True
+    if age > stale_after:
+        return True
+    if len(owner) < 3 or not owner[0].isdigit():
+        # the owner may not have written the lock file yet
+        return False
+    return owner[2] == socket.gethostname() and not process_alive(int(owner[0]))
+
+
+class KdeConfig:
+    """
+    In-process reader and writer for a KConfig ini file such as kioslaverc. Only the entries being written are
+    touched, every other line (unknown groups, comments, localized or flagged keys) is kept exactly as it was.
+    """
+
+    def __init__(self, file_name=KIOSLAVERC, path=None):
+        self.path = path if path is not None else os.path.join(xdg_config_home(), file_name)
+
+    def read(self, group, keys):
+        """
+        Returns the values of `keys` in `group`. Keys which are not present are returned as empty strings, the same as
+        kreadconfig does.
+        """
+        entries = self.read_group(group)
+        return {key: entries.get(key, "") for key in keys}
+
+    def read_group(self, group):
+        """
+        Returns all plain (non-localized) entries of `group` in a dict.
+        """
+        content = read_file(self.path) or ""
+        entries = {}
+        current_group = None
+        for line in content.splitlines():
+            stripped = line.strip()
+            if stripped.startswith("["):
+                current_group = self.__group_name(stripped)
+                continue
+            if current_group != group:
+                continue
+            match = _ENTRY_RE.match(line)
+            if match and not stripped.startswith("#"):
+                entries[match.group(1)] = unescape_value(match.group(2).strip())
+        return entries
+
+    def write(self, group, entries):
+        """
+        Writes all `entries` into `group` with a single atomic file replacement, holding the KConfig lock file from the
+        read to the replacement. A key which occurs several times in the group is written once and its duplicates are
+        dropped. Returns True if the file changed.
+        """
+        with kconfig_lock(self.path):
+            return self.__write(group, entries)
+
+    def __write(self, group, entries):
+        content = read_file(self.path) or ""
+        lines = content.splitlines()
+        pending = dict(entries)
+        duplicates = []
+
+        # KConfig merges repeated sections of a group, so entries are looked up in all of them while new keys are
+        # appended to the first one
+        group_start = None
+        group_end = None
+        in_group = False
+        for index, line in enumerate(lines):
+            stripped = line.strip()
+            if stripped.startswith("["):
+                if in_group and group_end is None:
+                    group_end = index
+                in_group = self.__group_name(stripped) == group
+                if in_group and group_start is None:
+                    group_start = index
+                continue
+            if not in_group or stripped.startswith("#"):
+                continue
+            match = _ENTRY_RE.match(line)
+            if match and match.group(1) in pending:
+                key = match.group(1)
+                lines[index] = f"{key}={escape_value(pending.pop(key))}"
+            elif match and match.group(1) in entries:
+                duplicates.append(index)
+
+        for index in reversed(duplicates):
+            del lines[index]
+            if group_end is not None and index < group_end:
+                group_end -= 1
+
+        new_lines = [f"{key}={escape_value(value)}" for key, value in pending.items()]
+        if new_lines:
+            if group_start is None:
+                if lines and lines[-1].strip():
+                    lines.append("")
+                lines.append(f"[{group}]")
+                lines.extend(new_lines)
+            else:
+                insert_at = len(lines) if group_end is None else group_end
+                while insert_at - 1 > group_start and not lines[insert_at - 1].strip():
+                    insert_at -= 1
+                lines[insert_at:insert_at] = new_lines
+
+        new_content = "\n".join(lines) + "\n"
+        if new_content == content:
+            return False
+
+        atomic_write(self.path, new_content)
+        return True
+
+    def __group_name(self, header):
+        return header[1:header.rfind("]")] if header.endswith("]") else header[1:]
+
+
+def notify_kio(run_command=run_command):
+    """
+    Asks running KIO workers to reparse their configuration, so that proxy changes are picked up without a restart.
+    """
+    try:
+        run_command(["dbus-send", "--session", "--type=signal", "/KIO/Scheduler",
+                     "org.kde.KIO.Scheduler.reparseSlaveConfiguration", "string:"],
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        pass
@@ -1,58 +1,116 @@
 import os
 import subprocess
 import re
-import ast
-import shutil
-from xdg import xdg_config_home
+
+from uniproxy.environment_d import BYPASS_DOMAINS_ENV_FILE, PROXY_ENV_FILE, EnvironmentDWriter
+from uniproxy.gnome_settings import DCONF_PROXY_DIR, GnomeChangeset, PROXY_SCHEMA, get_gnome_backend
+from uniproxy.kde_config import KdeConfig, PROXY_SETTINGS_GROUP, notify_kio
+from uniproxy.probe import get_probe
+from uniproxy.process import run_command
+from uniproxy.refresh_scheduler import RefreshScheduler, deferred_refresh
+from uniproxy.service_executor import run_concurrently
+from uniproxy.state_cache import StateCache, cached_state
+from uniproxy.watch import CommandSource, InotifySource, PollingSource
 
 
 class LinuxProxy:
-    def __init__(self, ip_address, port):
+    def __init__(self, ip_address, port, probe=None, refresh_debounce=0, state_ttl=1.0):
         self.ip_address = ip_address
         self.port = port
-
-        self.__is_gnome = self.__is_gnome()
-        self.__is_kde = self.__is_kde()
+        self.probe = probe if probe is not None else get_probe()
+        # `systemctl --user daemon-reload` runs at most once per public operation, or once per debounce window
+        self.refresh_scheduler = RefreshScheduler(self.__daemon_reload, refresh_debounce)
+        self.env_writer = EnvironmentDWriter()
+        # reads of the desktop settings are cached for `state_ttl` seconds and dropped on every write of this instance
+        self.state_cache = StateCache(state_ttl)
+
+        self.__is_gnome = self.probe.is_gnome
+        self.__is_kde = self.probe.is_kde
+        self.__kde_config = KdeConfig()
+        self.__gnome_backend = None
 
         if not self.__is_gnome and not self.__is_kde:
             raise OSError("This library requires GNOME, KDE or Cinnamon desktop environment")
 
-    def __is_gnome(self):
-        desktop = os.environ.get("XDG_CURRENT_DESKTOP", "").lower()
-        return "gnome" in desktop or "cinnamon" in desktop
-    def __is_kde(self):
-        return "kde" in os.environ.get("XDG_CURRENT_DESKTOP", "").lower()
+    def batch(self):
+        """
+        Groups several operations so they trigger at most one daemon-reload, see RefreshScheduler.batch().
+        """
+        return self.refresh_scheduler.batch()
 
     def __get_kde_command(self, command):
-        kde_version = os.environ.get("KDE_SESSION_VERSION", "5")
-        cmd_name = f"{command}{kde_version}"
-        abs_path = shutil.which(cmd_name)
+        cmd_name = f"{command}{self.probe.kde_version}"
+        abs_path = self.probe.which(cmd_name)
         if not abs_path:
             raise FileNotFoundError(f"{cmd_name} not found in PATH")
         return abs_path
 
-    def __get_gsettings_command(self):
-        abs_path = shutil.which("gsettings")
-        if not abs_path:
-            raise FileNotFoundError("gsettings not found in PATH")
-        return abs_path
+    def __write_kde(self, entries, check=False):
+        """
+        Writes all `entries` to the Proxy Settings group of kioslaverc. Outside of flatpak the file is edited
+        in-process with a single atomic write followed by one KIO notification. Inside flatpak the sandbox has its own
+        copy of the config directory, so kwriteconfig is run on the host instead.
+        """
+        try:
+            if self.probe.in_flatpak:
+                kde_command = self.__get_kde_command("kwriteconfig")
+                for key, value in entries.items():
+                    self._run_command([kde_command, "--file", "kioslaverc", "--group", PROXY_SETTINGS_GROUP, "--key", key, value], check=check)
+            elif self.__kde_config.write(PROXY_SETTINGS_GROUP, entries):
+                notify_kio(self._run_command)
+        finally:
+            self.state_cache.invalidate()
+
+    def __read_kde(self, keys):
+        """
+        Reads `keys` from the Proxy Settings group of kioslaverc, see __write_kde() for how flatpak is handled.
+        """
+        if self.probe.in_flatpak:
+            kde_command = self.__get_kde_command("kreadconfig")
+            return {
+                key: self._run_command([kde_command, "--file", "kioslaverc", "--group", PROXY_SETTINGS_GROUP, "--key", key], capture_output=True, text=True).stdout.strip()
+                for key in keys
+            }
+        return self.__kde_config.read(PROXY_SETTINGS_GROUP, keys)
+
+    def __get_gnome_backend(self):
+        """
+        Returns the GNOME settings backend, which is chosen once on first use. See get_gnome_backend() for the order
+        in which backends are tried.
+        """
+        if self.__gnome_backend is None:
+            self.__gnome_backend = get_gnome_backend(self._run_command, self.probe.in_flatpak, self.probe.which)
+        return self.__gnome_backend
 
+    def __apply_gnome(self, changeset, check=False):
+        try:
+            self.__get_gnome_backend().apply(changeset, check=check)
+        finally:
+            self.state_cache.invalidate()
+
+    def __write_settings(self, kde_entries, changeset):
+        """
+        Writes `kde_entries` to kioslaverc on KDE and `changeset` to the GNOME settings, which KDE also keeps for GTK
+        applications. The two stores are independent, so on KDE both writes run concurrently.
+        """
+        writers = []
+        if self.__is_kde and kde_entries:
+            writers.append(lambda: self.__write_kde(kde_entries))
+        if (self.__is_gnome or self.__is_kde) and changeset:
+            writers.append(lambda: self.__apply_gnome(changeset))
+        run_concurrently(writers)
+
+    @deferred_refresh
     def set_proxy(self):
-        if self.__is_kde:
-            self.__set_kde_proxy()
-        if self.__is_gnome or self.__is_kde:
-            self.__set_gnome_proxy()
+        self.__write_settings(self.__kde_proxy_entries(), self.__gnome_proxy_changeset(GnomeChangeset()))
 
         if self.get_enable():
             self.set_proxy_env_var()
 
+    @deferred_refresh
     def set_enable(self, is_enable):
-        if self.__is_kde:
-            kde_command = self.__get_kde_command("kwriteconfig")
-            self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "ProxyType", "1" if is_enable else "0"])
-        if self.__is_gnome or self.__is_kde:
-            gsettings = self.__get_gsettings_command()
-            self._run_command([gsettings, "set", "org.gnome.system.proxy", "mode", "manual" if is_enable else "none"])
+        self.__write_settings({"ProxyType": "1" if is_enable else "0"},
+                              GnomeChangeset().set(PROXY_SCHEMA, "mode", "manual" if is_enable else "none"))
 
         if is_enable:
             self.set_proxy_env_var()
@@ -61,56 +119,116 @@ class LinuxProxy:
             self.unset_proxy_env_var()
             self.unset_bypass_domains_env_var()
 
-    def __set_kde_proxy(self):
-        kde_command = self.__get_kde_command("kwriteconfig")
-        self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "httpProxy", f"http://{self.ip_address} {self.port}"])
-        self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "httpsProxy", f"http://{self.ip_address} {self.port}"])
-        self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "ftpProxy", f"ftp://{self.ip_address} {self.port}"])
-
-    def __set_gnome_proxy(self):
-        gsettings = self.__get_gsettings_command()
-        self._run_command([gsettings, "set", "org.gnome.system.proxy.http", "host", self.ip_address])
-        self._run_command([gsettings, "set", "org.gnome.system.proxy.http", "port", str(self.port)])
-        self._run_command([gsettings, "set", "org.gnome.system.proxy.https", "host", self.ip_address])
-        self._run_command([gsettings, "set", "org.gnome.system.proxy.https", "port", str(self.port)])
-        self._run_command([gsettings, "set", "org.gnome.system.proxy.ftp", "host", self.ip_address])
-        self._run_command([gsettings, "set", "org.gnome.system.proxy.ftp", "port", str(self.port)])
+    def __kde_proxy_entries(self):
+        if not self.ip_address:
+            return {"httpProxy": "", "httpsProxy": "", "ftpProxy": ""}
+        return {
+            "httpProxy": f"http://{self.ip_address} {self.port}",
+            "httpsProxy": f"http://{self.ip_address} {self.port}",
+            "ftpProxy": f"ftp://{self.ip_address} {self.port}",
+        }
 
+    def __gnome_proxy_changeset(self, changeset):
+        for protocol in ["http", "https", "ftp"]:
+            if not self.ip_address:
+                changeset.reset(f"{PROXY_SCHEMA}.{protocol}", "host")
+                changeset.reset(f"{PROXY_SCHEMA}.{protocol}", "port")
+                continue
+            changeset.set(f"{PROXY_SCHEMA}.{protocol}", "host", self.ip_address)
+            changeset.set(f"{PROXY_SCHEMA}.{protocol}", "port", int(self.port))
+        return changeset
+
+    @deferred_refresh
     def set_bypass_domains(self, domains: list[str]):
-        if self.__is_kde:
-            kde_command = self.__get_kde_command("kwriteconfig")
-            self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "NoProxyFor", ','.join(domains)])
-        if self.__is_gnome or self.__is_kde:
-            gsettings = self.__get_gsettings_command()
-            self._run_command([gsettings, "set", "org.gnome.system.proxy", "ignore-hosts", self.format_domains(domains)])
+        self.__write_settings({"NoProxyFor": ','.join(domains)},
+                              GnomeChangeset().set(PROXY_SCHEMA, "ignore-hosts", list(domains)))
 
         if self.get_enable():
             self.set_bypass_domains_env_var()
 
+    @deferred_refresh
+    def apply_config(self, config, report):
+        """
+        Writes the parts of `config` flagged in `report` (see Uniproxy.apply()) with at most one kioslaverc write and
+        one GNOME settings apply, run concurrently, and one daemon-reload. `self.ip_address` and `self.port` must already
+        match `config`, an empty ip address clears the proxy server.
+        """
+        kde_entries = {}
+        changeset = GnomeChangeset()
+        if report.endpoint:
+            kde_entries.update(self.__kde_proxy_entries())
+            self.__gnome_proxy_changeset(changeset)
+        if report.enabled:
+            kde_entries["ProxyType"] = "1" if config.enabled else "0"
+            changeset.set(PROXY_SCHEMA, "mode", "manual" if config.enabled else "none")
+        if report.bypass_domains:
+            kde_entries["NoProxyFor"] = ','.join(report.after["bypass_domains"])
+            changeset.set(PROXY_SCHEMA, "ignore-hosts", list(report.after["bypass_domains"]))
+
+        self.__write_settings(kde_entries, changeset)
+
+        if not config.enabled:
+            if report.enabled:
+                self.unset_proxy_env_var()
+                self.unset_bypass_domains_env_var()
+            return
+        if report.endpoint or report.enabled:
+            self.set_proxy_env_var()
+        if report.bypass_domains or report.enabled:
+            self.set_bypass_domains_env_var(report.after["bypass_domains"])
+
+    def change_sources(self, poll_interval=2.0):
+        """
+        Returns the sources reporting changes of the proxy settings, see uniproxy.watch. On KDE kioslaverc and the
+        environment.d files are watched with inotify, on GNOME a single `dconf watch` process reports every write.
+        """
+        sources = []
+        if self.__is_kde and self.probe.in_flatpak:
+            # kioslaverc is read on the host, the sandbox can't watch it
+            return [PollingSource(poll_interval)]
+
+        if InotifySource.is_supported():
+            paths = [self.env_writer.path(PROXY_ENV_FILE), self.env_writer.path(BYPASS_DOMAINS_ENV_FILE)]
+            if self.__is_kde:
+                paths.append(self.__kde_config.path)
+            sources.append(InotifySource(paths))
+        elif self.__is_kde:
+            sources.append(PollingSource(poll_interval))
+
+        if self.__is_gnome and not self.__is_kde:
+            dconf = self.probe.which("dconf")
+            gsettings = self.probe.which("gsettings")
+            prefix = ["flatpak-spawn", "--host"] if self.probe.in_flatpak else []
+            if dconf:
+                sources.append(CommandSource(prefix + [dconf, "watch", DCONF_PROXY_DIR]))
+            elif gsettings:
+                for schema in [PROXY_SCHEMA] + [f"{PROXY_SCHEMA}.{protocol}" for protocol in ["http", "https", "ftp"]]:
+                    sources.append(CommandSource(prefix + [gsettings, "monitor", schema]))
+            else:
+                sources.append(PollingSource(poll_interval))
+        return sources
+
+    @cached_state
     def get_proxy(self):
-        is_enable = self.get_enable()
         if self.__is_kde:
+            is_enable = self.get_enable()
             kde_proxy = self.__get_kde_proxy()
             return {"is_enable": is_enable, **kde_proxy}
         elif self.__is_gnome:
-            gnome_proxy = self.__get_gnome_proxy()
-            return {"is_enable": is_enable, **gnome_proxy}
+            return self.__get_gnome_proxy()
 
+    @cached_state
     def get_enable(self):
         if self.__is_kde:
-            kde_command = self.__get_kde_command("kreadconfig")
-            output = self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "ProxyType"], capture_output=True, text=True)
-            return output.stdout.strip() == "1"
+            return self.__read_kde(["ProxyType"])["ProxyType"] == "1"
         elif self.__is_gnome:
-            gsettings = self.__get_gsettings_command()
-            output = self._run_command([gsettings, "get", "org.gnome.system.proxy", "mode"], capture_output=True, text=True)
-            return output.stdout.strip() == "manual"
+            return self.__get_gnome_backend().get(PROXY_SCHEMA, "mode") == "manual"
 
     def __get_kde_proxy(self):
-        kde_command = self.__get_kde_command("kreadconfig")
-        http_proxy = self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "httpProxy"], capture_output=True, text=True).stdout.strip()
-        https_proxy = self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "httpsProxy"], capture_output=True, text=True).stdout.strip()
-        ftp_proxy = self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "ftpProxy"], capture_output=True, text=True).stdout.strip()
+        entries = self.__read_kde(["httpProxy", "httpsProxy", "ftpProxy"])
+        http_proxy = entries["httpProxy"]
+        https_proxy = entries["httpsProxy"]
+        ftp_proxy = entries["ftpProxy"]
 
         http_proxy_ip_address, http_proxy_port = self.extract_ip_and_port(http_proxy)
         https_proxy_ip_address, https_proxy_port = self.extract_ip_and_port(https_proxy)
@@ -132,15 +250,19 @@ class LinuxProxy:
         }
 
     def __get_gnome_proxy(self):
-        gsettings = self.__get_gsettings_command()
-        http_proxy_ip_address = self._run_command([gsettings, "get", "org.gnome.system.proxy.http", "host"], capture_output=True, text=True).stdout.strip()
-        http_proxy_port = self._run_command([gsettings, "get", "org.gnome.system.proxy.http", "port"], capture_output=True, text=True).stdout.strip()
-        https_proxy_ip_address = self._run_command([gsettings, "get", "org.gnome.system.proxy.https", "host"], capture_output=True, text=True).stdout.strip()
-        https_proxy_port = self._run_command([gsettings, "get", "org.gnome.system.proxy.https", "port"], capture_output=True, text=True).stdout.strip()
-        ftp_proxy_ip_address = self._run_command([gsettings, "get", "org.gnome.system.proxy.ftp", "host"], capture_output=True, text=True).stdout.strip()
-        ftp_proxy_port = self._run_command([gsettings, "get", "org.gnome.system.proxy.ftp", "port"], capture_output=True, text=True).stdout.strip()
+        keys = [(PROXY_SCHEMA, "mode")]
+        keys += [(f"{PROXY_SCHEMA}.{protocol}", key) for protocol in ["http", "https", "ftp"] for key in ["host", "port"]]
+        values = self.__get_gnome_backend().get_many(keys)
+
+        http_proxy_ip_address = values[(f"{PROXY_SCHEMA}.http", "host")]
+        http_proxy_port = str(values[(f"{PROXY_SCHEMA}.http", "port")])
+        https_proxy_ip_address = values[(f"{PROXY_SCHEMA}.https", "host")]
+        https_proxy_port = str(values[(f"{PROXY_SCHEMA}.https", "port")])
+        ftp_proxy_ip_address = values[(f"{PROXY_SCHEMA}.ftp", "host")]
+        ftp_proxy_port = str(values[(f"{PROXY_SCHEMA}.ftp", "port")])
 
         return {
+            "is_enable": values[(PROXY_SCHEMA, "mode")] == "manual",
             "http": {
                 "ip_address": http_proxy_ip_address,
                 "port": http_proxy_port
@@ -155,18 +277,14 @@ class LinuxProxy:
             }
         }
 
+    @cached_state
     def get_bypass_domains(self):
         if self.__is_kde:
-            kde_command = self.__get_kde_command("kreadconfig")
-            output = self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "NoProxyFor"], capture_output=True, text=True)
-            output = output.stdout.strip()
+            output = self.__read_kde(["NoProxyFor"])["NoProxyFor"]
             bypass_domains = output.split(",") if output else []
             return bypass_domains
         elif self.__is_gnome:
-            gsettings = self.__get_gsettings_command()
-            output = self._run_command([gsettings, "get", "org.gnome.system.proxy", "ignore-hosts"], capture_output=True, text=True)
-            output = output.stdout.strip()
-            return ast.literal_eval(output)
+            return list(self.__get_gnome_backend().get(PROXY_SCHEMA, "ignore-hosts"))
 
     def extract_ip_and_port(self, proxy):
         match = re.match(r'(http|https|ftp)://([\d\.]+)\s+(\d+)', proxy)
@@ -176,118 +294,99 @@ class LinuxProxy:
             return ip_address, port
         return None, None
 
-    def format_domains(self, domains):
-        formatted_domains = [f"'{domain}'" for domain in domains]
-        return f"[{', '.join(formatted_domains)}]"
-
+    @deferred_refresh
     def join(self):
         self.set_proxy()
         self.set_enable(True)
 
+    @deferred_refresh
     def del_proxy(self):
         if self.__is_kde:
-            kde_command = self.__get_kde_command("kwriteconfig")
             try:
-                self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "ProxyType", "0"], check=True)
-                self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "httpProxy", ""], check=True)
-                self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "httpsProxy", ""], check=True)
-                self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "ftpProxy", ""], check=True)
-                self._run_command([kde_command, "--file", "kioslaverc", "--group", "Proxy Settings", "--key", "NoProxyFor", "localhost,127.0.0.0/8,::1"], check=True)
-            except subprocess.CalledProcessError as e:
+                self.__write_kde({
+                    "ProxyType": "0",
+                    "httpProxy": "",
+                    "httpsProxy": "",
+                    "ftpProxy": "",
+                    "NoProxyFor": "localhost,127.0.0.0/8,::1",
+                }, check=True)
+            except (subprocess.CalledProcessError, OSError) as e:
                 print(f"Error deleting proxy: {e}")
         if self.__is_gnome or self.__is_kde:
             try:
-                gsettings = self.__get_gsettings_command()
-                self._run_command([gsettings, "set", "org.gnome.system.proxy", "mode", "none"], check=True)
-                self._run_command([gsettings, "reset", "org.gnome.system.proxy.http", "host"], check=True)
-                self._run_command([gsettings, "reset", "org.gnome.system.proxy.http", "port"], check=True)
-                self._run_command([gsettings, "reset", "org.gnome.system.proxy.https", "host"], check=True)
-                self._run_command([gsettings, "reset", "org.gnome.system.proxy.https", "port"], check=True)
-                self._run_command([gsettings, "reset", "org.gnome.system.proxy.ftp", "host"], check=True)
-                self._run_command([gsettings, "reset", "org.gnome.system.proxy.ftp", "port"], check=True)
-                self._run_command([gsettings, "reset", "org.gnome.system.proxy", "ignore-hosts"], check=True)
+                changeset = GnomeChangeset().set(PROXY_SCHEMA, "mode", "none")
+                for protocol in ["http", "https", "ftp"]:
+                    changeset.reset(f"{PROXY_SCHEMA}.{protocol}", "host")
+                    changeset.reset(f"{PROXY_SCHEMA}.{protocol}", "port")
+                changeset.reset(PROXY_SCHEMA, "ignore-hosts")
+                self.__apply_gnome(changeset, check=True)
             except subprocess.CalledProcessError as e:
                 print(f"Error deleting proxy: {e}")
 
         self.unset_proxy_env_var()
         self.unset_bypass_domains_env_var()
 
+    @deferred_refresh
     def set_proxy_env_var(self):
         """
         Sets the proxy environment variables. Only works on Systemd based systems.
         """
-        xdg_config_home_path = xdg_config_home()
-        env_dir = os.path.join(xdg_config_home_path, "environment.d")
-        env_file_path = os.path.join(env_dir, "01-proxy.conf")
-
-        # Ensure the environment.d directory exists
-        os.makedirs(env_dir, exist_ok=True)
-
-        self.unset_proxy_env_var()
-
-        with open(env_file_path, "w") as f:
-            # https://www.freedesktop.org/software/systemd/man/latest/environment.d.html
-            f.write(f"http_proxy=http://{self.ip_address}:{self.port}\n")
-            f.write(f"https_proxy=http://{self.ip_address}:{self.port}\n")
-            f.write(f"ftp_proxy=ftp://{self.ip_address}:{self.port}\n")
-            f.write(f"rsync_proxy=rsync://{self.ip_address}:{self.port}\n")
-            f.write(f"HTTP_PROXY=http://{self.ip_address}:{self.port}\n")
-            f.write(f"HTTPS_PROXY=http://{self.ip_address}:{self.port}\n")
-            f.write(f"FTP_PROXY=ftp://{self.ip_address}:{self.port}\n")
-            f.write(f"RSYNC_PROXY=rsync://{self.ip_address}:{self.port}\n")
-
-        self.refresh_env_var()
-
+        content = self.env_writer.render([
+            ("http_proxy", f"http://{self.ip_address}:{self.port}"),
+            ("https_proxy", f"http://{self.ip_address}:{self.port}"),
+            ("ftp_proxy", f"ftp://{self.ip_address}:{self.port}"),
+            ("rsync_proxy", f"rsync://{self.ip_address}:{self.port}"),
+            ("HTTP_PROXY", f"http://{self.ip_address}:{self.port}"),
+            ("HTTPS_PROXY", f"http://{self.ip_address}:{self.port}"),
+            ("FTP_PROXY", f"ftp://{self.ip_address}:{self.port}"),
+            ("RSYNC_PROXY", f"rsync://{self.ip_address}:{self.port}"),
+        ])
+        if self.env_writer.sync({PROXY_ENV_FILE: content}):
+            self.refresh_env_var()
+
+    @deferred_refresh
     def unset_proxy_env_var(self):
-        xdg_config_home_path = xdg_config_home()
-        env_file_path = os.path.join(xdg_config_home_path, "environment.d", "01-proxy.conf")
-
-        try:
-            os.remove(env_file_path)
-        except FileNotFoundError:
-            pass
-
-        self.refresh_env_var()
+        if self.env_writer.sync({PROXY_ENV_FILE: None}):
+            self.refresh_env_var()
 
-    def set_bypass_domains_env_var(self):
+    @deferred_refresh
+    def set_bypass_domains_env_var(self, domains=None):
         """
-        Sets the domains which bypass the proxy. Only works on Systemd based systems.
+        Sets the domains which bypass the proxy, `domains` or else the ones in the desktop settings. Only works on
+        Systemd based systems.
         """
-        xdg_config_home_path = xdg_config_home()
-        env_file_path = os.path.join(xdg_config_home_path, "environment.d", "02-bypass-domains.conf")
-
-        self.unset_bypass_domains_env_var()
-
-        with open(env_file_path, "a") as f:
-            # https://www.freedesktop.org/software/systemd/man/latest/environment.d.html
-            f.write(f"no_proxy={','.join(self.get_bypass_domains())}\n")
-            f.write(f"NO_PROXY={','.join(self.get_bypass_domains())}\n")
-
-        self.refresh_env_var()
-
+        bypass_domains = ','.join(self.get_bypass_domains() if domains is None else domains)
+        content = self.env_writer.render([
+            ("no_proxy", bypass_domains),
+            ("NO_PROXY", bypass_domains),
+        ])
+        if self.env_writer.sync({BYPASS_DOMAINS_ENV_FILE: content}):
+            self.refresh_env_var()
+
+    @deferred_refresh
     def unset_bypass_domains_env_var(self):
-        xdg_config_home_path = xdg_config_home()
-        env_file_path = os.path.join(xdg_config_home_path, "environment.d", "02-bypass-domains.conf")
-
-        try:
-            os.remove(env_file_path)
-        except FileNotFoundError:
-            pass
-
-        self.refresh_env_var()
+        if self.env_writer.sync({BYPASS_DOMAINS_ENV_FILE: None}):
+            self.refresh_env_var()
 
     def refresh_env_var(self):
+        """
+        Requests a `systemctl --user daemon-reload`. Requests made during a public operation are merged into one
+        reload at its end, see RefreshScheduler.
+        """
+        self.refresh_scheduler.request()
+
+    def __daemon_reload(self):
         try:
-            if os.environ.get('container') is not None:
+            if self.probe.in_flatpak:
                 # In flatpak sandbox, use flatpak-spawn --host
-                subprocess.run(["flatpak-spawn", "--host", "systemctl", "--user", "daemon-reload"], check=True)
+                run_command(["flatpak-spawn", "--host", "systemctl", "--user", "daemon-reload"], check=True)
             else:
-                subprocess.run(["systemctl", "--user", "daemon-reload"], check=True)
+                run_command(["systemctl", "--user", "daemon-reload"], check=True)
         except subprocess.CalledProcessError as e:
             print(f"Error refreshing environment variable: {e}")
 
     def _run_command(self, cmd_list, **kwargs):
-        if os.environ.get('container') is not None:
+        if self.probe.in_flatpak:
             # In flatpak sandbox, use flatpak-spawn --host
             cmd_list = ["flatpak-spawn", "--host"] + cmd_list
-        return subprocess.run(cmd_list, **kwargs)
+        return run_command(cmd_list, **kwargs)
@@ -0,0 +1,62 @@
+from typing import NamedTuple
+
+# networksetup flags to set the server and the state of each protocol, and its key prefix in the proxy dictionary
+PROTOCOLS = {
+    "http": ("-setwebproxy", "-setwebproxystate", "HTTP"),
+    "https": ("-setsecurewebproxy", "-setsecurewebproxystate", "HTTPS"),
+}
+
+
+class PlannedOperation(NamedTuple):
+    """
+    One step of a transition plan. For `tool` "networksetup", `args` are the arguments of a networksetup call. For
+    "scutil", `args` is a dict of proxy dictionary keys written for `service` through ScutilProxyWriter.
+    """
+    tool: str
+    service: str
+    args: object
+
+
+_UNKNOWN = {"enabled": None, "ip_address": None, "port": None}
+
+
+def plan_service_transition(service, current, desired, scutil=False):
+    """
+    Returns the minimal ordered list of operations taking `service` from `current` to `desired`. Both map "http" and/or
+    "https" to dicts with "enabled", "ip_address" and "port". Only protocols in `current` are planned, entries missing
+    from `desired` (or set to None) keep their current value. A protocol whose current state is unknown maps to None,
+    then every value in `desired` is written.
+
+    `networksetup -setwebproxy` always enables the proxy, so a server change which should end up enabled is a single
+    call. For a server change on a proxy which should stay disabled it is followed by turning the proxy off again,
+    unless `scutil` is set: then the change is written through `scutil --prefs` (which needs admin rights) and the
+    proxy is never turned on, not even briefly.
+    """
+    operations = []
+    for protocol, (set_server, set_state, prefix) in PROTOCOLS.items():
+        if protocol not in current:
+            continue
+        current_state = current[protocol] or _UNKNOWN
+        wanted = {key: value for key, value in desired.get(protocol, {}).items() if value is not None}
+        target = {**current_state, **wanted}
+
+        server_changed = (str(target["ip_address"] or ""), str(target["port"] or "")) != \
+                         (str(current_state["ip_address"] or ""), str(current_state["port"] or ""))
+
+        if server_changed and (target["enabled"] or not scutil):
+            operations.append(PlannedOperation("networksetup", service, [set_server, service,
+                                                                         str(target["ip_address"] or ""),
+                                                                         str(target["port"] or 0)]))
+            if not target["enabled"]:
+                operations.append(PlannedOperation("networksetup", service, [set_state, service, "off"]))
+        elif server_changed:
+            # None removes the key, e.g. for a service without a port
+            values = {f"{prefix}Proxy": target["ip_address"] or None,
+                      f"{prefix}Port": int(target["port"]) if target["port"] else None}
+            if current_state["enabled"]:
+                values[f"{prefix}Enable"] = 0
+            operations.append(PlannedOperation("scutil", service, values))
+        elif target["enabled"] != current_state["enabled"]:
+            operations.append(PlannedOperation("networksetup", service,
+                                               [set_state, service, "on" if target["enabled"] else "off"]))
+    return operations
@@ -1,7 +1,14 @@
 import subprocess
 from contextlib import redirect_stdout
 
+from uniproxy.mac_planner import PlannedOperation, plan_service_transition
+from uniproxy.mac_topology import TopologyCache
+from uniproxy.process import run_command
+from uniproxy.scutil import ScutilProxyWriter, proxy_state_from_scutil, read_scutil_proxy
+from uniproxy.service_executor import NetworkServiceError, ServiceExecutor
 from uniproxy.shell_env_var import ShellEnvVar
+from uniproxy.state_cache import StateCache, cached_state
+from uniproxy.watch import CommandSource
 
 
 class MacProxy:
@@ -9,137 +16,394 @@ class MacProxy:
     Refers to the macOS version of system-wide proxy. Refer to `Proxy` class for initializing system-wide proxy.
     '''
 
-    def __init__(self, ip_address, port):
+    def __init__(self, ip_address, port, managed_shell_config=False, topology_ttl=5.0, watch_routes=False,
+                 max_workers=4, skip_disabled=False, writer="networksetup", reader="scutil", state_ttl=1.0):
         self.ip_address = ip_address
         self.port = port
+        # write shell exports to generated files sourced from the rc files instead of editing the rc files, see ShellEnvVar
+        self.managed_shell_config = managed_shell_config
+        # network services, hardware ports and the default service are only re-read after `topology_ttl` seconds, after
+        # writes by this instance or, with `watch_routes`, when the routing table changes
+        self.topology = TopologyCache(topology_ttl)
+        # proxy settings read from networksetup/scutil are cached for `state_ttl` seconds and dropped on every write
+        self.state_cache = StateCache(state_ttl)
+        if watch_routes:
+            self.topology.watch_routing_socket()
+        # bulk operations run for up to `max_workers` network services concurrently
+        self.executor = ServiceExecutor(max_workers)
+        # services marked as disabled (`*`) in `networksetup -listallnetworkservices` are left untouched
+        self.skip_disabled = skip_disabled
+        # "scutil" writes the settings of all services in a single `scutil --prefs` session instead of several
+        # networksetup calls per service
+        if writer not in ("networksetup", "scutil"):
+            raise ValueError(f"Unknown writer {writer}, expected 'networksetup' or 'scutil'")
+        self.writer = writer
+        self.scutil_writer = ScutilProxyWriter()
+        # "scutil" reads the state of the default service from one `scutil --proxy` call, falling back to networksetup
+        # if that fails
+        if reader not in ("networksetup", "scutil"):
+            raise ValueError(f"Unknown reader {reader}, expected 'networksetup' or 'scutil'")
+        self.reader = reader
+        # the operations of the last planned transition, see plan_set_proxy()
+        self.last_plan = []
+        self.__protocol_getters = {"http": self.get_http_proxy, "https": self.get_https_proxy}
+
+    def shell_env_var(self, bypass_domains):
+        return ShellEnvVar(self.ip_address, self.port, bypass_domains, managed=self.managed_shell_config)
+
+    def get_target_network_services(self):
+        """
+        Returns the network services bulk operations apply to.
+        """
+        return [name for name, enabled in self.list_network_services() if enabled or not self.skip_disabled]
 
-    def set_proxy(self):
-        network_services = self.get_network_services()
-        network_service = None
+    def invalidate_topology(self):
+        """
+        Drops the cached topology and proxy state after a write by this instance. Service IDs never change for an
+        existing service, so they are kept and only reloaded when a service is missing from them.
+        """
+        self.topology.invalidate(keep=("network_service_ids",))
+        self.state_cache.invalidate()
+
+    def get_network_service_ids(self, network_services=()):
+        """
+        Returns a dict mapping network service names to the service IDs used by the system configuration. The cached
+        mapping is reloaded if it is missing any of `network_services`.
+        """
+        service_ids = self.topology.get("network_service_ids", self.scutil_writer.list_service_ids)
+        if any(service not in service_ids for service in network_services):
+            self.topology.invalidate()
+            service_ids = self.topology.get("network_service_ids", self.scutil_writer.list_service_ids)
+        return service_ids
+
+    def write_scutil_proxies(self, values, network_services=None):
+        """
+        Writes `values` (keys of the proxy dictionary like HTTPEnable or ExceptionsList) for every target network
+        service in a single scutil session.
+        """
+        if network_services is None:
+            network_services = self.get_target_network_services()
+        self.write_scutil_service_proxies({service: values for service in network_services})
+
+    def write_scutil_service_proxies(self, proxies):
+        """
+        Writes the proxy dictionary keys of `proxies`, a dict mapping network services to their values, in a single
+        scutil session.
+        """
         try:
-            for network_service in network_services:
-                self.set_http_proxy(network_service)
-                self.set_https_proxy(network_service)
+            service_ids = self.get_network_service_ids(list(proxies))
+            missing = [service for service in proxies if service not in service_ids]
+            if missing:
+                raise NetworkServiceError("find the service ID", {service: KeyError(service) for service in missing})
+            self.scutil_writer.write({service_ids[service]: values for service, values in proxies.items()})
+        except subprocess.CalledProcessError as e:
+            raise RuntimeError(f"Failed to write proxy settings with scutil: {e}")
+        finally:
+            self.invalidate_topology()
+
+    def proxy_server_values(self):
+        if not self.ip_address:
+            # None removes the key, which is how a service without proxy server looks
+            return {"HTTPProxy": None, "HTTPPort": None, "HTTPSProxy": None, "HTTPSPort": None}
+        return {
+            "HTTPProxy": self.ip_address,
+            "HTTPPort": int(self.port),
+            "HTTPSProxy": self.ip_address,
+            "HTTPSPort": int(self.port),
+        }
 
+    def set_proxy(self):
+        if self.writer == "scutil":
+            self.write_scutil_proxies(self.proxy_server_values())
             if self.get_enable():
-                shell_env_var = ShellEnvVar(self.ip_address, self.port, self.get_bypass_domains())
+                shell_env_var = self.shell_env_var(self.get_bypass_domains())
                 shell_env_var.set_proxy_env_var()
+            return
 
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"failed to set proxy services for {network_service}: {e}")
+        self.execute_plan(self.plan_set_proxy())
 
-    def del_proxy(self):
-        network_services = self.get_network_services()
-        network_service = None
-        try:
-            for network_service in network_services:
-                subprocess.run(['networksetup', '-setwebproxy', network_service, "", str(0)], check=True)
-                subprocess.run(['networksetup', '-setsecurewebproxy', network_service, "", str(0)], check=True)
-                subprocess.run(['networksetup', '-setwebproxystate', network_service, 'off'], check=True)
-                subprocess.run(['networksetup', '-setsecurewebproxystate', network_service, 'off'], check=True)
+        if self.get_enable():
+            shell_env_var = self.shell_env_var(self.get_bypass_domains())
+            shell_env_var.set_proxy_env_var()
+
+    def get_service_proxy_state(self, network_service):
+        return {"http": self.get_http_proxy(network_service), "https": self.get_https_proxy(network_service)}
 
-            self.set_bypass_domains(["*.local", "169.254/16"])
+    def plan_set_proxy(self, network_services=None, protocols=("http", "https")):
+        """
+        Returns the operations which set the proxy server of `protocols` on the target network services without
+        changing whether the proxies are enabled. Nothing is planned for services which already use the server.
+        """
+        desired = {protocol: {"ip_address": self.ip_address, "port": self.port} for protocol in protocols}
+        return self.__plan_transitions(network_services, protocols, desired)
 
-            shell_env_var = ShellEnvVar(self.ip_address, self.port, self.get_bypass_domains())
+    def plan_join(self, network_services=None, protocols=("http", "https")):
+        """
+        Returns the operations which set the proxy server of `protocols` and enable them, planned together so that a
+        server change is a single `-setwebproxy` call per protocol, which also enables the proxy.
+        """
+        desired = {protocol: {"ip_address": self.ip_address, "port": self.port, "enabled": True}
+                   for protocol in protocols}
+        return self.__plan_transitions(network_services, protocols, desired)
+
+    def plan_set_enable(self, is_enable, network_services=None, protocols=("http", "https")):
+        """
+        Returns the operations which turn the proxies of `protocols` on the target network services on or off. A read
+        would cost as many networksetup calls as the write it may save, so only states found in the state cache are
+        used to skip services already in that state; the others are written without reading them.
+        """
+        desired = {protocol: {"enabled": is_enable} for protocol in protocols}
+        return self.__plan_transitions(network_services, protocols, desired, cache_only=True)
+
+    def __plan_transitions(self, network_services, protocols, desired, cache_only=False):
+        if network_services is None:
+            network_services = self.get_target_network_services()
+
+        def read_state(network_service):
+            return {protocol: self.__protocol_getters[protocol](network_service, cache_only=cache_only)
+                    for protocol in protocols}
+
+        if cache_only:
+            states = {network_service: read_state(network_service) for network_service in network_services}
+        else:
+            states = self.executor.run("read proxy state", network_services, read_state)
+        scutil = self.writer == "scutil"
+        return [operation for network_service in network_services
+                for operation in plan_service_transition(network_service, states[network_service], desired, scutil)]
+
+    def execute_plan(self, plan):
+        """
+        Runs the operations of `plan`. networksetup operations run in order per service with services processed
+        concurrently, scutil operations are written together in one session afterwards. An empty plan writes nothing
+        and keeps the cached state.
+        """
+        self.last_plan = list(plan)
+        networksetup_operations = {}
+        scutil_proxies = {}
+        for operation in plan:
+            if operation.tool == "scutil":
+                scutil_proxies.setdefault(operation.service, {}).update(operation.args)
+            else:
+                networksetup_operations.setdefault(operation.service, []).append(operation.args)
+
+        def run_service_operations(network_service):
+            for args in networksetup_operations[network_service]:
+                run_command(['networksetup'] + args, check=True)
+
+        if networksetup_operations:
+            try:
+                self.executor.run("set proxy", list(networksetup_operations), run_service_operations)
+            finally:
+                self.invalidate_topology()
+        if scutil_proxies:
+            self.write_scutil_service_proxies(scutil_proxies)
+
+    def del_proxy(self):
+        if self.writer == "scutil":
+            self.write_scutil_proxies({
+                "HTTPEnable": 0,
+                "HTTPProxy": None,
+                "HTTPPort": None,
+                "HTTPSEnable": 0,
+                "HTTPSProxy": None,
+                "HTTPSPort": None,
+                "ExceptionsList": ["*.local", "169.254/16"],
+            })
+            shell_env_var = self.shell_env_var(["*.local", "169.254/16"])
             shell_env_var.unset_proxy_env_var()
             shell_env_var.unset_bypass_domains_env_var()
-        except subprocess.CalledProcessError:
-            raise RuntimeError(f"failed to delete proxy services for {network_service}")
+            return
+
+        def del_service_proxy(network_service):
+            run_command(['networksetup', '-setwebproxy', network_service, "", str(0)], check=True)
+            run_command(['networksetup', '-setsecurewebproxy', network_service, "", str(0)], check=True)
+            run_command(['networksetup', '-setwebproxystate', network_service, 'off'], check=True)
+            run_command(['networksetup', '-setsecurewebproxystate', network_service, 'off'], check=True)
+
+        try:
+            self.executor.run("delete proxy", self.get_target_network_services(), del_service_proxy)
+        finally:
+            self.invalidate_topology()
+
+        self.set_bypass_domains(["*.local", "169.254/16"])
+
+        shell_env_var = self.shell_env_var(self.get_bypass_domains())
+        shell_env_var.unset_proxy_env_var()
+        shell_env_var.unset_bypass_domains_env_var()
 
     def join(self):
-        self.set_proxy()
-        self.set_enable(True)
+        if self.writer == "scutil":
+            self.write_scutil_proxies({**self.proxy_server_values(), "HTTPEnable": 1, "HTTPSEnable": 1})
+            shell_env_var = self.shell_env_var(self.get_bypass_domains())
+            shell_env_var.set_proxy_env_var()
+            shell_env_var.set_bypass_domains_env_var()
+            return
+
+        self.execute_plan(self.plan_join())
+        shell_env_var = self.shell_env_var(self.get_bypass_domains())
+        shell_env_var.set_proxy_env_var()
+        shell_env_var.set_bypass_domains_env_var()
+
+    def apply_config(self, config, report):
+        """
+        Writes the parts of `config` flagged in `report` (see Uniproxy.apply()) to the target network services, in
+        one scutil session or one networksetup plan, and updates the shell configuration only where it is affected.
+        `self.ip_address` and `self.port` must already match `config`, an empty ip address clears the proxy server.
+        """
+        bypass_domains = report.after["bypass_domains"]
+        if self.writer == "scutil":
+            values = {}
+            if report.endpoint:
+                values.update(self.proxy_server_values())
+            if report.enabled:
+                values.update({"HTTPEnable": int(config.enabled), "HTTPSEnable": int(config.enabled)})
+            if report.bypass_domains:
+                values["ExceptionsList"] = list(bypass_domains)
+            if values:
+                self.write_scutil_proxies(values)
+        else:
+            self.execute_plan(self.plan_config(config, report))
+
+        shell_env_var = self.shell_env_var(bypass_domains)
+        if not config.enabled:
+            if report.enabled:
+                shell_env_var.unset_proxy_env_var()
+                shell_env_var.unset_bypass_domains_env_var()
+            return
+        if report.endpoint or report.enabled:
+            shell_env_var.set_proxy_env_var()
+        if report.bypass_domains or report.enabled:
+            shell_env_var.set_bypass_domains_env_var()
+
+    def plan_config(self, config, report):
+        """
+        Returns the networksetup operations of apply_config(). `networksetup -setwebproxy` also enables the proxy, so
+        a server written for a disabled proxy is followed by turning it off again. An empty ip address clears the
+        server.
+        """
+        plan = []
+        state = "on" if config.enabled else "off"
+        ip_address, port = (str(self.ip_address), str(self.port)) if self.ip_address else ("", "0")
+        for service in self.get_target_network_services():
+            if report.endpoint:
+                plan.append(PlannedOperation("networksetup", service, ["-setwebproxy", service, ip_address, port]))
+                plan.append(PlannedOperation("networksetup", service, ["-setsecurewebproxy", service, ip_address, port]))
+                if not config.enabled:
+                    plan.append(PlannedOperation("networksetup", service, ["-setwebproxystate", service, state]))
+                    plan.append(PlannedOperation("networksetup", service, ["-setsecurewebproxystate", service, state]))
+            elif report.enabled:
+                plan.append(PlannedOperation("networksetup", service, ["-setwebproxystate", service, state]))
+                plan.append(PlannedOperation("networksetup", service, ["-setsecurewebproxystate", service, state]))
+            if report.bypass_domains:
+                plan.append(PlannedOperation("networksetup", service,
+                                             ["-setproxybypassdomains", service] + list(report.after["bypass_domains"])))
+        return plan
+
+    def change_sources(self, poll_interval=2.0):
+        """
+        Returns the sources reporting changes of the proxy settings, see uniproxy.watch: a scutil session notified by
+        configd whenever the effective proxy settings change.
+        """
+        return [CommandSource(["scutil"], input="n.add State:/Network/Global/Proxies\nn.watch\n")]
 
     def get_network_services(self):
         """
         Get the list of network services available on the macOS device
         """
+        return [name for name, _ in self.list_network_services()]
+
+    def list_network_services(self):
+        """
+        Returns (name, enabled) pairs for every network service as listed by `networksetup -listallnetworkservices`.
+        Disabled services are prefixed with an asterisk in that output, which is stripped from the name.
+        """
+        return self.topology.get("network_services", self.__load_network_services)
+
+    def __load_network_services(self):
         try:
-            result = subprocess.run(['networksetup', '-listallnetworkservices'], capture_output=True, text=True, check=True)
-            network_services = result.stdout.split('\n')
-            network_services = [network_service.strip() for network_service in network_services if
-                                network_service.strip() and "An asterisk" not in network_service]
+            result = run_command(['networksetup', '-listallnetworkservices'], capture_output=True, text=True, check=True)
+            network_services = []
+            for line in result.stdout.split('\n'):
+                line = line.strip()
+                if not line or "An asterisk" in line:
+                    continue
+                if line.startswith('*'):
+                    network_services.append((line[1:].strip(), False))
+                else:
+                    network_services.append((line, True))
             return network_services
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Failed to get network services: {e}")
 
     def set_enable(self, is_enable):
-        network_services = self.get_network_services()
-        network_service = None
-        try:
-            for network_service in network_services:
-                if is_enable:
-                    subprocess.run(['networksetup', '-setwebproxystate', network_service, 'on'], check=True)
-                    subprocess.run(['networksetup', '-setsecurewebproxystate', network_service, 'on'], check=True)
-                else:
-                    subprocess.run(['networksetup', '-setwebproxystate', network_service, 'off'], check=True)
-                    subprocess.run(['networksetup', '-setsecurewebproxystate', network_service, 'off'], check=True)
-
-            shell_env_var = ShellEnvVar(self.ip_address, self.port, self.get_bypass_domains())
-            if is_enable:
-                shell_env_var.set_proxy_env_var()
-                shell_env_var.set_bypass_domains_env_var()
-            else:
-                shell_env_var.unset_proxy_env_var()
-                shell_env_var.unset_bypass_domains_env_var()
-
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Failed to set proxy services for {network_service}: {e}")
+        if self.writer == "scutil":
+            self.write_scutil_proxies({"HTTPEnable": int(is_enable), "HTTPSEnable": int(is_enable)})
+        else:
+            self.execute_plan(self.plan_set_enable(is_enable))
 
+        shell_env_var = self.shell_env_var(self.get_bypass_domains())
+        if is_enable:
+            shell_env_var.set_proxy_env_var()
+            shell_env_var.set_bypass_domains_env_var()
+        else:
+            shell_env_var.unset_proxy_env_var()
+            shell_env_var.unset_bypass_domains_env_var()
 
     def set_http_proxy(self, network_service):
         try:
-            http_proxy_state = self.get_http_proxy(network_service)
-            is_enabled = http_proxy_state['enabled']
-
-            subprocess.run(['networksetup', '-setwebproxy', network_service, self.ip_address, str(self.port)], check=True)
-
-            # since networksetup -setwebproxy turns on the proxy too, we need to turn it off if it was off
-            # this function doesn't change the state of the proxy if it was already on since it would be turned on
-            # by the previous command
-
-            if not is_enabled:
-                subprocess.run(['networksetup', '-setwebproxystate', network_service, 'off'], check=True)
-        except subprocess.CalledProcessError as e:
+            self.execute_plan(self.plan_set_proxy([network_service], ["http"]))
+        except RuntimeError as e:
             raise RuntimeError(f"Failed to set http proxy for {network_service}: {e}")
 
     def set_https_proxy(self, network_service):
         try:
-            https_proxy_state = self.get_https_proxy(network_service)
-            is_enabled = https_proxy_state['enabled']
-
-            subprocess.run(['networksetup', '-setsecurewebproxy', network_service, self.ip_address, str(self.port)], check=True)
-
-            # since networksetup -setsecurewebproxy turns on the proxy too, we need to turn it off if it was off
-            # this function doesn't change the state of the proxy if it was already on since it would be turned on
-            # by the previous command
-            if not is_enabled:
-                subprocess.run(['networksetup', '-setsecurewebproxystate', network_service, 'off'], check=True)
-        except subprocess.CalledProcessError as e:
+            self.execute_plan(self.plan_set_proxy([network_service], ["https"]))
+        except RuntimeError as e:
             raise RuntimeError(f"Failed to set https proxy for {network_service}: {e}")
 
     def set_bypass_domains(self, domains: list[str], network_service=None):
         if network_service is None:
-            network_services = self.get_network_services()
+            network_services = self.get_target_network_services()
         else:
             network_services = [network_service]
 
-        try:
-            for service in network_services:
-                subprocess.run(['networksetup', '-setproxybypassdomains', service] + domains, check=True)
+        def set_service_bypass_domains(service):
+            run_command(['networksetup', '-setproxybypassdomains', service] + domains, check=True)
 
-            if self.get_enable():
-                shell_env_var = ShellEnvVar(self.ip_address, self.port, domains)
-                shell_env_var.set_bypass_domains_env_var()
+        if self.writer == "scutil":
+            self.write_scutil_proxies({"ExceptionsList": list(domains)}, network_services)
+        else:
+            try:
+                self.executor.run("set bypass domains", network_services, set_service_bypass_domains)
+            finally:
+                self.invalidate_topology()
 
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Failed to set bypass domains for {network_service}: {e}")
+        if self.get_enable():
+            shell_env_var = self.shell_env_var(domains)
+            shell_env_var.set_bypass_domains_env_var()
 
+    @cached_state
+    def get_scutil_proxy_state(self):
+        """
+        Returns the proxy state of the default network service read with `scutil --proxy`, or None if the scutil reader
+        is not used or failed.
+        """
+        if self.reader != "scutil":
+            return None
+        try:
+            return proxy_state_from_scutil(read_scutil_proxy())
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    @cached_state
     def get_bypass_domains(self, network_service=None):
         if network_service is None:
+            state = self.get_scutil_proxy_state()
+            if state is not None:
+                return state["bypass_domains"]
             network_service = self.get_default_network_service()
         try:
-            result = subprocess.run(['networksetup', '-getproxybypassdomains', network_service], capture_output=True,
+            result = run_command(['networksetup', '-getproxybypassdomains', network_service], capture_output=True,
                                     text=True)
 
             result = result.stdout.split('\n')
@@ -148,9 +412,10 @@ class MacProxy:
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Failed to get bypass domains for {network_service}: {e}")
 
+    @cached_state
     def get_http_proxy(self, network_service):
         try:
-            result = subprocess.run(['networksetup', '-getwebproxy', network_service], capture_output=True, text=True)
+            result = run_command(['networksetup', '-getwebproxy', network_service], capture_output=True, text=True)
             output = result.stdout
 
             enabled = self.parse(output, 'Enabled:') == "Yes"
@@ -165,9 +430,10 @@ class MacProxy:
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Failed to get http proxy for {network_service}: {e}")
 
+    @cached_state
     def get_https_proxy(self, network_service):
         try:
-            result = subprocess.run(['networksetup', '-getsecurewebproxy', network_service], capture_output=True, text=True)
+            result = run_command(['networksetup', '-getsecurewebproxy', network_service], capture_output=True, text=True)
             output = result.stdout
 
             enabled = self.parse(output, 'Enabled:') == "Yes"
@@ -182,13 +448,19 @@ class MacProxy:
         except subprocess.CalledProcessError as e:
             raise RuntimeError(f"Failed to get https proxy for {network_service}: {e}")
 
+    @cached_state
     def get_enable(self):
         """
         Get if proxy is enabled or not. Only checks for default network service which is determined by
         get_default_network_service()
         """
-        http_proxy = self.get_http_proxy(self.get_default_network_service())
-        https_proxy = self.get_https_proxy(self.get_default_network_service())
+        state = self.get_scutil_proxy_state()
+        if state is not None:
+            return state["http"]["enabled"] and state["https"]["enabled"]
+
+        default_network_service = self.get_default_network_service()
+        http_proxy = self.get_http_proxy(default_network_service)
+        https_proxy = self.get_https_proxy(default_network_service)
         return http_proxy['enabled'] and https_proxy['enabled']
 
     def parse(self, output, key):
@@ -202,8 +474,11 @@ class MacProxy:
         Get default network device by parsing the output of `route -n get default`. Returns None is machine is not
         connected to any network.
         """
+        return self.topology.get("default_network_device", self.__load_default_network_device)
+
+    def __load_default_network_device(self):
         try:
-            route_result = subprocess.run(['route','-n', 'get', 'default'], capture_output=True, text=True).stdout.strip()
+            route_result = run_command(['route','-n', 'get', 'default'], capture_output=True, text=True).stdout.strip()
             if not "route: writing to routing socket:" in route_result:  # happens when machine is not connected to any network
                 for line in route_result.split('\n'):
                     if line.strip().startswith('interface:'):
@@ -219,33 +494,24 @@ class MacProxy:
         Get default network service by parsing the output of `networksetup -listallnetworkservices`.
         Returns the first enabled network service. Returns None if no such network service is found.
         """
-        try:
-            result = subprocess.run(['networksetup', '-listallnetworkservices'], capture_output=True, text=True).stdout.strip()
-            lines = result.split('\n')
-            lines = [line for line in lines if line.strip()]
-            if len(lines) > 1:  # above command returns nothing if there is no network service
-                lines.pop(0)   # remove the first line which is "An asterisk (*) denotes that a network service is disabled."
-
-            default_network_service = None
-
-            for line in lines:
-                if line.strip().startswith('*'):  # skip the deactivated network service
-                    continue
-                else:
-                    default_network_service = line.strip()
-                    break
-
-            return default_network_service if default_network_service else None
-
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Failed to get default network service by network service: {e}")
+        for network_service, enabled in self.list_network_services():
+            if enabled:
+                return network_service
+        return None
 
     def get_network_service_name_by_network_device(self, device_name: str):
         """
         Returns the network service name by network device name.
         """
+        return self.topology.get("hardware_ports", self.__load_hardware_ports).get(device_name)
+
+    def __load_hardware_ports(self):
+        """
+        Returns a dict mapping network devices to their hardware port names, from `networksetup -listallhardwareports`.
+        """
         try:
-            result = subprocess.run(['networksetup', '-listallhardwareports'], capture_output=True, text=True)
+            result = run_command(['networksetup', '-listallhardwareports'], capture_output=True, text=True)
+            hardware_ports = {}
             if result.returncode == 0:
                 stdout = result.stdout
                 blocks = stdout.split("Ethernet Address:")
@@ -258,10 +524,11 @@ class MacProxy:
                             hardware_port = line.strip()[15:].strip()
                         if line.strip().startswith("Device:"):
                             device = line.strip()[8:].strip()
-                    if device == device_name:
-                        return hardware_port
+                    if device is not None and device not in hardware_ports:
+                        hardware_ports[device] = hardware_port
+            return hardware_ports
         except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Failed to get network service name by network device ({device_name}): {e}")
+            raise RuntimeError(f"Failed to get hardware ports: {e}")
 
     def get_default_network_service(self):
         """
@@ -269,6 +536,9 @@ class MacProxy:
         fails to find a default network device then get_default_network_service_by_ns() is used to find the default
         network service
         """
+        return self.topology.get("default_network_service", self.__load_default_network_service)
+
+    def __load_default_network_service(self):
         default_network_device = self.get_default_network_device()
         if default_network_device is None:
             default_network_service = self.get_default_network_service_by_ns()
@@ -280,10 +550,16 @@ class MacProxy:
 
         return default_network_service
 
+    @cached_state
     def get_proxy(self):
-        default_network_service = self.get_default_network_service()
-        http_proxy = self.get_http_proxy(default_network_service)
-        https_proxy = self.get_https_proxy(default_network_service)
+        state = self.get_scutil_proxy_state()
+        if state is not None:
+            http_proxy = state["http"]
+            https_proxy = state["https"]
+        else:
+            default_network_service = self.get_default_network_service()
+            http_proxy = self.get_http_proxy(default_network_service)
+            https_proxy = self.get_https_proxy(default_network_service)
 
         is_enable = http_proxy['enabled'] and https_proxy['enabled']
 
@@ -0,0 +1,75 @@
+import socket
+import threading
+import time
+
+from uniproxy.state_cache import StateCache
+
+
+class TopologyCache(StateCache):
+    """
+    Caches the macOS network-service topology (service list, device to service mapping and default service) for
+    `ttl` seconds. Entries are dropped early by invalidate(), which MacProxy calls after its own writes and which
+    RouteWatcher calls when the routing table changes. A `ttl` of 0 disables caching.
+    """
+
+    def __init__(self, ttl=5.0, clock=time.monotonic):
+        super().__init__(ttl, clock)
+        self.__watcher = None
+
+    def watch_routing_socket(self):
+        """
+        Starts a RouteWatcher which invalidates the cache whenever the kernel reports a routing change. Returns False if
+        routing sockets are not available on this platform.
+        """
+        if self.__watcher is None:
+            if not RouteWatcher.is_supported():
+                return False
+            self.__watcher = RouteWatcher(self.invalidate)
+            self.__watcher.start()
+        return True
+
+    def stop_watching(self):
+        if self.__watcher is not None:
+            self.__watcher.stop()
+            self.__watcher = None
+
+
+class RouteWatcher:
+    """
+    Listens on a PF_ROUTE socket in a daemon thread and calls `callback` for every routing message, e.g. when the
+    default route moves to another interface.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.__socket = None
+        self.__thread = None
+        self.__stopped = threading.Event()
+
+    @staticmethod
+    def is_supported():
+        return hasattr(socket, "AF_ROUTE")
+
+    def start(self):
+        self.__socket = socket.socket(socket.AF_ROUTE, socket.SOCK_RAW, 0)
+        self.__socket.settimeout(1.0)
+        self.__thread = threading.Thread(target=self.__run, name="uniproxy-route-watcher", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+        if self.__socket is not None:
+            self.__socket.close()
+
+    def __run(self):
+        while not self.__stopped.is_set():
+            try:
+                message = self.__socket.recv(2048)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if message:
+                self.callback()
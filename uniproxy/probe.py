@@ -0,0 +1,78 @@
+import os
+import shutil
+import threading
+
+
+class SystemProbe:
+    """
+    Resolves the capabilities of the current session (desktop environment, KDE version, flatpak sandbox and the paths
+    of external tools) once and caches them until invalidate() is called. All backends share the instance returned by
+    get_probe(), so a long running process only probes once.
+    """
+
+    def __init__(self, environ=None):
+        self.environ = os.environ if environ is None else environ
+        self.__cache = {}
+        self.__lock = threading.Lock()
+
+    def __cached(self, key, resolver):
+        try:
+            return self.__cache[key]
+        except KeyError:
+            pass
+        with self.__lock:
+            if key not in self.__cache:
+                self.__cache[key] = resolver()
+            return self.__cache[key]
+
+    @property
+    def desktop(self):
+        return self.__cached("desktop", lambda: self.environ.get("XDG_CURRENT_DESKTOP", "").lower())
+
+    @property
+    def is_gnome(self):
+        return "gnome" in self.desktop or "cinnamon" in self.desktop
+
+    @property
+    def is_kde(self):
+        return "kde" in self.desktop
+
+    @property
+    def kde_version(self):
+        return self.__cached("kde_version", lambda: self.environ.get("KDE_SESSION_VERSION", "5"))
+
+    @property
+    def in_flatpak(self):
+        return self.__cached("in_flatpak", lambda: self.environ.get("container") is not None)
+
+    def which(self, command):
+        """
+        Returns the absolute path of `command` or None if it is not in PATH.
+        """
+        return self.__cached(("which", command), lambda: shutil.which(command, path=self.environ.get("PATH")))
+
+    def is_installed(self, command):
+        return self.which(command) is not None
+
+    def installed_shells(self, shells):
+        """
+        Returns the names of `shells` which are installed.
+        """
+        return [shell for shell in shells if self.is_installed(shell)]
+
+    def invalidate(self):
+        """
+        Drops every cached result, e.g. after installing a tool or when the environment changed.
+        """
+        with self.__lock:
+            self.__cache.clear()
+
+
+_probe = SystemProbe()
+
+
+def get_probe():
+    """
+    Returns the probe shared by all backends of this process.
+    """
+    return _probe
@@ -0,0 +1,75 @@
+import asyncio
+import contextvars
+import os
+import subprocess
+from contextlib import contextmanager
+
+from uniproxy import tracing
+
+_command_runner = contextvars.ContextVar("uniproxy_command_runner", default=None)
+
+
+def run_command(cmd, **kwargs):
+    """
+    Runs `cmd` like subprocess.run(), or with the runner installed by command_runner() in the current context. All
+    commands spawned by the backends go through here.
+    """
+    runner = _command_runner.get() or subprocess.run
+    with tracing.span("command", os.path.basename(cmd[0]), argv=list(cmd)) as span:
+        result = runner(cmd, **kwargs)
+        span.set("exit_code", result.returncode)
+        span.set("bytes", sum(len(output) for output in (kwargs.get("input"), result.stdout, result.stderr) if output))
+        return result
+
+
+@contextmanager
+def command_runner(runner):
+    """
+    Makes run_command() use `runner`, a callable with the signature of subprocess.run(), in the current context.
+    """
+    token = _command_runner.set(runner)
+    try:
+        yield runner
+    finally:
+        _command_runner.reset(token)
+
+
+class AsyncCommandRunner:
+    """
+    Runs commands with asyncio.create_subprocess_exec() on `loop`, at most `max_concurrency` at a time. Calling the
+    runner from a worker thread blocks that thread until the command finished, so the synchronous backends can use it
+    through command_runner() while the event loop keeps running. Supports the `input`, `capture_output`, `text`,
+    `check`, `stdout`, `stderr` and `env` arguments of subprocess.run().
+    """
+
+    def __init__(self, loop, max_concurrency=8):
+        self.loop = loop
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(self, cmd, input=None, capture_output=False, text=False, check=False, stdout=None, stderr=None,
+                  env=None):
+        if capture_output:
+            stdout = stderr = subprocess.PIPE
+        if text and input is not None:
+            input = input.encode()
+
+        async with self.semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdin=subprocess.PIPE if input is not None else None, stdout=stdout, stderr=stderr, env=env)
+            try:
+                out, err = await process.communicate(input)
+            except asyncio.CancelledError:
+                # the command is left to finish, so a setting is never half written
+                await asyncio.shield(process.wait())
+                raise
+
+        if text:
+            out = out.decode() if out is not None else None
+            err = err.decode() if err is not None else None
+        result = subprocess.CompletedProcess(cmd, process.returncode, out, err)
+        if check:
+            result.check_returncode()
+        return result
+
+    def __call__(self, cmd, **kwargs):
+        return asyncio.run_coroutine_threadsafe(self.run(cmd, **kwargs), self.loop).result()
@@ -0,0 +1,85 @@
+import contextvars
+import functools
+import threading
+from contextlib import contextmanager
+
+
+class RefreshScheduler:
+    """
+    Coalesces refresh requests (e.g. `systemctl --user daemon-reload`). Requests made inside batch() are deferred until
+    the outermost batch ends, so a public operation triggers at most one refresh. With a `debounce` window in seconds,
+    the refresh is additionally delayed and merged with requests of later operations arriving inside the window.
+    `count` is the number of refreshes that actually ran. A debounced refresh runs in the context of the last request,
+    so it uses the same command runner (see process.command_runner()) as the operation which requested it.
+    """
+
+    def __init__(self, action, debounce=0):
+        self.action = action
+        self.debounce = debounce
+        self.count = 0
+        self.__depth = 0
+        self.__pending = False
+        self.__timer = None
+        self.__lock = threading.RLock()
+
+    @property
+    def pending(self):
+        return self.__pending
+
+    def request(self):
+        with self.__lock:
+            self.__pending = True
+            if self.__depth == 0:
+                self.__schedule()
+
+    @contextmanager
+    def batch(self):
+        with self.__lock:
+            self.__depth += 1
+        try:
+            yield self
+        finally:
+            with self.__lock:
+                self.__depth -= 1
+                if self.__depth == 0 and self.__pending:
+                    self.__schedule()
+
+    def __schedule(self):
+        if self.debounce <= 0:
+            self.flush()
+            return
+        if self.__timer is not None:
+            self.__timer.cancel()
+        self.__timer = threading.Timer(self.debounce, contextvars.copy_context().run, [self.__on_timer])
+        self.__timer.start()
+
+    def __on_timer(self):
+        with self.__lock:
+            if self.__depth > 0:  # the batch in progress schedules the refresh when it ends
+                return
+        self.flush()
+
+    def flush(self):
+        """
+        Runs the pending refresh now, if there is one.
+        """
+        with self.__lock:
+            if not self.__pending:
+                return
+            self.__pending = False
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            self.count += 1
+        self.action()
+
+
+def deferred_refresh(method):
+    """
+    Runs `method` inside `self.refresh_scheduler.batch()`.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.refresh_scheduler.batch():
+            return method(self, *args, **kwargs)
+    return wrapper
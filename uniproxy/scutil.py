@@ -0,0 +1,164 @@
+import re
+
+from uniproxy.process import run_command
+
+_SUBKEY_RE = re.compile(r'^\s*subKey \[\d+\] = (.+)$')
+
+# key of the marker dictionary printed before each `show`, scutil has no echo command
+_MARKER_KEY = "UniproxyShowKey"
+
+
+def parse_scutil_dict(output):
+    """
+    Parses the `<dictionary> { ... }` text printed by scutil into python dicts and lists. Values consisting only of
+    digits are returned as ints, everything else as strings. Returns an empty dict if `output` has no dictionary.
+    """
+    root = None
+    stack = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line == "}":
+            if stack:
+                stack.pop()
+            continue
+        if line == "<dictionary> {" and root is None:
+            root = {}
+            stack.append(root)
+            continue
+        if not stack or " : " not in line:
+            continue
+
+        key, value = line.split(" : ", 1)
+        container = stack[-1]
+        if value == "<dictionary> {":
+            child = {}
+        elif value == "<array> {":
+            child = []
+        else:
+            child = None
+            value = int(value) if value.isdigit() else value
+
+        item = child if child is not None else value
+        if isinstance(container, list):
+            container.append(item)
+        else:
+            container[key] = item
+        if child is not None:
+            stack.append(child)
+    return root if root is not None else {}
+
+
+def format_scutil_value(value):
+    """
+    Formats a value for a `d.add` command, `#` marks numbers and `*` arrays.
+    """
+    if isinstance(value, bool):
+        return f"# {int(value)}"
+    if isinstance(value, int):
+        return f"# {value}"
+    if isinstance(value, (list, tuple)):
+        return " ".join(["*"] + [_quote(item) for item in value])
+    return _quote(value)
+
+
+def _quote(value):
+    value = str(value)
+    if value == "" or re.search(r'[\s"]', value):
+        return '"' + value.replace('"', '\\"') + '"'
+    return value
+
+
+class ScutilProxyWriter:
+    """
+    Writes the proxy dictionaries of several network services in one `scutil --prefs` session: each service's
+    dictionary is loaded, updated with `d.add`/`d.remove` and `set`, and everything is committed and applied once at
+    the end. Keys which are not written (e.g. SOCKS or FTP settings) are kept.
+    """
+
+    def __init__(self, scutil="scutil", run_command=run_command):
+        self.scutil = scutil
+        self.run_command = run_command
+
+    def list_service_ids(self):
+        """
+        Returns a dict mapping network service names to their service IDs. This takes two scutil sessions, one listing
+        the services and one showing their names, so callers should cache the result. Each `show` is preceded by a
+        marker dictionary holding its key, so every reply is matched to its service even when scutil prints nothing
+        for a key, and services whose reply has no name are left out.
+        """
+        output = self.run_command([self.scutil], input="list Setup:/Network/Service/[^/]+$\nquit\n",
+                                  capture_output=True, text=True, check=True).stdout
+        keys = [match.group(1).strip() for match in map(_SUBKEY_RE.match, output.splitlines()) if match]
+        if not keys:
+            return {}
+
+        script = "".join(f"d.init\nd.add {_MARKER_KEY} {_quote(key)}\nd.show\nshow {key}\n" for key in keys) + "quit\n"
+        output = self.run_command([self.scutil], input=script, capture_output=True, text=True, check=True).stdout
+
+        service_ids = {}
+        key = None
+        for text in re.split(r'(?=^<dictionary> \{)', output, flags=re.MULTILINE):
+            dictionary = parse_scutil_dict(text)
+            if _MARKER_KEY in dictionary:
+                key = str(dictionary[_MARKER_KEY])
+                continue
+            name = dictionary.get("UserDefinedName")
+            if key is not None and name is not None:
+                service_ids[str(name)] = key.rsplit("/", 1)[1]
+            key = None
+        return service_ids
+
+    def build_script(self, proxies):
+        """
+        Builds the scutil session for `proxies`, a dict mapping service IDs to a dict of proxy keys (HTTPEnable,
+        HTTPProxy, HTTPPort, HTTPSEnable, HTTPSProxy, HTTPSPort, ExceptionsList, ...). A value of None removes the key.
+        """
+        lines = ["lock"]
+        for service_id, values in proxies.items():
+            path = f"/NetworkServices/{service_id}/Proxies"
+            lines.append("d.init")
+            lines.append(f"get {path}")
+            for key, value in values.items():
+                if value is None:
+                    lines.append(f"d.remove {key}")
+                else:
+                    lines.append(f"d.add {key} {format_scutil_value(value)}")
+            lines.append(f"set {path}")
+        lines.extend(["commit", "apply", "unlock", "quit"])
+        return "\n".join(lines) + "\n"
+
+    def write(self, proxies):
+        if not proxies:
+            return
+        self.run_command([self.scutil, "--prefs"], input=self.build_script(proxies), capture_output=True, text=True,
+                         check=True)
+
+
+def read_scutil_proxy(scutil="scutil", run_command=run_command):
+    """
+    Returns the effective proxy dictionary (HTTPEnable, HTTPProxy, HTTPPort, HTTPSEnable, ..., ExceptionsList) of the
+    primary network service from a single `scutil --proxy` call.
+    """
+    output = run_command([scutil, "--proxy"], capture_output=True, text=True, check=True).stdout
+    return parse_scutil_dict(output)
+
+
+def proxy_state_from_scutil(proxies):
+    """
+    Converts a `scutil --proxy` dictionary to the result shape of MacProxy.get_http_proxy()/get_https_proxy() for
+    both protocols, plus the bypass domains.
+    """
+    def protocol_state(prefix):
+        return {
+            "enabled": proxies.get(f"{prefix}Enable") == 1,
+            "ip_address": str(proxies.get(f"{prefix}Proxy", "")),
+            "port": str(proxies.get(f"{prefix}Port", 0)),
+        }
+
+    return {
+        "http": protocol_state("HTTP"),
+        "https": protocol_state("HTTPS"),
+        "bypass_domains": [str(domain) for domain in proxies.get("ExceptionsList", [])],
+    }
@@ -0,0 +1,70 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+class NetworkServiceError(RuntimeError):
+    """
+    Raised when an operation failed for one or more network services. `errors` maps every failed service to its
+    exception, the other services were still processed.
+    """
+
+    def __init__(self, action, errors):
+        self.action = action
+        self.errors = errors
+        details = "; ".join(f"{service}: {error}" for service, error in errors.items())
+        super().__init__(f"Failed to {action} for {details}")
+
+
+class ServiceExecutor:
+    """
+    Runs per network service work on a bounded thread pool. At most `max_workers` services are processed at the same
+    time, a `max_workers` of 1 runs them serially.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+
+    def run(self, action, services, function):
+        """
+        Calls `function(service)` for every service and returns a dict with the result of each. Failures are collected
+        and raised together as a NetworkServiceError once every service was processed.
+        """
+        results = {}
+        errors = {}
+        workers = min(self.max_workers, len(services))
+
+        if workers <= 1:
+            for service in services:
+                try:
+                    results[service] = function(service)
+                except Exception as e:
+                    errors[service] = e
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="uniproxy-service") as pool:
+                # every task runs in a copy of the caller's context, e.g. to keep its command runner
+                futures = {service: pool.submit(contextvars.copy_context().run, function, service)
+                           for service in services}
+                for service, future in futures.items():
+                    try:
+                        results[service] = future.result()
+                    except Exception as e:
+                        errors[service] = e
+
+        if errors:
+            raise NetworkServiceError(action, errors)
+        return results
+
+
+def run_concurrently(functions):
+    """
+    Calls the independent `functions` at the same time, each on its own thread in a copy of the caller's context, and
+    waits for all of them. The first exception raised is re-raised.
+    """
+    if len(functions) <= 1:
+        for function in functions:
+            function()
+        return
+    with ThreadPoolExecutor(max_workers=len(functions), thread_name_prefix="uniproxy-writer") as pool:
+        futures = [pool.submit(contextvars.copy_context().run, function) for function in functions]
+    for future in futures:
+        future.result()
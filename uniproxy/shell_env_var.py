@@ -1,176 +1,195 @@
 import os
-import subprocess
+import warnings
 from enum import Enum
-from xdg import xdg_config_home
-import re
-
-BASH_RC = os.path.expanduser("~/.bashrc")
-ZSH_RC = os.path.expanduser("~/.zshrc")
-FISH_CONFIG = os.path.join(xdg_config_home(), "fish/config.fish")
-
-class ShellsTypes(Enum):
-    BASH = {
-        "bin": "bash",
-        "installed": False,
-        "config": os.path.expanduser("~/.bashrc")
-    }
-    ZSH = {
-        "bin": "zsh",
-        "installed": False,
-        "config": os.path.expanduser("~/.zshrc")
-    }
-    FISH = {
-        "bin": "fish",
-        "installed": False,
-        "config": os.path.join(xdg_config_home(), "fish/config.fish")
-    }
+
+from uniproxy.atomic_file import atomic_write, read_file
+from uniproxy.probe import get_probe
+from uniproxy.shells import BashShell, FishShell, ZshShell, installed_shells
+
+PROXY_VARS = ["http_proxy", "HTTP_PROXY", "https_proxy", "HTTPS_PROXY", "ftp_proxy", "FTP_PROXY", "rsync_proxy", "RSYNC_PROXY"]
+BYPASS_VARS = ["no_proxy", "NO_PROXY"]
+
+# names this module had before the shell plugins of `uniproxy.shells`, resolved by __getattr__()
+_DEPRECATED_PATHS = {"BASH_RC": BashShell, "ZSH_RC": ZshShell, "FISH_CONFIG": FishShell}
+
+
+def __getattr__(name):
+    if name in _DEPRECATED_PATHS:
+        warnings.warn(f"{name} is deprecated, use uniproxy.shells.{_DEPRECATED_PATHS[name].__name__}().config_path()",
+                      DeprecationWarning, stacklevel=2)
+        return _DEPRECATED_PATHS[name]().config_path()
+    if name == "ShellsTypes":
+        warnings.warn("ShellsTypes is deprecated, use the shell plugins of uniproxy.shells", DeprecationWarning,
+                      stacklevel=2)
+        return Enum("ShellsTypes", {shell.name: {"bin": shell.bin, "installed": False, "config": shell.config_path()}
+                                    for shell in [BashShell(), ZshShell(), FishShell()]})
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# (rc file, source line) pairs known to be in place, with the identity the rc file had then, see ensure_source_line()
+_checked_source_lines = {}
+
+
+def _file_identity(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
 
 class ShellEnvVar:
-    def __init__(self, ip_address, port, bypass_domains: list[str]):
+    """
+    Sets the proxy environment variables for the installed shells, see `uniproxy.shells` for the supported shells.
+
+    By default the exports are written directly into each shell's configuration file. With `managed=True` they are
+    written to one generated file per shell instead, which is replaced atomically and only when its content changes.
+    The configuration file then only gets a guarded line sourcing that file, inserted once and never touched again,
+    so toggling the proxy no longer rewrites large rc files.
+    """
+
+    def __init__(self, ip_address, port, bypass_domains: list[str], probe=None, managed=False):
         self.ip_address = ip_address
         self.port = port
         self.bypass_domains = bypass_domains
+        self.probe = probe if probe is not None else get_probe()
+        self.managed = managed
 
-        self.shells = [
-            {
-                "name": shell.name,
-                "bin": shell.value["bin"],
-                "installed": self.command_exists(shell.value["bin"]),
-                "config": shell.value["config"]
-            }
-            for shell in ShellsTypes
-        ]
+        self.shells = installed_shells(self.probe)
 
     def command_exists(self, command):
-        return subprocess.call(["which", command], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
+        return self.probe.is_installed(command)
 
+    def export_patterns(self, shell, names):
+        return [shell.export_pattern(name) for name in names]
 
-    def set_proxy_env_var(self):
+    def export_lines(self, shell, content, names):
         """
-        Sets the proxy environment variables in supported shell configuration files
+        Returns the lines of `content` exporting one of `names`.
         """
-        self.unset_proxy_env_var()
-        for shell in self.shells:
-            if not shell["installed"]:
-                continue
+        patterns = self.export_patterns(shell, names)
+        return [line for line in content.splitlines(keepends=True) if any(pattern.match(line) for pattern in patterns)]
 
-            shell_rc = shell["config"]
-            if not os.path.exists(shell_rc):
-                open(shell_rc, 'w').close()
-
-            if shell["name"] in ["BASH", "ZSH"]:
-                with open(shell_rc, 'a') as f:
-                    f.write(f'export http_proxy="http://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'export HTTP_PROXY="http://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'export https_proxy="http://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'export HTTPS_PROXY="http://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'export ftp_proxy="ftp://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'export FTP_PROXY="ftp://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'export rsync_proxy="rsync://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'export RSYNC_PROXY="rsync://{self.ip_address}:{self.port}/"\n')
-
-            elif shell["name"] == "FISH":
-                with open(shell_rc, 'a') as f:
-                    f.write(f'set -x http_proxy "http://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'set -x HTTP_PROXY "http://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'set -x https_proxy "http://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'set -x HTTPS_PROXY "http://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'set -x ftp_proxy "ftp://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'set -x FTP_PROXY "ftp://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'set -x rsync_proxy "rsync://{self.ip_address}:{self.port}/"\n')
-                    f.write(f'set -x RSYNC_PROXY "rsync://{self.ip_address}:{self.port}/"\n')
+    def replace_exports(self, shell, content, names, variables):
+        """
+        Returns `content` with the exports of `names` replaced by `variables`. The new exports take the place of the
+        old ones, so re-setting the same values yields the same content.
+        """
+        return self.replace_export_lines(shell, content, names,
+                                         [shell.export_line(name, value) for name, value in variables])
 
-    def unset_proxy_env_var(self):
+    def replace_export_lines(self, shell, content, names, new_lines):
         """
-        Unsets the proxy environment variables in supported shell configuration files
+        Returns `content` with the exports of `names` replaced by the raw lines `new_lines`, see replace_exports().
+        """
+        patterns = self.export_patterns(shell, names)
+        lines = []
+        position = None
+        for line in content.splitlines(keepends=True):
+            if any(pattern.match(line) for pattern in patterns):
+                position = len(lines) if position is None else position
+            else:
+                lines.append(line)
+        if position is None:
+            position = len(lines)
+            if lines and not lines[-1].endswith("\n"):
+                lines[-1] += "\n"
+        lines[position:position] = new_lines
+        return "".join(lines)
+
+    def update_config_file(self, names, variables):
+        """
+        Replaces the exports of `names` in the configuration file of every installed shell by `variables`.
         """
         for shell in self.shells:
-            if not shell["installed"]:
+            shell_rc = shell.config_path()
+            current = read_file(shell_rc)
+            if current is None and not variables:
                 continue
 
-            shell_rc = shell["config"]
-            if not os.path.exists(shell_rc):
-                continue
-
-            with open(shell_rc, 'r') as f:
-                lines = f.readlines()
-
-            proxy_vars = [
-                "http_proxy",
-                "HTTP_PROXY",
-                "https_proxy",
-                "HTTPS_PROXY",
-                "ftp_proxy",
-                "FTP_PROXY",
-                "rsync_proxy",
-                "RSYNC_PROXY"
-            ]
-
-            proxy_patterns_bash_zsh = [re.compile(rf'export {var}\=.*') for var in proxy_vars]
-            proxy_patterns_fish = [re.compile(rf'set -x {var} .*') for var in proxy_vars]
-
-            if shell["name"] in ["BASH", "ZSH"]:
-                self.remove_matching_lines(lines, proxy_patterns_bash_zsh, shell_rc)
-            elif shell["name"] == "FISH":
-                self.remove_matching_lines(lines, proxy_patterns_fish, shell_rc)
-
-    def remove_matching_lines(self, lines, patterns, shell_rc):
-        try:
-            with open(shell_rc, 'w') as f:
-                for line in lines:
-                    if not any(pattern.match(line) for pattern in patterns):
-                        f.write(line)
-        except FileNotFoundError:
-            pass
+            content = self.replace_exports(shell, current or "", names, variables)
+            if content != current:
+                atomic_write(shell_rc, content)
 
-    def set_bypass_domains_env_var(self):
+    def update_managed_file(self, names, variables):
         """
-        Sets the no_proxy and NO_PROXY environment variables in supported shell configuration
+        Replaces the exports of `names` in the generated file of every installed shell by `variables`. Files are only
+        written if their content changes. The source line is added to the shell's configuration the first time.
         """
-        self.unset_bypass_domains_env_var()
         for shell in self.shells:
-            if not shell["installed"]:
+            include = shell.include_path()
+            current = read_file(include)
+            if current is None and not variables:
                 continue
 
-            shell_rc = shell["config"]
-            if not os.path.exists(shell_rc):
-                open(shell_rc, 'w').close()
-
-            bypass_domains_str = ",".join(self.bypass_domains)
+            content = self.replace_exports(shell, current or "", names, variables)
+            if content != current:
+                atomic_write(include, content)
 
-            if shell["name"] in ["BASH", "ZSH"]:
-                with open(shell_rc, 'a') as f:
-                    f.write(f'export no_proxy="{bypass_domains_str}"\n')
-                    f.write(f'export NO_PROXY="{bypass_domains_str}"\n')
-            elif shell["name"] == "FISH":
-                with open(shell_rc, 'a') as f:
-                    f.write(f'set -x no_proxy "{bypass_domains_str}"\n')
-                    f.write(f'set -x NO_PROXY "{bypass_domains_str}"\n')
+            if variables:
+                self.ensure_source_line(shell)
 
-    def unset_bypass_domains_env_var(self):
+    def ensure_source_line(self, shell):
         """
-        Unsets the no_proxy and NO_PROXY environment variables in supported shell configuration
+        Adds the source line for the generated file to the shell's configuration file, if it is not there yet. Exports
+        written by the unmanaged mode are removed at the same time so they can't shadow the generated file. Once the
+        line was found or added the file is only read again when its inode, size or mtime changed, so toggling the
+        proxy does not depend on the size of the rc file.
         """
-        for shell in self.shells:
-            if not shell["installed"]:
-                continue
+        shell_rc = shell.config_path()
+        source_line = shell.source_line(shell.include_path())
+        identity = _file_identity(shell_rc)
+        if identity is not None and _checked_source_lines.get((shell_rc, source_line)) == identity:
+            return
+
+        content = read_file(shell_rc) or ""
+        if source_line not in content.splitlines(keepends=True):
+            content = self.replace_exports(shell, content, PROXY_VARS + BYPASS_VARS, [])
+            atomic_write(shell_rc, content + source_line)
+        _checked_source_lines[(shell_rc, source_line)] = _file_identity(shell_rc)
+
+    def proxy_variables(self):
+        return [
+            ("http_proxy", f"http://{self.ip_address}:{self.port}/"),
+            ("HTTP_PROXY", f"http://{self.ip_address}:{self.port}/"),
+            ("https_proxy", f"http://{self.ip_address}:{self.port}/"),
+            ("HTTPS_PROXY", f"http://{self.ip_address}:{self.port}/"),
+            ("ftp_proxy", f"ftp://{self.ip_address}:{self.port}/"),
+            ("FTP_PROXY", f"ftp://{self.ip_address}:{self.port}/"),
+            ("rsync_proxy", f"rsync://{self.ip_address}:{self.port}/"),
+            ("RSYNC_PROXY", f"rsync://{self.ip_address}:{self.port}/"),
+        ]
 
-            shell_rc = shell["config"]
-            if not os.path.exists(shell_rc):
-                continue
+    def bypass_domains_variables(self):
+        bypass_domains_str = ",".join(self.bypass_domains)
+        return [("no_proxy", bypass_domains_str), ("NO_PROXY", bypass_domains_str)]
 
-            with open(shell_rc, 'r') as f:
-                lines = f.readlines()
+    def __update(self, names, variables):
+        if self.managed:
+            self.update_managed_file(names, variables)
+        else:
+            self.update_config_file(names, variables)
 
-            bypass_vars = [
-                "no_proxy",
-                "NO_PROXY"
-            ]
+    def set_proxy_env_var(self):
+        """
+        Sets the proxy environment variables in supported shell configuration files
+        """
+        self.__update(PROXY_VARS, self.proxy_variables())
 
-            bypass_patterns_bash_zsh = [re.compile(rf'export {var}\=.*') for var in bypass_vars]
-            bypass_patterns_fish = [re.compile(rf'set -x {var} .*') for var in bypass_vars]
+    def unset_proxy_env_var(self):
+        """
+        Unsets the proxy environment variables in supported shell configuration files
+        """
+        self.__update(PROXY_VARS, [])
+
+    def set_bypass_domains_env_var(self):
+        """
+        Sets the no_proxy and NO_PROXY environment variables in supported shell configuration
+        """
+        self.__update(BYPASS_VARS, self.bypass_domains_variables())
 
-            if shell["name"] in ["BASH", "ZSH"]:
-                self.remove_matching_lines(lines, bypass_patterns_bash_zsh, shell_rc)
-            elif shell["name"] == "FISH":
-                self.remove_matching_lines(lines, bypass_patterns_fish, shell_rc)
+    def unset_bypass_domains_env_var(self):
+        """
+        Unsets the no_proxy and NO_PROXY environment variables in supported shell configuration
+        """
+        self.__update(BYPASS_VARS, [])
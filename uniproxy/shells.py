@@ -0,0 +1,199 @@
+import os
+import platform
+import re
+import warnings
+from abc import ABC, abstractmethod
+
+from xdg import xdg_config_home
+
+from uniproxy.probe import get_probe
+
+MANAGED_MARKER = "# added by uniproxy"
+
+
+class Shell(ABC):
+    """
+    Base class of a shell plugin. A plugin knows where the shell keeps its configuration, how to detect the shell and
+    how to render environment variable exports and a line sourcing another file. Paths are resolved when they are
+    used, not at import time.
+    """
+    name = None
+    bin = None
+
+    @abstractmethod
+    def config_path(self):
+        pass
+
+    def include_path(self):
+        """
+        Returns the path of the file generated by uniproxy in managed mode.
+        """
+        return os.path.join(xdg_config_home(), "uniproxy", f"proxy.{self.bin}")
+
+    def is_installed(self, probe):
+        return probe.is_installed(self.bin)
+
+    @abstractmethod
+    def export_line(self, name, value):
+        pass
+
+    @abstractmethod
+    def export_pattern(self, name):
+        """
+        Returns a regex matching lines written by export_line() for `name`.
+        """
+
+    @abstractmethod
+    def source_line(self, path):
+        pass
+
+    def __getitem__(self, key):
+        """
+        Deprecated dict-style access to the keys the entries of `ShellEnvVar.shells` had before they became Shell
+        objects: `name`, `bin`, `installed`, `config` and `include`.
+        """
+        warnings.warn("ShellEnvVar.shells holds Shell objects, use their attributes and methods instead of keys",
+                      DeprecationWarning, stacklevel=2)
+        legacy_keys = {
+            "name": lambda: self.name,
+            "bin": lambda: self.bin,
+            "installed": lambda: self.is_installed(get_probe()),
+            "config": self.config_path,
+            "include": self.include_path,
+        }
+        if key not in legacy_keys:
+            raise KeyError(key)
+        return legacy_keys[key]()
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+
+class BashShell(Shell):
+    name = "BASH"
+    bin = "bash"
+
+    def config_path(self):
+        return os.path.expanduser("~/.bashrc")
+
+    def export_line(self, name, value):
+        return f'export {name}="{value}"\n'
+
+    def export_pattern(self, name):
+        return re.compile(rf'export {name}\=.*')
+
+    def source_line(self, path):
+        return f'if [ -f "{path}" ]; then . "{path}"; fi  {MANAGED_MARKER}\n'
+
+
+class ZshShell(BashShell):
+    name = "ZSH"
+    bin = "zsh"
+
+    def config_path(self):
+        return os.path.join(os.environ.get("ZDOTDIR", os.path.expanduser("~")), ".zshrc")
+
+
+class FishShell(Shell):
+    name = "FISH"
+    bin = "fish"
+
+    def config_path(self):
+        return os.path.join(xdg_config_home(), "fish/config.fish")
+
+    def export_line(self, name, value):
+        return f'set -x {name} "{value}"\n'
+
+    def export_pattern(self, name):
+        return re.compile(rf'set -x {name} .*')
+
+    def source_line(self, path):
+        return f'test -f "{path}"; and source "{path}"  {MANAGED_MARKER}\n'
+
+
+# The shells below are not registered by default, since registering a shell makes uniproxy edit its configuration
+# file. Enable them with e.g. `register_shell(NushellShell())`.
+
+
+class NushellShell(Shell):
+    name = "NUSHELL"
+    bin = "nu"
+
+    def config_path(self):
+        if platform.system().lower() == "darwin" and "XDG_CONFIG_HOME" not in os.environ:
+            return os.path.expanduser("~/Library/Application Support/nushell/env.nu")
+        return os.path.join(xdg_config_home(), "nushell/env.nu")
+
+    def export_line(self, name, value):
+        return f'$env.{name} = "{value}"\n'
+
+    def export_pattern(self, name):
+        return re.compile(rf'\$env\.{name} = .*')
+
+    def source_line(self, path):
+        # nushell resolves `source` at parse time and has no way to guard it, the generated file is never deleted
+        return f'source "{path}"  {MANAGED_MARKER}\n'
+
+
+class TcshShell(Shell):
+    name = "TCSH"
+    bin = "tcsh"
+
+    def config_path(self):
+        return os.path.expanduser("~/.tcshrc")
+
+    def export_line(self, name, value):
+        return f'setenv {name} "{value}"\n'
+
+    def export_pattern(self, name):
+        return re.compile(rf'setenv {name} .*')
+
+    def source_line(self, path):
+        return f'if ( -f "{path}" ) source "{path}"  {MANAGED_MARKER}\n'
+
+
+class XonshShell(Shell):
+    name = "XONSH"
+    bin = "xonsh"
+
+    def config_path(self):
+        return os.path.expanduser("~/.xonshrc")
+
+    def export_line(self, name, value):
+        return f'${name} = "{value}"\n'
+
+    def export_pattern(self, name):
+        return re.compile(rf'\${name} = .*')
+
+    def source_line(self, path):
+        return f'if __import__("os").path.isfile("{path}"): source "{path}"  {MANAGED_MARKER}\n'
+
+
+_registry = {}
+
+
+def register_shell(shell):
+    """
+    Registers a shell plugin instance. A plugin registered under an existing name replaces it.
+    """
+    _registry[shell.name] = shell
+    return shell
+
+
+def unregister_shell(name):
+    _registry.pop(name, None)
+
+
+def registered_shells():
+    return list(_registry.values())
+
+
+def installed_shells(probe):
+    """
+    Returns the registered shells which are installed. Detection is an in-process PATH lookup cached by `probe`.
+    """
+    return [shell for shell in _registry.values() if shell.is_installed(probe)]
+
+
+for _shell in [BashShell(), ZshShell(), FishShell()]:
+    register_shell(_shell)
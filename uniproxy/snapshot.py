@@ -0,0 +1,208 @@
+import ctypes
+import json
+import os
+import platform
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
+
+from xdg import xdg_state_home
+
+from uniproxy.atomic_file import atomic_write, read_file, remove_file
+from uniproxy.config import ProxyConfig, diff_state, read_state
+from uniproxy.environment_d import BYPASS_DOMAINS_ENV_FILE, PROXY_ENV_FILE
+from uniproxy.shell_env_var import BYPASS_VARS, PROXY_VARS
+
+SNAPSHOT_VERSION = 1
+
+
+def default_snapshot_path():
+    return os.path.join(xdg_state_home(), "uniproxy", "snapshot.json")
+
+
+@dataclass
+class Snapshot:
+    """
+    Proxy state saved by Uniproxy.snapshot(): the backend state as returned by read_state(), the content of the
+    environment files and generated shell files (None for files which did not exist), the proxy exports found in shell
+    configuration files and, on Windows, the proxy variables of the user environment. `pid` is the process which took
+    the snapshot.
+    """
+    state: dict
+    files: dict = field(default_factory=dict)
+    shell_exports: dict = field(default_factory=dict)
+    environment: dict = field(default_factory=dict)
+    platform: str = field(default_factory=lambda: platform.system().lower())
+    pid: int = field(default_factory=os.getpid)
+    version: int = SNAPSHOT_VERSION
+
+
+def capture(proxy):
+    """
+    Returns a Snapshot of `proxy`, a LinuxProxy, MacProxy or WinProxy.
+    """
+    snapshot = Snapshot(state=read_state(proxy, bypass_cache=True))
+
+    env_writer = getattr(proxy, "env_writer", None)
+    if env_writer is not None:
+        for file_name in (PROXY_ENV_FILE, BYPASS_DOMAINS_ENV_FILE):
+            snapshot.files[env_writer.path(file_name)] = env_writer.read(file_name)
+
+    if hasattr(proxy, "shell_env_var"):
+        shell_env_var = proxy.shell_env_var([])
+        for shell in shell_env_var.shells:
+            snapshot.files[shell.include_path()] = read_file(shell.include_path())
+            lines = shell_env_var.export_lines(shell, read_file(shell.config_path()) or "", PROXY_VARS + BYPASS_VARS)
+            snapshot.shell_exports[shell.config_path()] = [line.rstrip("\n") + "\n" for line in lines]
+
+    user_environment = getattr(proxy, "user_environment", None)
+    if user_environment is not None:
+        snapshot.environment = user_environment.read(PROXY_VARS + BYPASS_VARS)
+
+    return snapshot
+
+
+def restore(proxy, snapshot):
+    """
+    Puts `proxy` back into the state of `snapshot` with as few writes as possible, inside a single batch of the
+    backend. Proxies configured for several protocols are restored to the http endpoint. Returns the ChangeReport of
+    the backend state.
+    """
+    if snapshot.version != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {snapshot.version}")
+    if snapshot.platform != platform.system().lower():
+        raise ValueError(f"The snapshot was taken on {snapshot.platform}")
+
+    with proxy.batch() if hasattr(proxy, "batch") else nullcontext():
+        report = _restore_state(proxy, snapshot.state)
+
+        files_changed = False
+        for path, content in snapshot.files.items():
+            if read_file(path) == content:
+                continue
+            if content is None:
+                remove_file(path)
+            else:
+                atomic_write(path, content)
+            files_changed = True
+        if files_changed and hasattr(proxy, "refresh_env_var"):
+            proxy.refresh_env_var()
+
+        if snapshot.shell_exports:
+            shell_env_var = proxy.shell_env_var([])
+            for shell in shell_env_var.shells:
+                if shell.config_path() not in snapshot.shell_exports:
+                    continue
+                current = read_file(shell.config_path())
+                content = shell_env_var.replace_export_lines(shell, current or "", PROXY_VARS + BYPASS_VARS,
+                                                             snapshot.shell_exports[shell.config_path()])
+                if content != (current or ""):
+                    atomic_write(shell.config_path(), content)
+
+        if snapshot.environment:
+            proxy.update_env_var(snapshot.environment)
+
+    return report
+
+
+def _restore_state(proxy, state):
+    endpoints = state["endpoints"]
+    ip_address, port = endpoints.get("http") or next(iter(endpoints.values()), ("", ""))
+    current = read_state(proxy, bypass_cache=True)
+
+    if ip_address and port:
+        config = ProxyConfig(ip_address, int(port), state["enabled"], state["bypass_domains"])
+        report = diff_state(current, config)
+        proxy.ip_address = config.ip_address
+        proxy.port = config.port
+        if report.changed:
+            proxy.apply_config(config, report)
+        return report
+
+    # no proxy server was configured: it is cleared by the same apply_config() as the other settings, the instance
+    # keeps its own server for later operations
+    config = ProxyConfig("", 0, state["enabled"], state["bypass_domains"])
+    report = diff_state(current, config)
+    report.endpoint = any(address for address, _ in current["endpoints"].values())
+    report.after["endpoints"] = {protocol: ("", "") for protocol in report.after["endpoints"]}
+    if report.changed:
+        ip_address, port = proxy.ip_address, proxy.port
+        proxy.ip_address, proxy.port = config.ip_address, config.port
+        try:
+            proxy.apply_config(config, report)
+        finally:
+            proxy.ip_address, proxy.port = ip_address, port
+    return report
+
+
+def save(snapshot, path=None):
+    """
+    Writes `snapshot` atomically to `path`, by default `$XDG_STATE_HOME/uniproxy/snapshot.json`. Raises RuntimeError
+    if `path` holds the snapshot of another process which is still running, since that process restores it later.
+    """
+    path = path or default_snapshot_path()
+    owner = _saved_pid(path)
+    if owner is not None and owner != snapshot.pid and process_alive(owner):
+        raise RuntimeError(f"{path} holds the proxy snapshot of the running process {owner}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    atomic_write(path, json.dumps(asdict(snapshot), separators=(",", ":")))
+
+
+def load(path=None):
+    """
+    Returns the Snapshot saved at `path`, or None if there is none.
+    """
+    content = read_file(path or default_snapshot_path())
+    if content is None:
+        return None
+    data = json.loads(content)
+    if data.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {data.get('version')}")
+    data["state"]["endpoints"] = {protocol: tuple(value) for protocol, value in data["state"]["endpoints"].items()}
+    return Snapshot(**data)
+
+
+def discard(path=None, pid=None):
+    """
+    Removes the snapshot saved at `path` if it was taken by the process `pid`, by default this one. A snapshot which
+    another process saved there in the meantime is kept.
+    """
+    path = path or default_snapshot_path()
+    if _saved_pid(path) == (os.getpid() if pid is None else pid):
+        remove_file(path)
+
+
+def _saved_pid(path):
+    """
+    Returns the pid of the snapshot saved at `path`, or None if there is no readable snapshot.
+    """
+    content = read_file(path)
+    if content is None:
+        return None
+    try:
+        return json.loads(content).get("pid")
+    except (ValueError, AttributeError):
+        return None
+
+
+def process_alive(pid):
+    """
+    Returns True if a process with `pid` is running.
+    """
+    if platform.system().lower() == "windows":
+        # os.kill() would terminate the process on Windows
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+            return exit_code.value == 259  # STILL_ACTIVE
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,108 @@
+import contextvars
+import copy
+import functools
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+class StateCache:
+    """
+    Caches values read from the OS for `ttl` seconds, so call chains which read the same state several times only ask
+    the OS once. The backends invalidate it on their own writes; changes made by others show up after at most `ttl`
+    seconds, or immediately for reads made with `bypass_cache=True`. A `ttl` of 0 disables caching. `hits` and
+    `misses` count the lookups. Every invalidate() starts a new generation; a value loaded while the generation changed
+    may predate the write and is returned but not cached.
+    """
+
+    def __init__(self, ttl=1.0, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.__entries = {}
+        self.__generation = 0
+        self.__lock = threading.Lock()
+        # a context variable instead of a thread local, so bypass() also reaches the threads of ServiceExecutor,
+        # which run their tasks in a copy of the caller's context
+        self.__bypass_depth = contextvars.ContextVar(f"uniproxy_state_cache_bypass_{id(self)}", default=0)
+
+    def get(self, key, loader):
+        """
+        Returns the cached value of `key`, calling `loader` to (re)load it when it is missing, expired or the cache is
+        bypassed.
+        """
+        now = self.clock()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl and not self.bypassed:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self.__generation
+
+        value = loader()
+        if self.ttl > 0:
+            with self.__lock:
+                if generation == self.__generation:
+                    self.__entries[key] = (now, value)
+        return value
+
+    def peek(self, key, default=None):
+        """
+        Returns the cached value of `key` without loading it, or `default` when it is missing, expired or the cache is
+        bypassed. Lookups through peek() are not counted.
+        """
+        now = self.clock()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None or now - entry[0] >= self.ttl or self.bypassed:
+                return default
+            return entry[1]
+
+    def invalidate(self, keep=()):
+        """
+        Drops all cached entries except those named in `keep`.
+        """
+        with self.__lock:
+            self.__generation += 1
+            for key in list(self.__entries):
+                if key not in keep:
+                    del self.__entries[key]
+
+    @property
+    def bypassed(self):
+        return self.__bypass_depth.get() > 0
+
+    @contextmanager
+    def bypass(self):
+        """
+        Makes every read inside the block go to the OS, including reads of worker threads started in it through
+        ServiceExecutor. The values read are still cached.
+        """
+        token = self.__bypass_depth.set(self.__bypass_depth.get() + 1)
+        try:
+            yield self
+        finally:
+            self.__bypass_depth.reset(token)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.__entries)}
+
+
+def cached_state(method):
+    """
+    Caches the result of a getter in `self.state_cache`, keyed by its name and arguments. The getter gains a
+    `bypass_cache` argument which reads from the OS instead, including all nested cached reads, and a `cache_only`
+    argument which returns None instead of reading when the value is not cached. Callers get a copy, so they can't
+    change the cached value.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, bypass_cache=False, cache_only=False, **kwargs):
+        key = (method.__name__,) + args + tuple(sorted(kwargs.items()))
+        if cache_only:
+            return copy.deepcopy(self.state_cache.peek(key))
+        with self.state_cache.bypass() if bypass_cache else nullcontext():
+            value = self.state_cache.get(key, lambda: method(self, *args, **kwargs))
+        return copy.deepcopy(value)
+    return wrapper
@@ -0,0 +1,264 @@
+import contextvars
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+_tracer = None
+_current_span = contextvars.ContextVar("uniproxy_current_span", default=None)
+
+
+class Tracer:
+    """
+    Receives a Span when it starts and when it ends. Spans are created for every public Uniproxy operation (kind
+    "operation") and for everything it does with the OS: child processes ("command"), file reads, writes and removals
+    ("file"), registry access ("registry") and Windows API calls ("api"). Spans of worker threads started by an
+    operation keep it as their parent. Install a tracer with set_tracer() or use_tracer().
+    """
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        pass
+
+
+class Span:
+    """
+    One traced call. `attributes` holds what is known about it, e.g. "argv" and "exit_code" of a command, "path" of
+    a file, "value_name" of a registry value and the "bytes" read or written. `error` is the name of the exception it
+    raised.
+    """
+
+    __slots__ = ("kind", "name", "attributes", "parent", "start", "end", "error", "_tracer", "_token")
+
+    def __init__(self, tracer, kind, name, attributes):
+        self.kind = kind
+        self.name = name
+        self.attributes = attributes
+        self.parent = None
+        self.start = None
+        self.end = None
+        self.error = None
+        self._tracer = tracer
+        self._token = None
+
+    @property
+    def duration(self):
+        return None if self.end is None else self.end - self.start
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def operation(self):
+        """
+        Returns the outermost operation span this span belongs to, or None.
+        """
+        span, operation = self, None
+        while span is not None:
+            if span.kind == "operation":
+                operation = span
+            span = span.parent
+        return operation
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        self._tracer.on_start(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.end = time.perf_counter()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = exc_type.__name__
+            if hasattr(exc, "returncode"):
+                self.attributes.setdefault("exit_code", exc.returncode)
+        self._tracer.on_end(self)
+        return False
+
+
+class _NoopSpan:
+    """
+    Returned by span() while no tracer is installed, so instrumented code costs one check and an empty with block.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def set_tracer(tracer):
+    """
+    Installs `tracer` for the whole process, None removes it. Returns the previous tracer.
+    """
+    global _tracer
+    previous, _tracer = _tracer, tracer
+    return previous
+
+
+def get_tracer():
+    return _tracer
+
+
+@contextmanager
+def use_tracer(tracer):
+    """
+    Installs `tracer` for the duration of the block.
+    """
+    previous = set_tracer(tracer)
+    try:
+        yield tracer
+    finally:
+        set_tracer(previous)
+
+
+def span(kind, name, **attributes):
+    """
+    Returns a context manager tracing the block as a span of `kind` and `name`.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NOOP_SPAN
+    return Span(tracer, kind, name, attributes)
+
+
+def traced_operation(method):
+    """
+    Traces every call of a public Uniproxy method as an "operation" span named after the method.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        tracer = _tracer
+        if tracer is None:
+            return method(*args, **kwargs)
+        with Span(tracer, "operation", method.__name__, {}):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+class Profiler(Tracer):
+    """
+    Tracer which adds up the spans of each operation: the number of calls and the time of the operation, and per kind
+    and name of the OS interactions inside it (e.g. command "gsettings" or file "write") their count, time, bytes and
+    errors. Interactions outside of an operation are listed under "(none)". Use it as a context manager to install it
+    for a block:
+
+        with Profiler() as profiler:
+            prox.join()
+        print(profiler.report())
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__previous = None
+        self.operations = {}
+
+    def on_end(self, span):
+        operation = span.operation()
+        with self.__lock:
+            if span is operation:
+                stats = self.__operation_stats(span.name)
+                stats["calls"] += 1
+                stats["seconds"] += span.duration
+                stats["errors"] += span.error is not None
+                return
+            if span.kind == "operation":
+                # nested operations, e.g. restore() inside recover(), are counted as part of the outer one
+                return
+            stats = self.__operation_stats(operation.name if operation is not None else "(none)")
+            calls = stats["calls_by_kind"].setdefault(f"{span.kind} {span.name}",
+                                                      {"calls": 0, "seconds": 0.0, "bytes": 0, "errors": 0})
+            calls["calls"] += 1
+            calls["seconds"] += span.duration
+            calls["bytes"] += span.attributes.get("bytes", 0)
+            calls["errors"] += span.error is not None
+
+    def __operation_stats(self, name):
+        if name not in self.operations:
+            self.operations[name] = {"calls": 0, "seconds": 0.0, "errors": 0, "calls_by_kind": {}}
+        return self.operations[name]
+
+    def reset(self):
+        with self.__lock:
+            self.operations = {}
+
+    def __enter__(self):
+        self.__previous = set_tracer(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        set_tracer(self.__previous)
+        return False
+
+    def report(self):
+        """
+        Returns a per operation breakdown as text, slowest operations and interactions first.
+        """
+        lines = []
+        with self.__lock:
+            operations = sorted(self.operations.items(), key=lambda item: item[1]["seconds"], reverse=True)
+            for name, stats in operations:
+                lines.append(f"{name}: {stats['calls']} calls, {stats['seconds'] * 1000:.1f} ms"
+                             + (f", {stats['errors']} errors" if stats["errors"] else ""))
+                calls_by_kind = sorted(stats["calls_by_kind"].items(), key=lambda item: item[1]["seconds"],
+                                       reverse=True)
+                for kind_name, calls in calls_by_kind:
+                    errors = f"  {calls['errors']} errors" if calls["errors"] else ""
+                    lines.append(f"  {kind_name:<32}{calls['calls']:>6} calls{calls['seconds'] * 1000:>10.1f} ms"
+                                 f"{calls['bytes']:>10} bytes{errors}")
+        return "\n".join(lines)
+
+    def to_json(self):
+        with self.__lock:
+            return json.dumps(self.operations, indent=2)
+
+    def to_prometheus(self):
+        """
+        Returns the totals in the Prometheus text exposition format.
+        """
+        metrics = {
+            "uniproxy_operation_calls_total": ("counter", "Calls of each Uniproxy operation.", []),
+            "uniproxy_operation_seconds_total": ("counter", "Time spent in each Uniproxy operation.", []),
+            "uniproxy_operation_errors_total": ("counter", "Uniproxy operations which raised.", []),
+            "uniproxy_io_calls_total": ("counter", "OS interactions per operation, kind and name.", []),
+            "uniproxy_io_seconds_total": ("counter", "Time spent in OS interactions.", []),
+            "uniproxy_io_bytes_total": ("counter", "Bytes read or written by OS interactions.", []),
+            "uniproxy_io_errors_total": ("counter", "OS interactions which raised.", []),
+        }
+        with self.__lock:
+            for name, stats in self.operations.items():
+                labels = f'operation="{_escape(name)}"'
+                metrics["uniproxy_operation_calls_total"][2].append((labels, stats["calls"]))
+                metrics["uniproxy_operation_seconds_total"][2].append((labels, stats["seconds"]))
+                metrics["uniproxy_operation_errors_total"][2].append((labels, stats["errors"]))
+                for kind_name, calls in stats["calls_by_kind"].items():
+                    kind, io_name = kind_name.split(" ", 1)
+                    io_labels = f'{labels},kind="{_escape(kind)}",name="{_escape(io_name)}"'
+                    metrics["uniproxy_io_calls_total"][2].append((io_labels, calls["calls"]))
+                    metrics["uniproxy_io_seconds_total"][2].append((io_labels, calls["seconds"]))
+                    metrics["uniproxy_io_bytes_total"][2].append((io_labels, calls["bytes"]))
+                    metrics["uniproxy_io_errors_total"][2].append((io_labels, calls["errors"]))
+
+        lines = []
+        for metric, (metric_type, help_text, samples) in metrics.items():
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+            lines.extend(f"{metric}{{{labels}}} {value}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,278 @@
+import ctypes
+import ctypes.util
+import functools
+import os
+import queue
+import select
+import struct
+import subprocess
+import threading
+
+from uniproxy.config import diff_states, read_state
+from uniproxy.refresh_scheduler import RefreshScheduler
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_IGNORED = 0x8000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifySource:
+    """
+    Reports changes of `paths` with inotify. The parent directories are watched instead of the files themselves, so
+    files replaced by an atomic rename keep being followed. For a directory which does not exist yet, e.g.
+    ~/.config/environment.d before the first write, its nearest existing ancestor is watched until it is created.
+    """
+
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, paths):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.__directories = {}
+        for path in self.paths:
+            self.__directories.setdefault(os.path.dirname(path), set()).add(os.path.basename(path))
+        self.__thread = None
+        self.__wakeup = None
+        self.__directory_by_watch = {}
+        self.__names_by_watch = {}
+        self.__creates_by_watch = {}
+
+    @staticmethod
+    def is_supported():
+        try:
+            return hasattr(_libc(), "inotify_init1")
+        except (OSError, TypeError):
+            return False
+
+    def start(self, notify):
+        fd = _libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.__directory_by_watch = {}
+        self.__names_by_watch = {}
+        self.__add_watches(fd)
+
+        self.__wakeup = os.pipe()
+        self.__thread = threading.Thread(target=self.__run, args=(fd, notify), name="uniproxy-inotify", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is not None:
+            os.write(self.__wakeup[1], b"x")
+            self.__thread.join()
+            for fd in self.__wakeup:
+                os.close(fd)
+            self.__thread = None
+
+    def __add_watches(self, fd):
+        """
+        Watches every directory of the paths which exists and is not watched yet, and the nearest existing ancestor of
+        the others. Returns True if a newly watched directory already contains one of the paths, i.e. it was created
+        together with them.
+        """
+        libc = _libc()
+        watched = set(self.__directory_by_watch.values())
+        self.__creates_by_watch = {}
+        found = False
+        for directory, names in self.__directories.items():
+            if directory in watched:
+                continue
+            watch = libc.inotify_add_watch(fd, os.fsencode(directory), self.MASK)
+            if watch >= 0:
+                self.__directory_by_watch[watch] = directory
+                self.__names_by_watch.setdefault(watch, set()).update(names)
+                found = found or any(os.path.exists(os.path.join(directory, name)) for name in names)
+                continue
+
+            ancestor = directory
+            while True:
+                ancestor, child = os.path.dirname(ancestor), os.path.basename(ancestor)
+                watch = libc.inotify_add_watch(fd, os.fsencode(ancestor), self.MASK)
+                if watch >= 0:
+                    self.__creates_by_watch.setdefault(watch, set()).add(child)
+                    break
+                if ancestor == os.path.dirname(ancestor):
+                    break
+        return found
+
+    def __run(self, fd, notify):
+        try:
+            while True:
+                readable, _, _ = select.select([fd, self.__wakeup[0]], [], [])
+                if self.__wakeup[0] in readable:
+                    return
+                try:
+                    data = os.read(fd, 4096)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                changed = False
+                created = False
+                while offset + _INOTIFY_EVENT.size <= len(data):
+                    watch, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                    name = data[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + length].rstrip(b"\0")
+                    name = os.fsdecode(name)
+                    offset += _INOTIFY_EVENT.size + length
+                    if mask & IN_IGNORED:
+                        # the directory was removed, go back to waiting for it to be created
+                        self.__directory_by_watch.pop(watch, None)
+                        self.__names_by_watch.pop(watch, None)
+                        created = True
+                    elif name in self.__names_by_watch.get(watch, ()):
+                        changed = True
+                    elif mask & (IN_CREATE | IN_MOVED_TO) and name in self.__creates_by_watch.get(watch, ()):
+                        created = True
+                if created and self.__add_watches(fd):
+                    changed = True
+                if changed:
+                    notify()
+        finally:
+            os.close(fd)
+
+
+class CommandSource:
+    """
+    Runs a long-lived monitoring command like `dconf watch /system/proxy/` and reports a change for every line it
+    prints. `input` is written to its stdin, which is kept open for interactive tools like scutil.
+    """
+
+    def __init__(self, cmd, input=None):
+        self.cmd = cmd
+        self.input = input
+        self.__process = None
+        self.__thread = None
+
+    def start(self, notify):
+        self.__process = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                          stderr=subprocess.DEVNULL, text=True)
+        if self.input:
+            self.__process.stdin.write(self.input)
+            self.__process.stdin.flush()
+        self.__thread = threading.Thread(target=self.__run, args=(notify,), name="uniproxy-monitor", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__process is not None:
+            self.__process.terminate()
+            self.__process.wait()
+            self.__thread.join()
+            self.__process.stdin.close()
+            self.__process.stdout.close()
+            self.__process = None
+
+    def __run(self, notify):
+        for line in self.__process.stdout:
+            if line.strip():
+                notify()
+
+
+class PollingSource:
+    """
+    Fallback for platforms without change notifications: reports a possible change every `interval` seconds, the
+    watcher only delivers it if the state actually differs.
+    """
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def start(self, notify):
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, args=(notify,), name="uniproxy-poll", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if self.__thread is not None:
+            self.__stopped.set()
+            self.__thread.join()
+            self.__thread = None
+
+    def __run(self, notify):
+        while not self.__stopped.wait(self.interval):
+            notify()
+
+
+class ProxyWatcher:
+    """
+    Watches the proxy settings read through `proxy`, a LinuxProxy, MacProxy or WinProxy, and delivers every change
+    as a ChangeReport (see uniproxy.config), either to `callback` or, without a callback, by iterating over the
+    watcher. Events of the `sources` arriving within `debounce` seconds are merged into one state read, so a burst of
+    writes yields one report with the final state.
+    """
+
+    _STOP = object()
+
+    def __init__(self, proxy, callback=None, debounce=0.2, sources=None, poll_interval=2.0):
+        self.proxy = proxy
+        self.callback = callback
+        self.sources = sources if sources is not None else proxy.change_sources(poll_interval)
+        self.scheduler = RefreshScheduler(self.__check, debounce)
+        self.state = None
+        self.__changes = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__running = False
+
+    def start(self):
+        if self.__running:
+            return self
+        self.state = read_state(self.proxy, bypass_cache=True)
+        for source in self.sources:
+            source.start(self.scheduler.request)
+        self.__running = True
+        return self
+
+    def stop(self):
+        if not self.__running:
+            return
+        self.__running = False
+        for source in self.sources:
+            source.stop()
+        self.scheduler.flush()
+        self.__changes.put(self._STOP)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def __check(self):
+        with self.__lock:
+            state = read_state(self.proxy, bypass_cache=True)
+            report = diff_states(self.state, state)
+            self.state = state
+        if not report.changed:
+            return
+        if self.callback is not None:
+            self.callback(report)
+        else:
+            self.__changes.put(report)
+
+    def changes(self, timeout=None):
+        """
+        Yields the changes as they arrive until the watcher is stopped, or until no change arrived for `timeout`
+        seconds.
+        """
+        while True:
+            try:
+                report = self.__changes.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if report is self._STOP:
+                return
+            yield report
+
+    def __iter__(self):
+        return self.changes()
+
+
+@functools.lru_cache(maxsize=None)
+def _libc():
+    return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
@@ -0,0 +1,68 @@
+import ctypes
+import winreg
+
+from uniproxy import tracing
+from uniproxy.win_registry import delete_value, query_value, set_value
+
+HWND_BROADCAST = 0xFFFF
+WM_SETTINGCHANGE = 0x001A
+SMTO_ABORTIFHUNG = 0x0002
+
+
+class UserEnvironment:
+    """
+    Writes user environment variables directly to HKCU\\Environment, which is where `setx` stores them, without its
+    1024 character limit and without spawning a process per variable. Unchanged values are not written. Running
+    programs are told about changes by broadcast(), which callers should send once after all updates.
+    """
+
+    def __init__(self, broadcast_timeout=5000):
+        self.broadcast_timeout = broadcast_timeout
+
+    def read(self, names):
+        """
+        Returns a dict mapping each of `names` to its value, or None if the variable is not set.
+        """
+        values = {}
+        with winreg.CreateKeyEx(winreg.HKEY_CURRENT_USER, "Environment", 0, winreg.KEY_QUERY_VALUE) as key:
+            for name in names:
+                try:
+                    values[name] = query_value(key, name)[0]
+                except FileNotFoundError:
+                    values[name] = None
+        return values
+
+    def update(self, variables):
+        """
+        Sets every variable of `variables`, a dict mapping names to values, in one pass over the registry key. A value
+        of None or "" deletes the variable. Returns True if anything changed.
+        """
+        changed = False
+        with winreg.CreateKeyEx(winreg.HKEY_CURRENT_USER, "Environment", 0,
+                                winreg.KEY_QUERY_VALUE | winreg.KEY_SET_VALUE) as key:
+            for name, value in variables.items():
+                try:
+                    current, reg_type = query_value(key, name)
+                except FileNotFoundError:
+                    current, reg_type = None, winreg.REG_SZ
+
+                if not value:
+                    if current is not None:
+                        delete_value(key, name)
+                        changed = True
+                elif current != value:
+                    if reg_type not in (winreg.REG_SZ, winreg.REG_EXPAND_SZ):
+                        reg_type = winreg.REG_SZ
+                    set_value(key, name, reg_type, value)
+                    changed = True
+        return changed
+
+    def broadcast(self):
+        """
+        Sends WM_SETTINGCHANGE for "Environment" to all top level windows, so Explorer and other programs pick up the
+        new environment for processes they start.
+        """
+        result = ctypes.c_ulong()
+        with tracing.span("api", "SendMessageTimeoutW"):
+            ctypes.windll.user32.SendMessageTimeoutW(HWND_BROADCAST, WM_SETTINGCHANGE, 0, "Environment",
+                                                     SMTO_ABORTIFHUNG, self.broadcast_timeout, ctypes.byref(result))
@@ -0,0 +1,185 @@
+import ctypes
+from ctypes import wintypes
+
+from uniproxy import tracing
+
+INTERNET_OPTION_PER_CONNECTION_OPTION = 75
+
+INTERNET_PER_CONN_FLAGS = 1
+INTERNET_PER_CONN_PROXY_SERVER = 2
+INTERNET_PER_CONN_PROXY_BYPASS = 3
+
+PROXY_TYPE_DIRECT = 0x1
+PROXY_TYPE_PROXY = 0x2
+
+# winreg value types reported by PerConnectionBatch.query(), defined here so this module imports without winreg
+REG_SZ = 1
+REG_DWORD = 4
+
+
+class INTERNET_PER_CONN_OPTION_VALUE(ctypes.Union):
+    _fields_ = [
+        ("dwValue", wintypes.DWORD),
+        ("pszValue", ctypes.c_void_p),
+        ("ftValue", wintypes.FILETIME),
+    ]
+
+
+class INTERNET_PER_CONN_OPTIONW(ctypes.Structure):
+    _fields_ = [
+        ("dwOption", wintypes.DWORD),
+        ("Value", INTERNET_PER_CONN_OPTION_VALUE),
+    ]
+
+
+class INTERNET_PER_CONN_OPTION_LISTW(ctypes.Structure):
+    _fields_ = [
+        ("dwSize", wintypes.DWORD),
+        ("pszConnection", wintypes.LPWSTR),
+        ("dwOptionCount", wintypes.DWORD),
+        ("dwOptionError", wintypes.DWORD),
+        ("pOptions", ctypes.POINTER(INTERNET_PER_CONN_OPTIONW)),
+    ]
+
+
+class WinInetProxySettings:
+    """
+    Reads and writes the proxy flags, server and bypass list of one WinINet connection with a single
+    INTERNET_OPTION_PER_CONNECTION_OPTION call each. `connection` is the name of a RAS/VPN connection, None selects
+    the LAN settings.
+    """
+
+    def __init__(self, connection=None):
+        self.connection = connection
+        self.internet_set_option = ctypes.windll.Wininet.InternetSetOptionW
+        self.internet_query_option = ctypes.windll.Wininet.InternetQueryOptionW
+        self.global_free = ctypes.windll.kernel32.GlobalFree
+
+    def __option_list(self, options):
+        option_list = INTERNET_PER_CONN_OPTION_LISTW()
+        option_list.dwSize = ctypes.sizeof(INTERNET_PER_CONN_OPTION_LISTW)
+        option_list.pszConnection = self.connection
+        option_list.dwOptionCount = len(options)
+        option_list.dwOptionError = 0
+        option_list.pOptions = options
+        return option_list
+
+    def query(self):
+        """
+        Returns a dict with the "flags", "proxy_server" and "proxy_bypass" of the connection.
+        """
+        options = (INTERNET_PER_CONN_OPTIONW * 3)()
+        options[0].dwOption = INTERNET_PER_CONN_FLAGS
+        options[1].dwOption = INTERNET_PER_CONN_PROXY_SERVER
+        options[2].dwOption = INTERNET_PER_CONN_PROXY_BYPASS
+        option_list = self.__option_list(options)
+        size = wintypes.DWORD(ctypes.sizeof(option_list))
+
+        with tracing.span("api", "InternetQueryOptionW", connection=self.connection):
+            queried = self.internet_query_option(None, INTERNET_OPTION_PER_CONNECTION_OPTION,
+                                                 ctypes.byref(option_list), ctypes.byref(size))
+        if not queried:
+            raise OSError(f"Unable to query the proxy settings of {self.connection or 'the LAN connection'}")
+
+        return {
+            "flags": options[0].Value.dwValue,
+            "proxy_server": self.__take_string(options[1].Value.pszValue),
+            "proxy_bypass": self.__take_string(options[2].Value.pszValue),
+        }
+
+    def __take_string(self, pointer):
+        # strings returned by WinINet are allocated with GlobalAlloc and owned by the caller
+        if not pointer:
+            return ""
+        try:
+            return ctypes.wstring_at(pointer)
+        finally:
+            self.global_free(ctypes.c_void_p(pointer))
+
+    def set(self, flags, proxy_server, proxy_bypass):
+        """
+        Sets the flags, proxy server and bypass list of the connection in one call.
+        """
+        buffers = [ctypes.create_unicode_buffer(proxy_server), ctypes.create_unicode_buffer(proxy_bypass)]
+        options = (INTERNET_PER_CONN_OPTIONW * 3)()
+        options[0].dwOption = INTERNET_PER_CONN_FLAGS
+        options[0].Value.dwValue = flags
+        options[1].dwOption = INTERNET_PER_CONN_PROXY_SERVER
+        options[1].Value.pszValue = ctypes.cast(buffers[0], ctypes.c_void_p)
+        options[2].dwOption = INTERNET_PER_CONN_PROXY_BYPASS
+        options[2].Value.pszValue = ctypes.cast(buffers[1], ctypes.c_void_p)
+        option_list = self.__option_list(options)
+
+        with tracing.span("api", "InternetSetOptionW", connection=self.connection):
+            stored = self.internet_set_option(None, INTERNET_OPTION_PER_CONNECTION_OPTION, ctypes.byref(option_list),
+                                              ctypes.sizeof(option_list))
+        if not stored:
+            raise OSError(f"Unable to set the proxy settings of {self.connection or 'the LAN connection'}")
+
+
+class PerConnectionBatch:
+    """
+    Drop-in replacement of RegistryBatch for the ProxyEnable, ProxyServer and ProxyOverride values, backed by
+    WinInetProxySettings: the settings are queried once and all changes are written by a single set() in commit().
+    Proxy flags other than PROXY_TYPE_PROXY, e.g. an auto config URL, are kept. `load` replaces settings.query() as the
+    source of the state, e.g. to read it from a cache.
+    """
+
+    def __init__(self, settings, load=None):
+        self.settings = settings
+        self.__load_state = load or settings.query
+        self.__state = None
+        self.__pending = {}
+
+    def __load(self):
+        if self.__state is None:
+            self.__state = self.__load_state()
+        return self.__state
+
+    def __values(self, state):
+        return {
+            "ProxyEnable": 1 if state["flags"] & PROXY_TYPE_PROXY else 0,
+            "ProxyServer": state["proxy_server"],
+            "ProxyOverride": state["proxy_bypass"],
+        }
+
+    def query(self, name):
+        """
+        Returns `(value, type)` like winreg.QueryValueEx. Raises FileNotFoundError for an empty server or bypass list,
+        which is how WinINet reports them when they are not set.
+        """
+        values = {**self.__values(self.__load()), **self.__pending}
+        if name not in values:
+            raise FileNotFoundError(f"{name} is not a per connection proxy option")
+        value = values[name]
+        if value == "":
+            raise FileNotFoundError(f"{name} is not set")
+        return value, REG_DWORD if name == "ProxyEnable" else REG_SZ
+
+    def set(self, name, value):
+        if name not in ("ProxyEnable", "ProxyServer", "ProxyOverride"):
+            raise ValueError(f"{name} is not a per connection proxy option")
+        self.__pending[name] = value
+
+    def commit(self):
+        """
+        Writes the buffered changes with one call if any of them differs from the queried state. Returns True if
+        anything was written.
+        """
+        if not self.__pending:
+            return False
+        state = self.__load()
+        current = self.__values(state)
+        wanted = {**current, **self.__pending}
+        self.__pending = {}
+        if wanted == current:
+            return False
+
+        flags = state["flags"] | PROXY_TYPE_DIRECT
+        if wanted["ProxyEnable"]:
+            flags |= PROXY_TYPE_PROXY
+        else:
+            flags &= ~PROXY_TYPE_PROXY
+        self.settings.set(flags, wanted["ProxyServer"], wanted["ProxyOverride"])
+        self.__state = {"flags": flags, "proxy_server": wanted["ProxyServer"], "proxy_bypass": wanted["ProxyOverride"]}
+        return True
@@ -1,32 +1,158 @@
+import contextvars
+import functools
 import winreg
 import ctypes
-import subprocess
+from contextlib import contextmanager
+
+from uniproxy import tracing
+from uniproxy.refresh_scheduler import RefreshScheduler
+from uniproxy.state_cache import StateCache, cached_state
+from uniproxy.win_env import UserEnvironment
+from uniproxy.win_inet import WinInetProxySettings, PerConnectionBatch
+from uniproxy.win_registry import RegistryBatch, query_value
+from uniproxy.watch import PollingSource
+
+INTERNET_SETTINGS_VALUES = ("ProxyEnable", "ProxyServer", "ProxyOverride")
+
+
+def operation(method):
+    """
+    Runs `method` as one operation: its `Internet Settings` writes are committed together at the end, followed by at
+    most one WinINet refresh and one environment broadcast.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.batch():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def reading(method):
+    """
+    Runs the getter `method` inside read_batch(), so it and the getters it calls query the proxy settings once.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.read_batch():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 class WinProxy:
-    def __init__(self, ip_address, port):
+    """
+    With `backend` "registry" the proxy is written to the `Internet Settings` registry values. With "wininet" it is
+    written through INTERNET_OPTION_PER_CONNECTION_OPTION in one call per operation, for the LAN settings or for the
+    RAS/VPN connection named by `connection`.
+    """
+
+    def __init__(self, ip_address, port, backend="registry", connection=None, state_ttl=1.0):
+        if backend not in ("registry", "wininet"):
+            raise ValueError(f"Unknown backend {backend}, expected 'registry' or 'wininet'")
+        if connection is not None and backend != "wininet":
+            raise ValueError("A connection can only be selected with the 'wininet' backend")
 
         self.regkey = winreg.OpenKey(winreg.HKEY_CURRENT_USER, r'Software\Microsoft\Windows\CurrentVersion\Internet Settings', 0, winreg.KEY_ALL_ACCESS)
         self.internet_option_refresh = 37
         self.internet_option_settings_changed = 39
         self.internet_set_option = ctypes.windll.Wininet.InternetSetOptionW
+        self.backend = backend
+        self.inet_settings = WinInetProxySettings(connection) if backend == "wininet" else None
+        self.refresh_scheduler = RefreshScheduler(self.__notify_internet_settings)
+        self.__registry_batch = None
+        self.__read_batch = contextvars.ContextVar(f"uniproxy_win_read_batch_{id(self)}", default=None)
+        self.user_environment = UserEnvironment()
+        # proxy settings reads are cached for `state_ttl` seconds and dropped on every write of this instance
+        self.state_cache = StateCache(state_ttl)
+        self.environment_broadcast = RefreshScheduler(self.user_environment.broadcast)
 
         self.ip_address = ip_address
         self.port      = port
 
     def refresh(self):
-        self.internet_set_option(0, self.internet_option_settings_changed, 0, 0)
-        self.internet_set_option(0, self.internet_option_refresh, 0, 0)
+        """
+        Tells WinINet that the proxy settings changed. Inside an operation this is deferred until it ends.
+        """
+        self.refresh_scheduler.request()
 
-    def set_key(self, name, value):
+    def __notify_internet_settings(self):
+        with tracing.span("api", "InternetSetOptionW", option="refresh"):
+            self.internet_set_option(0, self.internet_option_settings_changed, 0, 0)
+            self.internet_set_option(0, self.internet_option_refresh, 0, 0)
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups several operations into one, see operation().
+        """
+        with self.environment_broadcast.batch(), self.refresh_scheduler.batch(), self.registry_batch():
+            yield self
+
+    @contextmanager
+    def registry_batch(self):
+        """
+        Buffers `Internet Settings` writes until the outermost batch ends, then writes the values which changed and
+        requests a refresh if there were any.
+        """
+        if self.__registry_batch is not None:
+            yield self.__registry_batch
+            return
+
+        if self.inet_settings is not None:
+            self.__registry_batch = PerConnectionBatch(self.inet_settings)
+        else:
+            self.__registry_batch = RegistryBatch(self.regkey, INTERNET_SETTINGS_VALUES)
         try:
-            _, reg_type = winreg.QueryValueEx(self.regkey, name)
-            winreg.SetValueEx(self.regkey, name, 0, reg_type, value)
-        except FileNotFoundError:
-            winreg.SetValueEx(self.regkey, name, 0, winreg.REG_SZ, value)
+            yield self.__registry_batch
+        finally:
+            batch, self.__registry_batch = self.__registry_batch, None
+            try:
+                if batch.commit():
+                    self.refresh()
+            finally:
+                self.state_cache.invalidate()
+
+    @contextmanager
+    def read_batch(self):
+        """
+        Makes the reads inside the block share one InternetQueryOptionW call of the wininet backend, which returns all
+        per connection options at once. Inside registry_batch() its snapshot is used instead.
+        """
+        if self.inet_settings is None or self.__read_batch.get() is not None:
+            yield
+            return
+        token = self.__read_batch.set(PerConnectionBatch(self.inet_settings, self.__connection_options))
+        try:
+            yield
+        finally:
+            self.__read_batch.reset(token)
 
+    @cached_state
+    def __connection_options(self):
+        return self.inet_settings.query()
+
+    def query_key(self, name):
+        if self.__registry_batch is not None:
+            return self.__registry_batch.query(name)
+        if self.inet_settings is not None:
+            with self.read_batch():
+                return self.__read_batch.get().query(name)
+        return query_value(self.regkey, name)
+
+    def set_key(self, name, value):
+        with self.registry_batch() as batch:
+            batch.set(name, value)
+        self.state_cache.invalidate()
+
+    def proxy_server(self):
+        """
+        The ProxyServer value of the configured server, empty without an ip address.
+        """
+        return u'%s:%i' % (self.ip_address, self.port) if self.ip_address else ''
+
+    @operation
     def set_proxy(self):
         try:
-            self.set_key('ProxyServer', u'%s:%i' % (self.ip_address, self.port))
+            self.set_key('ProxyServer', self.proxy_server())
 
             if self.get_enable():
                 self.set_proxy_env_var()
@@ -37,10 +163,12 @@ class WinProxy:
             return False
 
 
+    @cached_state
+    @reading
     def get_proxy(self):
         try:
             is_enable = self.get_enable()
-            proxy_server = winreg.QueryValueEx(self.regkey, 'ProxyServer')[0]
+            proxy_server = self.query_key('ProxyServer')[0]
             proxies = self.extract_proxies(proxy_server)
             return {
                 "is_enable": is_enable,
@@ -59,6 +187,8 @@ class WinProxy:
     def extract_proxies(self, proxy_server):
         proxies = {}
         for proxy in proxy_server.split(';'):
+            if not proxy:
+                continue
             if '=' in proxy:
                 protocol, address = proxy.split('=', 1)
                 ip_address, port = address.split(':')
@@ -70,6 +200,7 @@ class WinProxy:
                 proxies["ftp"] = {"ip_address": ip_address, "port": port}
         return proxies
 
+    @operation
     def set_enable(self, is_enable):
         self.set_key('ProxyEnable', 1 if is_enable else 0)
 
@@ -80,76 +211,103 @@ class WinProxy:
             self.unset_proxy_env_var()
             self.unset_bypass_domains_env_var()
 
-        self.refresh()
+    @operation
+    def apply_config(self, config, report):
+        """
+        Writes the parts of `config` flagged in `report` (see Uniproxy.apply()) in one registry batch, followed by a
+        single refresh. `self.ip_address` and `self.port` must already match `config`, an empty ip address clears the
+        proxy server.
+        """
+        if report.endpoint:
+            self.set_key('ProxyServer', self.proxy_server())
+        if report.enabled:
+            self.set_key('ProxyEnable', 1 if config.enabled else 0)
+        if report.bypass_domains:
+            self.set_key('ProxyOverride', ';'.join(report.after["bypass_domains"]))
+
+        if not config.enabled:
+            if report.enabled:
+                self.unset_proxy_env_var()
+                self.unset_bypass_domains_env_var()
+            return
+        if report.endpoint or report.enabled:
+            self.set_proxy_env_var()
+        if report.bypass_domains or report.enabled:
+            self.set_bypass_domains_env_var()
+
+    def change_sources(self, poll_interval=2.0):
+        """
+        Returns the sources reporting changes of the proxy settings, see uniproxy.watch. Windows is polled.
+        """
+        return [PollingSource(poll_interval)]
 
+    @cached_state
+    @reading
     def get_enable(self):
         try:
-            return winreg.QueryValueEx(self.regkey, 'ProxyEnable')[0] == 1
+            return self.query_key('ProxyEnable')[0] == 1
         except FileNotFoundError:
             return False
 
+    @operation
     def set_bypass_domains(self, domains: list[str]):
         self.set_key('ProxyOverride', ';'.join(domains))
 
         if self.get_enable():
             self.set_bypass_domains_env_var()
 
-        self.refresh()
-
+    @cached_state
+    @reading
     def get_bypass_domains(self):
         try:
-            return winreg.QueryValueEx(self.regkey, 'ProxyOverride')[0].split(';')
+            return self.query_key('ProxyOverride')[0].split(';')
         except FileNotFoundError:
             return []
 
+    @operation
     def del_proxy(self):
         try:
             self.set_enable(False)
             self.set_key('ProxyServer', '')
             self.set_key('ProxyOverride', '<local>')
-            self.refresh()
         except FileNotFoundError:
             pass
 
+    @operation
     def join(self):
         self.set_proxy()
         self.set_enable(True)
-        self.refresh()
 
-    def set_proxy_env_var(self):
-        self.unset_proxy_env_var()
+    def update_env_var(self, variables):
+        """
+        Writes `variables` to the user environment and requests a WM_SETTINGCHANGE broadcast if anything changed.
+        """
         try:
-            subprocess.run(["setx", "http_proxy", f"http://{self.ip_address}:{self.port}/"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "HTTP_PROXY", f"http://{self.ip_address}:{self.port}/"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "https_proxy", f"http://{self.ip_address}:{self.port}/"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "HTTPS_PROXY", f"http://{self.ip_address}:{self.port}/"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "ftp_proxy", f"ftp://{self.ip_address}:{self.port}/"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "FTP_PROXY", f"ftp://{self.ip_address}:{self.port}/"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        except subprocess.CalledProcessError as e:
-            raise ValueError(f"Unable to set proxy environment variables: {e}")
+            if self.user_environment.update(variables):
+                self.environment_broadcast.request()
+        except OSError as e:
+            raise ValueError(f"Unable to update environment variables: {e}")
+
+    @operation
+    def set_proxy_env_var(self):
+        self.update_env_var({
+            "http_proxy": f"http://{self.ip_address}:{self.port}/",
+            "HTTP_PROXY": f"http://{self.ip_address}:{self.port}/",
+            "https_proxy": f"http://{self.ip_address}:{self.port}/",
+            "HTTPS_PROXY": f"http://{self.ip_address}:{self.port}/",
+            "ftp_proxy": f"ftp://{self.ip_address}:{self.port}/",
+            "FTP_PROXY": f"ftp://{self.ip_address}:{self.port}/",
+        })
 
+    @operation
     def unset_proxy_env_var(self):
-        try:
-            subprocess.run(["setx", "http_proxy", ""], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "HTTP_PROXY", ""], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "https_proxy", ""], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "HTTPS_PROXY", ""], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "ftp_proxy", ""], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "FTP_PROXY", ""], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        except subprocess.CalledProcessError as e:
-            raise ValueError(f"Unable to unset proxy environment variables: {e}")
+        self.update_env_var({name: None for name in ["http_proxy", "HTTP_PROXY", "https_proxy", "HTTPS_PROXY", "ftp_proxy", "FTP_PROXY"]})
 
+    @operation
     def set_bypass_domains_env_var(self):
-        self.unset_bypass_domains_env_var()
-        try:
-            subprocess.run(["setx", "no_proxy", f'"{",".join(self.get_bypass_domains())}"'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "NO_PROXY", f'"{",".join(self.get_bypass_domains())}"'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        except subprocess.CalledProcessError as e:
-            raise ValueError(f"Unable to set bypass domains environment variables: {e}")
+        bypass_domains = ",".join(self.get_bypass_domains())
+        self.update_env_var({"no_proxy": bypass_domains, "NO_PROXY": bypass_domains})
 
+    @operation
     def unset_bypass_domains_env_var(self):
-        try:
-            subprocess.run(["setx", "no_proxy", ""], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-            subprocess.run(["setx", "NO_PROXY", ""], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True, creationflags=subprocess.CREATE_NO_WINDOW)
-        except subprocess.CalledProcessError as e:
-            raise ValueError(f"Unable to unset bypass domains environment variables: {e}")
+        self.update_env_var({"no_proxy": None, "NO_PROXY": None})
@@ -0,0 +1,89 @@
+import winreg
+
+from uniproxy import tracing
+
+
+def query_value(key, name):
+    """
+    winreg.QueryValueEx() traced as a "registry" span, like the other registry calls of uniproxy.
+    """
+    with tracing.span("registry", "QueryValueEx", value_name=name):
+        return winreg.QueryValueEx(key, name)
+
+
+def set_value(key, name, reg_type, value):
+    # REG_SZ values are stored as null terminated UTF-16
+    size = 4 if reg_type == winreg.REG_DWORD else 2 * (len(str(value)) + 1)
+    with tracing.span("registry", "SetValueEx", value_name=name, bytes=size):
+        winreg.SetValueEx(key, name, 0, reg_type, value)
+
+
+def delete_value(key, name):
+    with tracing.span("registry", "DeleteValue", value_name=name):
+        winreg.DeleteValue(key, name)
+
+
+class RegistryBatch:
+    """
+    Buffers writes to the values `names` of an open registry key. The values are read once, on first use, and writes
+    matching that snapshot are dropped. The remaining writes reach the registry in commit().
+    """
+
+    def __init__(self, key, names):
+        self.key = key
+        self.names = names
+        self.__snapshot = None
+        self.__pending = {}
+
+    def __load(self):
+        if self.__snapshot is None:
+            self.__snapshot = {}
+            for name in self.names:
+                try:
+                    self.__snapshot[name] = query_value(self.key, name)
+                except FileNotFoundError:
+                    pass
+        return self.__snapshot
+
+    def query(self, name):
+        """
+        Returns `(value, type)` like winreg.QueryValueEx, including writes not committed yet. Raises FileNotFoundError
+        if the value does not exist.
+        """
+        if name in self.__pending:
+            return self.__pending[name]
+        if name not in self.names:
+            return query_value(self.key, name)
+        snapshot = self.__load()
+        if name not in snapshot:
+            raise FileNotFoundError(f"Registry value {name} does not exist")
+        return snapshot[name]
+
+    def set(self, name, value):
+        """
+        Buffers a write of `value`, keeping the registry type of an existing value.
+        """
+        try:
+            current, reg_type = self.query(name)
+        except FileNotFoundError:
+            current, reg_type = None, winreg.REG_DWORD if isinstance(value, int) else winreg.REG_SZ
+        if current == value:
+            return
+        self.__pending[name] = (value, reg_type)
+
+    def commit(self):
+        """
+        Writes every buffered value which still differs from the snapshot. Returns True if anything was written.
+        """
+        if not self.__pending:
+            return False
+        snapshot = self.__load()
+        changed = False
+        for name, (value, reg_type) in self.__pending.items():
+            if snapshot.get(name, (None, None))[0] == value:
+                continue
+            set_value(self.key, name, reg_type, value)
+            snapshot[name] = (value, reg_type)
+            changed = True
+        self.__pending = {}
+        return changed